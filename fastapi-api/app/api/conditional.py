@@ -0,0 +1,102 @@
+# -*- coding:utf-8 -*-
+# @Author: H
+# @Date: 2025-10-20
+# @Version: 1.0
+# @License: H
+# @Desc: HTTP 条件请求: GET 接口的 ETag / Last-Modified 验证和按路由配置的 Cache-Control
+"""
+路由器使用 APIRouter(route_class=ConditionalRoute) 后, 其中的 GET 接口无需修改:
+    ETag           响应体的哈希(弱 ETag), 对所有返回 JSON 的 200 响应生效
+    Last-Modified  接口返回 success_response(obj) 且 obj 带有 update_time 时设置;
+                   列表接口中记录被删除不会改变剩余记录的 update_time, 因此分页响应不设置
+    Cache-Control  settings.http_cache.cache_control 中按路由模板配置, 默认 private, no-cache
+请求带 If-None-Match 时只比较 ETag, 否则比较 If-Modified-Since, 匹配时返回不带响应体的 304
+FileResponse 等已自行处理缓存头或没有完整响应体的响应不做处理
+"""
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Callable, Optional
+
+from fastapi import Request, Response
+
+from app.api.fast_response import FastResponseRoute
+from app.context import response_validators_ctx
+from app.settings import settings
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match 使用弱比较, 忽略 W/ 前缀"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    etag = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+def not_modified_since(if_modified_since: Optional[str], last_modified: datetime) -> bool:
+    if not if_modified_since:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    # HTTP 日期精确到秒
+    return last_modified.replace(microsecond=0) <= since
+
+
+def _to_utc(value: datetime) -> datetime:
+    # 数据库中的时间不带时区, 按 UTC 处理; 客户端只会原样带回, 不影响比较结果
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+
+
+class ConditionalRoute(FastResponseRoute):
+    """为 GET 接口添加 ETag / Last-Modified / Cache-Control, 条件请求匹配时返回 304, 同时支持 @trusted_response"""
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+        conf = settings.http_cache
+        if not conf.enabled or "GET" not in self.methods:
+            return handler
+        cache_control = conf.cache_control.get(self.path_format, conf.default_cache_control)
+
+        async def conditional_handler(request: Request) -> Response:
+            validators = {}
+            token = response_validators_ctx.set(validators)
+            try:
+                response = await handler(request)
+            finally:
+                response_validators_ctx.reset(token)
+            return apply_validators(request, response, validators.get("last_modified"), cache_control)
+
+        return conditional_handler
+
+
+def apply_validators(
+    request: Request, response: Response, last_modified: Optional[datetime], cache_control: str
+) -> Response:
+    body = getattr(response, "body", None)
+    if response.status_code != 200 or not isinstance(body, bytes) or "etag" in response.headers:
+        return response
+
+    headers = {"ETag": f'W/"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'}
+    if cache_control and "cache-control" not in response.headers:
+        headers["Cache-Control"] = cache_control
+    if last_modified is not None:
+        last_modified = _to_utc(last_modified)
+        headers["Last-Modified"] = format_datetime(last_modified, usegmt=True)
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        not_modified = etag_matches(if_none_match, headers["ETag"])
+    else:
+        not_modified = last_modified is not None and not_modified_since(
+            request.headers.get("if-modified-since"), last_modified
+        )
+    if not_modified:
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return response
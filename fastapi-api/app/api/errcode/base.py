@@ -50,3 +50,8 @@ class InvalidArgument(BaseErrorCode):
 
     code: int = 422
     message: str = "参数错误"
+
+
+class TooManyRequestsError(BaseErrorCode):
+    code: int = 429
+    message: str = "请求过于频繁，请稍后再试"
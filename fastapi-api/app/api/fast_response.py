@@ -0,0 +1,201 @@
+# -*- coding:utf-8 -*-
+# @Author: H
+# @Date: 2025-10-20
+# @Version: 1.0
+# @License: H
+# @Desc: 可信接口的快速序列化: 按 response_model 预编译的序列化函数, 跳过 FastAPI 的响应校验
+"""
+FastAPI 处理返回 UnifiedResponseModel 的接口时, 先 model_dump 为 dict, 再按 response_model 校验(逐条创建 ImageRead 等对象),
+然后 serialize 为可 JSON 化的 dict, 最后由 ORJSONResponse 编码, 列表接口的每条记录都要转换多次
+接口返回的是 DAO 查询结果等可信数据时, 用 @trusted_response 标记:
+
+    @router.get("/list", response_model=UnifiedResponseModel[PaginatedData[ImageRead]])
+    @trusted_response
+    async def list_images(...):
+
+路由器使用 FastResponseRoute(或其子类 ConditionalRoute)时, 接口返回值直接按 response_model 的字段取属性,
+由 orjson 编码为响应体; OpenAPI 文档仍使用 response_model, 只输出 response_model 中的字段(如 UserRead 不含密码)
+以下情况不适用, 仍需 FastAPI 校验:
+    - 数据来自请求参数等不可信来源, 或字段类型需要校验/转换(如 str -> int)
+    - 接口通过注入的 Response 设置 cookie / 响应头(如登录), 直接返回 Response 时 FastAPI 不会合并这些响应头
+带时区的 datetime 由 orjson 输出为 +00:00, 而 pydantic 输出为 Z, 数据库中的时间不带时区, 不受影响
+"""
+import functools
+import inspect
+import types
+import typing
+from decimal import Decimal
+from operator import attrgetter, itemgetter
+from typing import Any, Callable, Dict, Optional, Type
+
+import orjson
+from fastapi.routing import APIRoute
+from pydantic import BaseModel
+from starlette.responses import Response
+
+from app.settings import settings
+from app.utils.logger import logger
+
+# 模型 -> 序列化函数
+_serializers: Dict[type, Callable[[Any], Optional[dict]]] = {}
+
+
+def trusted_response(endpoint: Callable) -> Callable:
+    """标记接口返回可信数据, 跳过 response_model 校验, 需放在路由装饰器下面"""
+    endpoint.__trusted_response__ = True
+    return endpoint
+
+
+def compile_serializer(model: Type[BaseModel]) -> Callable[[Any], Optional[dict]]:
+    """
+    返回 model 的序列化函数: 按 model 的字段从对象(或 dict)中取值, 嵌套模型及其列表递归处理, 其余值由 orjson 编码
+    使用 field_serializer / model_serializer / computed_field 的模型无法只按字段取值, 退回 pydantic 校验 + 序列化
+    """
+    serializer = _serializers.get(model)
+    if serializer is not None:
+        return serializer
+
+    decorators = model.__pydantic_decorators__
+    if decorators.field_serializers or decorators.model_serializers or decorators.computed_fields:
+
+        def serializer(obj):
+            if obj is None:
+                return None
+            return model.model_validate(obj, from_attributes=True).model_dump(mode="json", by_alias=True)
+
+        _serializers[model] = serializer
+        return serializer
+
+    names, keys, defaults, nested = [], [], [], []
+
+    def serializer(obj):
+        if obj is None:
+            return None
+        if isinstance(obj, dict):
+            values = [obj.get(name) for name in names]
+        else:
+            # ORM 实例的已加载列和 pydantic 模型的字段都保存在实例 __dict__ 中, 直接取值比逐个经过
+            # SQLAlchemy 的属性描述符快得多; property、过期或未加载的列不在 __dict__ 中, 按属性读取
+            try:
+                values = from_dict(obj.__dict__)
+            except (AttributeError, KeyError):
+                try:
+                    values = from_attrs(obj)
+                except AttributeError:
+                    # 与 pydantic 的 from_attributes 一致, 对象没有的字段(如未展开的 expand 字段)使用默认值
+                    values = [getattr(obj, name, default) for name, default in zip(names, defaults)]
+        if nested:
+            values = list(values)
+            for index, convert in nested:
+                if values[index] is not None:
+                    values[index] = convert(values[index])
+        return dict(zip(keys, values))
+
+    # 先登记再解析字段, 模型引用自身时使用同一个函数
+    _serializers[model] = serializer
+    for name, field in model.model_fields.items():
+        convert = _converter(field.annotation)
+        if convert is not None:
+            nested.append((len(names), convert))
+        names.append(name)
+        keys.append(field.serialization_alias or field.alias or name)
+        # 默认值只用于输出, 不会被修改, default_factory 在编译时调用一次即可
+        defaults.append(None if field.is_required() else field.get_default(call_default_factory=True))
+    from_dict = _tuple_getter(itemgetter, names)
+    from_attrs = _tuple_getter(attrgetter, names)
+    return serializer
+
+
+def _tuple_getter(getter_class, names: list) -> Callable[[Any], tuple]:
+    """itemgetter / attrgetter 一次取出多个值(C 实现), 单个或没有字段时也返回元组"""
+    if len(names) > 1:
+        return getter_class(*names)
+    if names:
+        single = getter_class(names[0])
+        return lambda obj: (single(obj),)
+    return lambda obj: ()
+
+
+def _converter(annotation) -> Optional[Callable]:
+    """字段值需要转换时返回转换函数, orjson 可直接编码的类型返回 None"""
+    origin = typing.get_origin(annotation)
+    if origin in (typing.Union, types.UnionType):
+        args = [arg for arg in typing.get_args(annotation) if arg is not type(None)]
+        return _converter(args[0]) if len(args) == 1 else None
+    if origin in (list, set, tuple, frozenset):
+        args = typing.get_args(annotation)
+        convert = _converter(args[0]) if args else None
+        if convert is None:
+            return None
+        return lambda values: [None if value is None else convert(value) for value in values]
+    if inspect.isclass(annotation) and issubclass(annotation, BaseModel):
+        return compile_serializer(annotation)
+    return None
+
+
+def _default(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json", by_alias=True)
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+class FastResponseRoute(APIRoute):
+    """@trusted_response 接口的返回值按 response_model 预编译的序列化函数直接编码, 不经过 FastAPI 的响应校验"""
+
+    def __init__(self, path: str, endpoint: Callable, **kwargs):
+        response_model = kwargs.get("response_model")
+        if (
+            settings.fast_response.enabled
+            and getattr(endpoint, "__trusted_response__", False)
+            and inspect.isclass(response_model)
+            and issubclass(response_model, BaseModel)
+        ):
+            endpoint = _fast_endpoint(endpoint, path, response_model)
+        super().__init__(path, endpoint, **kwargs)
+
+
+def _fast_endpoint(endpoint: Callable, path: str, response_model: Type[BaseModel]) -> Callable:
+    serializer = compile_serializer(response_model)
+    verify = settings.fast_response.verify
+
+    def render(result):
+        # 接口直接返回的 Response 或其它类型的返回值仍由 FastAPI 处理
+        if not isinstance(result, BaseModel):
+            return result
+        body = dumps(serializer(result))
+        if verify:
+            _verify(path, response_model, result, body)
+        return Response(body, media_type="application/json")
+
+    # functools.wraps 保留 __wrapped__, FastAPI 按原函数的签名解析参数和依赖
+    if inspect.iscoroutinefunction(endpoint):
+
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            return render(await endpoint(*args, **kwargs))
+
+    else:
+
+        @functools.wraps(endpoint)
+        def wrapper(*args, **kwargs):
+            return render(endpoint(*args, **kwargs))
+
+    return wrapper
+
+
+def _verify(path: str, response_model: Type[BaseModel], result: BaseModel, body: bytes):
+    try:
+        expected = response_model.model_validate(result, from_attributes=True).model_dump(mode="json", by_alias=True)
+    except Exception as e:
+        logger.warning(f"trusted response failed validation: {path} {e}")
+        return
+    if orjson.loads(body) != expected:
+        logger.warning(f"trusted response differs from response_model: {path}")
@@ -4,24 +4,34 @@
 # @Version: 1.0
 # @License: H
 # @Desc:
+from datetime import datetime
 from typing import Any, Dict, Generic, List, Optional, TypeVar, Union
 
 from pydantic import BaseModel
 
+from app.context import set_last_modified
+
 # 创建泛型变量
 DataT = TypeVar("DataT")
 
 
 class PaginationInfo(BaseModel):
-    """分页信息模型"""
+    """分页信息模型
+
+    页码模式返回 page_num; 游标模式返回 next_cursor(为空表示没有下一页), page_num 为空
+    total_size 在不统计总数时为空
+    """
 
-    page_num: int
+    page_num: Optional[int] = None
     page_size: int
-    total_size: int
+    total_size: Optional[int] = None
+    next_cursor: Optional[str] = None
 
     @property
-    def total_pages(self) -> int:
+    def total_pages(self) -> Optional[int]:
         """计算总页数"""
+        if self.total_size is None:
+            return None
         if self.page_size == 0:
             return 0
         return (self.total_size + self.page_size - 1) // self.page_size
@@ -29,12 +39,14 @@ class PaginationInfo(BaseModel):
     @property
     def has_next(self) -> bool:
         """是否有下一页"""
+        if self.page_num is None or self.total_size is None:
+            return self.next_cursor is not None
         return self.page_num < self.total_pages
 
     @property
     def has_prev(self) -> bool:
         """是否有上一页"""
-        return self.page_num > 1
+        return self.page_num is not None and self.page_num > 1
 
 
 class PaginatedData(BaseModel, Generic[DataT]):
@@ -79,7 +91,10 @@ class ResponseBuilder:
 
 # 便捷的响应函数（推荐使用）
 def success_response(data: Any = None, message: str = "SUCCESS") -> UnifiedResponseModel:
-    """成功响应"""
+    """成功响应, data 带有 update_time 时作为响应的 Last-Modified"""
+    update_time = getattr(data, "update_time", None)
+    if isinstance(update_time, datetime):
+        set_last_modified(update_time)
     return ResponseBuilder.success(data, message)
 
 
@@ -89,8 +104,13 @@ def error_response(code: int = 500, message: str = "BAD REQUEST", detail: Option
 
 
 def paginated_response(
-    data: List[Any], page_num: int, page_size: int, total_size: int, message: str = "SUCCESS"
+    data: List[Any],
+    page_num: Optional[int] = None,
+    page_size: int = 0,
+    total_size: Optional[int] = None,
+    message: str = "SUCCESS",
+    next_cursor: Optional[str] = None,
 ) -> UnifiedResponseModel[PaginatedData]:
-    """分页响应"""
-    pagination = PaginationInfo(page_num=page_num, page_size=page_size, total_size=total_size)
+    """分页响应, 同时支持页码模式和游标模式"""
+    pagination = PaginationInfo(page_num=page_num, page_size=page_size, total_size=total_size, next_cursor=next_cursor)
     return ResponseBuilder.success_with_pagination(data, pagination, message)
@@ -8,10 +8,11 @@
 # Router for base api
 from fastapi import APIRouter
 
-from app.api.routers import img_router, user_router
+from app.api.routers import admin_router, img_router, user_router
 
 router = APIRouter(
     prefix="/api",
 )
 router.include_router(user_router, tags=["user"])
 router.include_router(img_router, tags=["img"])
+router.include_router(admin_router, tags=["admin"])
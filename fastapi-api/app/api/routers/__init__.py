@@ -5,5 +5,6 @@
 # @License: H
 # @Desc:
 
+from .admin import router as admin_router
 from .img import router as img_router
 from .user import router as user_router
@@ -0,0 +1,91 @@
+# -*- coding:utf-8 -*-
+# @Author: H
+# @Date: 2025-10-20
+# @Version: 1.0
+# @License: H
+# @Desc: 管理接口
+
+from typing import Optional
+
+from fastapi import APIRouter, Depends
+
+from app.api.errcode.base import InvalidArgument, UnAuthorizedError
+from app.api.fast_response import FastResponseRoute, trusted_response
+from app.api.resp import PaginatedData, UnifiedResponseModel, paginated_response, success_response
+from app.api.services.log_control import LogControlUpdate, apply_and_broadcast
+from app.api.services.user_service import expand_users, get_login_user
+from app.api.utils import parse_expand
+from app.db import async_dao
+from app.db.models.audit_log import AuditLog, AuditLogRead
+from app.db.models.user import User
+from app.db.pagination import COUNT_EXACT, CountMode
+from app.utils.logger import log_control
+
+# build router
+router = APIRouter(prefix="/admin", tags=["Admin"], route_class=FastResponseRoute)
+
+
+@router.get("/log_control", response_model=UnifiedResponseModel[dict])
+async def get_log_control(*, login_user: User = Depends(get_login_user)):
+    """处理该请求的进程当前的日志级别和采样配置"""
+    if not login_user.is_admin:
+        raise UnAuthorizedError()
+    return success_response(log_control())
+
+
+@router.put("/log_control", response_model=UnifiedResponseModel[dict])
+async def update_log_control(*, update: LogControlUpdate, login_user: User = Depends(get_login_user)):
+    """修改日志级别/采样率, 配置了 redis 时同步到所有 worker"""
+    if not login_user.is_admin:
+        raise UnAuthorizedError()
+    if update.sample_rate is not None and not 0 <= update.sample_rate <= 1:
+        raise InvalidArgument(message="sample_rate 须在 0~1 之间")
+    try:
+        current = await apply_and_broadcast(update)
+    except ValueError as e:
+        raise InvalidArgument(message=f"日志级别无效: {e}")
+    return success_response(current)
+
+
+@router.get("/audit_log", response_model=UnifiedResponseModel[PaginatedData[AuditLogRead]])
+@trusted_response
+async def list_audit_logs(
+    *,
+    operator_id: Optional[int] = None,
+    event_type: Optional[str] = None,
+    object_type: Optional[str] = None,
+    page_num: int = 1,
+    page_size: int = 20,
+    cursor: Optional[str] = None,
+    count: CountMode = COUNT_EXACT,
+    expand: Optional[str] = None,
+    login_user: User = Depends(get_login_user),
+):
+    """
+    审计日志列表, 按时间倒序
+    :param cursor: 传入时使用游标分页(第一页传空字符串), 忽略 page_num, 翻页使用返回的 next_cursor
+    :param expand: operator 时每条记录附带操作用户, 本页的操作用户通过一次查询读取
+    """
+    if not login_user.is_admin:
+        raise UnAuthorizedError()
+    expands = parse_expand(expand, {"operator"})
+
+    filters = []
+    if operator_id is not None:
+        filters.append(AuditLog.operator_id == operator_id)
+    if event_type:
+        filters.append(AuditLog.event_type == event_type)
+    if object_type:
+        filters.append(AuditLog.object_type == object_type)
+
+    order_by = [AuditLog.create_time.desc()]
+    if cursor is not None:
+        data, page = await async_dao.select_cursor_page(
+            AuditLog, *filters, cursor=cursor, page_size=page_size, order_by=order_by, count=count
+        )
+    else:
+        data, page = await async_dao.select_page(AuditLog, page_num, page_size, *filters, order_by=order_by, count=count)
+
+    if "operator" in expands:
+        data = await expand_users(data, "operator_id", "operator")
+    return paginated_response(data, **page)
@@ -5,52 +5,111 @@
 # @License: H
 # @Desc: 图片管理路由
 
+import os
+from io import BytesIO
 from typing import Optional
 
-from fastapi import APIRouter, Depends, Request
+from fastapi import APIRouter, Depends, File, Form, Query, Request, UploadFile
+from fastapi.responses import FileResponse, Response
+from fastapi_jwt_auth import AuthJWT
+from PIL import Image as PILImage
 
-from app.api.errcode.base import ApiError
-from app.api.resp import UnifiedResponseModel, error_response, success_response
+from app.api.conditional import ConditionalRoute, etag_matches
+from app.api.errcode.base import ApiError, InvalidArgument, UnAuthorizedError
+from app.api.fast_response import trusted_response
+from app.api.resp import PaginatedData, UnifiedResponseModel, error_response, paginated_response, success_response
 from app.api.services.cos_service import cos_service
-from app.api.services.user_service import get_login_user
-from app.db import dao
-from app.db.models.img import Image, ImageCreate, ImageQuery, ImageRead, ImageUpdate
+from app.api.services.image_service import release_objects, store_image
+from app.api.services.render_service import RenderParams, render_service
+from app.api.services.storage import LocalStorage
+from app.api.services.user_service import expand_users, get_login_user
+from app.api.utils import parse_expand
+from app.db import async_dao
+from app.db.pagination import COUNT_EXACT, CountMode
+from app.db.models.img import Image, ImageCreate, ImageListItem, ImageQuery, ImageRead, ImageUpdate
 from app.db.models.user import User
+from app.settings import settings
 from app.utils.logger import logger
 
 # 创建路由
-router = APIRouter(prefix="/img", tags=["Image"])
+router = APIRouter(prefix="/img", tags=["Image"], route_class=ConditionalRoute)
 
 
 @router.post("/upload", response_model=UnifiedResponseModel[ImageRead])
+@trusted_response
 async def upload_image(*, request: Request, image_data: ImageCreate, login_user: User = Depends(get_login_user)):
     """
     上传图片到腾讯云COS并记录到数据库
     """
     try:
-        # 上传到腾讯云COS
-        upload_result = cos_service.upload_base64_image(
-            base64_data=image_data.file_data, file_name=image_data.file_name
-        )
+        # 上传到腾讯云COS, 相同内容的图片复用已有的COS对象
+        image_bytes = await cos_service.async_decode_base64_image(image_data.file_data)
+
+        def make_record(upload_result: dict) -> Image:
+            return Image(
+                file_name=image_data.file_name,
+                file_size=upload_result["file_size"],
+                file_type=image_data.file_type,
+                cos_url=upload_result["cos_url"],
+                cos_key=upload_result["cos_key"],
+                bucket=upload_result["bucket"],
+                md5=upload_result["md5"],
+                width=upload_result["width"],
+                height=upload_result["height"],
+                uploader_id=login_user.id,
+                status=1,
+                remark=image_data.remark,
+            )
+
+        # 创建并保存数据库记录
+        db_image = await store_image(BytesIO(image_bytes), image_data.file_name, make_record, image_data.file_type)
 
-        # 创建数据库记录
-        db_image = Image(
-            file_name=image_data.file_name,
-            file_size=upload_result["file_size"],
-            file_type=image_data.file_type,
-            cos_url=upload_result["cos_url"],
-            cos_key=upload_result["cos_key"],
-            bucket=upload_result["bucket"],
-            md5=upload_result["md5"],
-            width=upload_result["width"],
-            height=upload_result["height"],
-            uploader_id=login_user.id,
-            status=1,
-            remark=image_data.remark,
-        )
+        logger.info(f"用户 {login_user.user_name} 上传图片成功: {db_image.file_name}")
+
+        return success_response(db_image)
+
+    except ValueError as e:
+        raise ApiError(message=str(e))
+    except Exception as e:
+        logger.error(f"上传图片失败: {e}")
+        raise ApiError(message="上传图片失败，请稍后重试")
 
-        # 保存到数据库
-        dao.insert(db_image)
+
+@router.post("/upload_file", response_model=UnifiedResponseModel[ImageRead])
+@trusted_response
+async def upload_image_file(
+    *,
+    file: UploadFile = File(..., description="图片文件"),
+    remark: Optional[str] = Form(default=None, description="备注"),
+    login_user: User = Depends(get_login_user),
+):
+    """
+    以 multipart/form-data 方式上传图片, 分片流式写入COS, 不经过base64编解码
+    """
+    if file.content_type and not file.content_type.startswith("image/"):
+        raise ApiError(message="仅支持上传图片文件")
+    if not file.filename or len(file.filename) > 255:
+        raise ApiError(message="文件名不能为空且长度不能超过255")
+
+    try:
+
+        def make_record(upload_result: dict) -> Image:
+            return Image(
+                file_name=file.filename,
+                file_size=upload_result["file_size"],
+                file_type=upload_result["content_type"],
+                cos_url=upload_result["cos_url"],
+                cos_key=upload_result["cos_key"],
+                bucket=upload_result["bucket"],
+                md5=upload_result["md5"],
+                width=upload_result["width"],
+                height=upload_result["height"],
+                uploader_id=login_user.id,
+                status=1,
+                remark=remark,
+            )
+
+        db_image = await store_image(file.file, file.filename, make_record, content_type=file.content_type)
 
         logger.info(f"用户 {login_user.user_name} 上传图片成功: {db_image.file_name}")
 
@@ -61,9 +120,12 @@ async def upload_image(*, request: Request, image_data: ImageCreate, login_user:
     except Exception as e:
         logger.error(f"上传图片失败: {e}")
         raise ApiError(message="上传图片失败，请稍后重试")
+    finally:
+        await file.close()
 
 
-@router.get("/list", response_model=UnifiedResponseModel)
+@router.get("/list", response_model=UnifiedResponseModel[PaginatedData[ImageListItem]])
+@trusted_response
 async def list_images(
     *,
     file_name: Optional[str] = None,
@@ -71,11 +133,19 @@ async def list_images(
     status: Optional[int] = None,
     page_num: int = 1,
     page_size: int = 10,
+    cursor: Optional[str] = None,
+    count: CountMode = COUNT_EXACT,
+    expand: Optional[str] = None,
     login_user: User = Depends(get_login_user),
 ):
     """
     获取图片列表（分页）
+    :param cursor: 传入时使用游标分页(第一页传空字符串), 忽略 page_num, 翻页使用返回的 next_cursor
+    :param count: 总数统计方式 exact/estimated/none
+    :param expand: uploader 时每条记录附带上传者, 本页的上传者通过一次查询读取
     """
+    expands = parse_expand(expand, {"uploader"})
+
     filters = []
 
     if file_name:
@@ -91,17 +161,27 @@ async def list_images(
     if not login_user.is_admin:
         filters.append(Image.uploader_id == login_user.id)
 
-    data, page = dao.select_page(Image, page_num, page_size, *filters, order_by=[Image.id.desc()])
+    if cursor is not None:
+        data, page = await async_dao.select_cursor_page(
+            Image, *filters, cursor=cursor, page_size=page_size, order_by=[Image.id.desc()], count=count
+        )
+    else:
+        data, page = await async_dao.select_page(
+            Image, page_num, page_size, *filters, order_by=[Image.id.desc()], count=count
+        )
 
-    return success_response(data=data, page=page)
+    if "uploader" in expands:
+        data = await expand_users(data, "uploader_id", "uploader")
+    return paginated_response(data, **page)
 
 
 @router.get("/detail/{image_id}", response_model=UnifiedResponseModel[ImageRead])
+@trusted_response
 async def get_image_detail(*, image_id: int, login_user: User = Depends(get_login_user)):
     """
     获取图片详情
     """
-    db_image = dao.select_one(Image, Image.id == image_id)
+    db_image = await async_dao.select_one(Image, Image.id == image_id)
 
     if not db_image:
         raise ApiError(message="图片不存在")
@@ -113,12 +193,89 @@ async def get_image_detail(*, image_id: int, login_user: User = Depends(get_logi
     return success_response(db_image)
 
 
+@router.get("/file/{key:path}")
+async def get_image_file(*, key: str, expires: Optional[int] = None, signature: Optional[str] = None):
+    """
+    读取本地存储的图片文件, 仅 local 存储后端可用
+    FileResponse 由服务器直接从文件发送(支持 http.response.pathsend 时零拷贝), 不经过应用内存
+    """
+    storage = cos_service.storage
+    if not isinstance(storage, LocalStorage):
+        raise ApiError(message="当前存储后端不支持读取文件")
+    if not storage.public and not storage.verify(key, expires, signature):
+        raise UnAuthorizedError(message="访问链接无效或已过期")
+
+    try:
+        path = storage.local_path(key)
+    except ValueError:
+        raise ApiError(message="图片不存在")
+    if not os.path.isfile(path):
+        raise ApiError(message="图片不存在")
+
+    # key 中包含随机文件名, 内容不会变化, 可以长期缓存
+    return FileResponse(
+        path,
+        media_type=cos_service._get_content_type(key),
+        headers={"Cache-Control": "public, max-age=31536000, immutable"},
+    )
+
+
+@router.get("/render/{image_id}")
+async def render_image(
+    *,
+    request: Request,
+    image_id: int,
+    w: Optional[int] = Query(default=None, description="最大宽度"),
+    h: Optional[int] = Query(default=None, description="最大高度"),
+    fmt: str = Query(default="webp", description="输出格式: webp / jpeg / png"),
+    q: int = Query(default=80, description="webp / jpeg 质量 1~100"),
+    authorize: AuthJWT = Depends(),
+):
+    """
+    按需缩放/转码图片, 按比例缩小到 w x h 以内(不放大), 结果缓存在本地磁盘
+    ETag 由原图 md5 和参数决定, If-None-Match 匹配时返回 304, 不读取存储
+    存储不公开(storage.public=false)时需要登录, 非管理员只能访问自己上传的图片
+    """
+    try:
+        params = RenderParams.create(w, h, fmt, q, settings.render.max_size)
+    except ValueError as e:
+        raise InvalidArgument(message=str(e))
+
+    db_image = await async_dao.select_one(Image, Image.id == image_id)
+    if not db_image or db_image.status != 1:
+        raise ApiError(message="图片不存在")
+    if not settings.storage.public:
+        login_user = await get_login_user(authorize)
+        if not login_user.is_admin and db_image.uploader_id != login_user.id:
+            raise ApiError(message="无权限查看此图片")
+
+    etag = params.etag(db_image.md5)
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={settings.render.cache_max_age}"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    try:
+        path = await render_service.render(db_image, params)
+    except ValueError as e:
+        raise ApiError(message=str(e))
+    except (PILImage.DecompressionBombError, PILImage.UnidentifiedImageError) as e:
+        logger.warning(f"图片无法处理: image_id={image_id}, {e}")
+        raise ApiError(message="图片无法处理")
+    except Exception as e:
+        logger.error(f"图片处理失败: image_id={image_id}, {e}")
+        raise ApiError(message="图片处理失败，请稍后重试")
+
+    # 缓存文件由服务器直接发送(支持 http.response.pathsend 时零拷贝)
+    return FileResponse(path, media_type=params.media_type, headers=headers)
+
+
 @router.put("/update", response_model=UnifiedResponseModel[ImageRead])
+@trusted_response
 async def update_image(*, image_update: ImageUpdate, login_user: User = Depends(get_login_user)):
     """
     更新图片信息（仅支持更新文件名、备注、状态）
     """
-    db_image = dao.select_one(Image, Image.id == image_update.id)
+    db_image = await async_dao.select_one_fresh(Image, Image.id == image_update.id)
 
     if not db_image:
         raise ApiError(message="图片不存在")
@@ -137,7 +294,7 @@ async def update_image(*, image_update: ImageUpdate, login_user: User = Depends(
     if image_update.status is not None and login_user.is_admin:
         db_image.status = image_update.status
 
-    dao.update(Image, db_image)
+    await async_dao.update(Image, db_image)
 
     logger.info(f"用户 {login_user.user_name} 更新图片信息: {db_image.id}")
 
@@ -151,7 +308,7 @@ async def delete_image(*, image_id: int, permanent: bool = False, login_user: Us
     :param image_id: 图片ID
     :param permanent: 是否永久删除（同时删除COS文件），默认只标记删除
     """
-    db_image = dao.select_one(Image, Image.id == image_id)
+    db_image = await async_dao.select_one_fresh(Image, Image.id == image_id)
 
     if not db_image:
         raise ApiError(message="图片不存在")
@@ -161,19 +318,17 @@ async def delete_image(*, image_id: int, permanent: bool = False, login_user: Us
         raise ApiError(message="无权限删除此图片")
 
     if permanent:
-        # 永久删除：从COS删除文件并删除数据库记录
-        try:
-            cos_service.delete_image(db_image.cos_key)
-        except Exception as e:
-            logger.warning(f"删除COS文件失败: {e}")
-
-        dao.delete(Image, Image.id == image_id)
+        # 永久删除：删除数据库记录, COS文件没有其它图片引用时一并删除
+        await async_dao.delete(Image, Image.id == image_id)
+        failed_keys = await release_objects([db_image.cos_key])
+        if failed_keys:
+            logger.warning(f"删除COS文件失败: {failed_keys}")
         logger.info(f"用户 {login_user.user_name} 永久删除图片: {image_id}")
         return success_response(message="图片已永久删除")
     else:
         # 标记删除
         db_image.status = 0
-        dao.update(Image, db_image)
+        await async_dao.update(Image, db_image)
         logger.info(f"用户 {login_user.user_name} 标记删除图片: {image_id}")
         return success_response(message="图片已删除")
 
@@ -183,42 +338,43 @@ async def batch_delete_images(
     *, image_ids: list[int], permanent: bool = False, login_user: User = Depends(get_login_user)
 ):
     """
-    批量删除图片
+    批量删除图片, 一次查询 + 一次批量更新/删除, 永久删除时再查一次引用, COS文件通过批量删除接口并发删除
+    返回每个图片ID的删除结果
     """
     if not image_ids:
         raise ApiError(message="请选择要删除的图片")
 
-    success_count = 0
-    fail_count = 0
-
+    image_ids = list(dict.fromkeys(image_ids))
+    filters = [Image.id.in_(image_ids)]
+    # 非管理员只能删除自己上传的图片
+    if not login_user.is_admin:
+        filters.append(Image.uploader_id == login_user.id)
+    db_images = {image.id: image for image in await async_dao.select_all(Image, *filters)}
+    found_ids = list(db_images)
+
+    cos_failed = set()
+    if found_ids:
+        if permanent:
+            # 先删记录, 再删除已无引用的COS文件
+            await async_dao.delete(Image, Image.id.in_(found_ids))
+            cos_failed = set(await release_objects([image.cos_key for image in db_images.values()]))
+        else:
+            await async_dao.update_where(Image, {"status": 0}, Image.id.in_(found_ids))
+
+    results = []
     for image_id in image_ids:
-        try:
-            db_image = dao.select_one(Image, Image.id == image_id)
-
-            if not db_image:
-                fail_count += 1
-                continue
-
-            # 非管理员只能删除自己上传的图片
-            if not login_user.is_admin and db_image.uploader_id != login_user.id:
-                fail_count += 1
-                continue
-
-            if permanent:
-                try:
-                    cos_service.delete_image(db_image.cos_key)
-                except Exception as e:
-                    logger.warning(f"删除COS文件失败: {e}")
-
-                dao.delete(Image, Image.id == image_id)
-            else:
-                db_image.status = 0
-                dao.update(Image, db_image)
-
-            success_count += 1
-
-        except Exception as e:
-            logger.error(f"删除图片 {image_id} 失败: {e}")
-            fail_count += 1
-
-    return success_response(message=f"成功删除 {success_count} 张图片，失败 {fail_count} 张")
+        db_image = db_images.get(image_id)
+        if not db_image:
+            results.append({"id": image_id, "success": False, "message": "图片不存在或无权限删除"})
+        elif db_image.cos_key in cos_failed:
+            results.append({"id": image_id, "success": True, "message": "记录已删除, COS文件删除失败"})
+        else:
+            results.append({"id": image_id, "success": True, "message": "删除成功"})
+
+    success_count = len(found_ids)
+    fail_count = len(image_ids) - success_count
+    logger.info(f"用户 {login_user.user_name} 批量删除图片: 成功 {success_count}, 失败 {fail_count}, permanent={permanent}")
+    return success_response(
+        data={"success_count": success_count, "fail_count": fail_count, "results": results},
+        message=f"成功删除 {success_count} 张图片，失败 {fail_count} 张",
+    )
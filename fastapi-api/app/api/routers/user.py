@@ -4,21 +4,25 @@ from typing import Optional
 from fastapi import APIRouter, Depends, Request
 from fastapi_jwt_auth import AuthJWT
 
+from app.api.conditional import ConditionalRoute
 from app.api.errcode.base import ApiError
 from app.api.errcode.user import UserValidateError
-from app.api.resp import UnifiedResponseModel, error_response, success_response
+from app.api.fast_response import trusted_response
+from app.api.resp import PaginatedData, UnifiedResponseModel, error_response, paginated_response, success_response
 from app.api.services.audit_log import AuditLogService
 from app.api.services.captcha import verify_captcha
-from app.api.services.user_service import gen_user_jwt, get_login_user
+from app.api.services.user_service import gen_user_jwt, get_login_user, invalidate_login_user
 from app.api.utils import get_request_ip, random_str
-from app.db import dao
+from app.db import async_dao
+from app.db.pagination import COUNT_EXACT, CountMode
 from app.db.models.user import AdminRole, DefaultRole, User, UserCreate, UserLogin, UserLoginRead, UserRead, UserUpdate
 
 # build router
-router = APIRouter(prefix="/user", tags=["User"])
+router = APIRouter(prefix="/user", tags=["User"], route_class=ConditionalRoute)
 
 
 @router.post("/regist", response_model=UnifiedResponseModel[UserRead])
+@trusted_response
 async def regist(*, request: Request, user: UserCreate):
     # 验证码校验
     if False:
@@ -28,11 +32,11 @@ async def regist(*, request: Request, user: UserCreate):
     db_user = User.model_validate(user)
 
     # check if user already exist
-    user_exists = dao.select_one(User, *[User.user_name == db_user.user_name])
+    user_exists = await async_dao.select_one(User, *[User.user_name == db_user.user_name])
     if user_exists:
         raise ApiError(message="用户名已存在")
 
-    user_exists = dao.select_one(User, *[User.phone_number == db_user.phone_number])
+    user_exists = await async_dao.select_one(User, *[User.phone_number == db_user.phone_number])
     if user_exists:
         raise ApiError(message="手机号码已存在")
 
@@ -41,15 +45,15 @@ async def regist(*, request: Request, user: UserCreate):
     db_user.password = User.encrypt_password(db_user.password, salt)
 
     # 判断下admin用户是否存在
-    admin = dao.select_one(User, *[User.id == 1])
+    admin = await async_dao.select_one(User, *[User.id == 1])
     if admin:
         db_user.role = DefaultRole
     else:
         db_user.id = 1
         db_user.role = AdminRole
-    dao.insert(db_user)
+    await async_dao.insert(db_user)
 
-    AuditLogService.insert_user(db_user, get_request_ip(request))
+    await AuditLogService.insert_user(db_user, get_request_ip(request))
 
     return success_response(db_user)
 
@@ -61,7 +65,7 @@ async def login(*, request: Request, user: UserLogin, Authorize: AuthJWT = Depen
     #     if not user.captcha_key or not await verify_captcha(user.captcha, user.captcha_key):
     #         raise ApiError(message='验证码错误')
 
-    db_user = dao.select_one(User, *[User.phone_number == user.phone_number])
+    db_user = await async_dao.select_one(User, *[User.phone_number == user.phone_number])
     # 检查密码
     if not db_user or (db_user.password != User.encrypt_password(user.password, db_user.salt)):
         return UserValidateError()
@@ -81,15 +85,17 @@ async def login(*, request: Request, user: UserLogin, Authorize: AuthJWT = Depen
 
     # 更新token
     db_user.last_login_time = datetime.now()
-    dao.update(User, db_user)
+    await async_dao.update(User, db_user)
+    await invalidate_login_user(db_user.id)
 
     # 记录审计日志
-    AuditLogService.user_login(db_user, get_request_ip(request))
+    await AuditLogService.user_login(db_user, get_request_ip(request))
 
     return success_response(db_user)
 
 
 @router.get("/info", response_model=UnifiedResponseModel[UserRead])
+@trusted_response
 async def get_info(login_user: User = Depends(get_login_user)):
     # check if user already exist
     return success_response(login_user)
@@ -99,43 +105,56 @@ async def get_info(login_user: User = Depends(get_login_user)):
 async def logout(Authorize: AuthJWT = Depends(), login_user: User = Depends(get_login_user)):
     Authorize.jwt_required()
     Authorize.unset_jwt_cookies()
-    login_user.current_token = ""
-    dao.update(User, login_user)
+    # login_user 可能来自登录用户缓存, 只清空 token, 不能把缓存中的整行写回数据库
+    await async_dao.update_where(User, {"current_token": ""}, User.id == login_user.id)
+    await invalidate_login_user(login_user.id)
     return success_response()
 
 
-@router.get("/list", response_model=UnifiedResponseModel[UserRead])
+@router.get("/list", response_model=UnifiedResponseModel[PaginatedData[UserRead]])
+@trusted_response
 async def list_user(
     *,
     name: Optional[str] = None,
     page_num: Optional[int] = 1,
     page_size: Optional[int] = 10,
+    cursor: Optional[str] = None,
+    count: CountMode = COUNT_EXACT,
     login_user: User = Depends(get_login_user),
 ):
     if login_user.is_admin:
         filters = []
         if name:
             filters.append(User.user_name.like(f"%{name}%"))
-        data, page = dao.select_page(User, page_num, page_size, *filters, order_by=[User.id.desc()])
-
-        return success_response(data=data, page=page)
+        # 传入 cursor 时使用游标分页(第一页传空字符串)
+        if cursor is not None:
+            data, page = await async_dao.select_cursor_page(
+                User, *filters, cursor=cursor, page_size=page_size, order_by=[User.id.desc()], count=count
+            )
+        else:
+            data, page = await async_dao.select_page(
+                User, page_num, page_size, *filters, order_by=[User.id.desc()], count=count
+            )
+
+        return paginated_response(data, **page)
     else:
         return error_response(message="用户没有权限")
 
 
 @router.put("/update", response_model=UnifiedResponseModel[UserRead])
+@trusted_response
 async def update(*, request: Request, user: UserUpdate, login_user: User = Depends(get_login_user)):
     if not login_user.is_admin and user.id != login_user.id:
         raise ApiError(message="无修改权限")
 
-    update_user = dao.select_one(User, User.id == user.id)
+    update_user = await async_dao.select_one_fresh(User, User.id == user.id)
     if not update_user:
         raise ApiError(message="用户不存在")
 
     if user.id != login_user.id:
-        AuditLogService.update_user(update_user, get_request_ip(request), "管理员修改账户信息")
+        await AuditLogService.update_user(update_user, get_request_ip(request), "管理员修改账户信息")
     else:
-        AuditLogService.update_user(update_user, get_request_ip(request), "修改账户")
+        await AuditLogService.update_user(update_user, get_request_ip(request), "修改账户")
 
     salt = random_str(10, digits=True)
     if not login_user.is_admin:
@@ -144,7 +163,7 @@ async def update(*, request: Request, user: UserUpdate, login_user: User = Depen
         if user.password:
             update_user.salt = salt
             update_user.password = User.encrypt_password(user.password, salt)
-        dao.update(User, update_user)
+        await async_dao.update(User, update_user)
     else:
         if user.user_name:
             update_user.user_name = user.user_name
@@ -153,7 +172,8 @@ async def update(*, request: Request, user: UserUpdate, login_user: User = Depen
             update_user.password = User.encrypt_password(user.password, salt)
         if user.delete is not None:
             update_user.delete = user.delete
-        dao.update(User, update_user)
+        await async_dao.update(User, update_user)
+    await invalidate_login_user(update_user.id)
 
     return success_response(update_user)
 
@@ -5,11 +5,11 @@
 # @License: H
 # @Desc:
 
-from typing import Any, List
+from typing import Any, List, Optional
 from uuid import UUID
 
 from app.api.resp import success_response
-from app.db.dao import insert
+from app.api.services.audit_sink import audit_log_sink
 from app.db.models.audit_log import AuditLog, AuditLogDao, EventType, ObjectType, SystemId
 from app.db.models.user import User
 from app.utils.logger import logger
@@ -17,13 +17,13 @@ from app.utils.logger import logger
 
 class AuditLogService:
     @classmethod
-    def _system_log(
+    async def _system_log(
         cls,
         user: User,
         ip_address: str,
         event_type: EventType,
         object_type: ObjectType,
-        object_id: str,
+        object_id: Optional[int],
         object_name: str,
         note: str = "",
     ):
@@ -38,30 +38,31 @@ class AuditLogService:
             ip_address=ip_address,
             note=note,
         )
-        insert(audit_log)
+        # 入队后由后台线程批量写库
+        await audit_log_sink.aput(audit_log)
 
     @classmethod
-    def insert_user(cls, user: User, ip_address: str, note: str = "新建用户"):
+    async def insert_user(cls, user: User, ip_address: str, note: str = "新建用户"):
         """
         修改用户的
         """
         logger.info(f"act=update_system_user user={user.user_name} ip={ip_address} user_id={user.id} note={note}")
-        cls._system_log(
-            user, ip_address, EventType.USER_CREATE, ObjectType.USER_CONF, str(user.id), user.user_name, note
+        await cls._system_log(
+            user, ip_address, EventType.USER_CREATE, ObjectType.USER_CONF, user.id, user.user_name, note
         )
 
     @classmethod
-    def update_user(cls, user: User, ip_address: str, note: str):
+    async def update_user(cls, user: User, ip_address: str, note: str):
         """
         修改用户的
         """
         logger.info(f"act=update_system_user user={user.user_name} ip={ip_address} user_id={user.id} note={note}")
-        cls._system_log(
-            user, ip_address, EventType.UPDATE_USER, ObjectType.USER_CONF, str(user.id), user.user_name, note
+        await cls._system_log(
+            user, ip_address, EventType.UPDATE_USER, ObjectType.USER_CONF, user.id, user.user_name, note
         )
 
     @classmethod
-    def user_login(cls, user: User, ip_address: str):
+    async def user_login(cls, user: User, ip_address: str):
         logger.info(f"act=user_login user={user.user_name} ip={ip_address} user_id={user.id}")
         # 获取用户所属的分组
-        cls._system_log(user, ip_address, EventType.USER_LOGIN, ObjectType.NONE, "", "")
+        await cls._system_log(user, ip_address, EventType.USER_LOGIN, ObjectType.NONE, None, "")
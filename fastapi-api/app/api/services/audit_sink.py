@@ -0,0 +1,225 @@
+# -*- coding:utf-8 -*-
+# @Author: H
+# @Date: 2025-10-20
+# @Version: 1.0
+# @License: H
+# @Desc: 审计日志后台批量写入
+
+import asyncio
+import os
+import queue
+import threading
+import time
+from typing import List
+
+import orjson
+
+from app.db.dao import insert
+from app.db.models.audit_log import AuditLog, AuditLogDao
+from app.settings import AuditLogConfig, settings
+from app.utils.logger import logger
+from app.utils.metrics import AUDIT_LOG_FLUSH_SECONDS, AUDIT_LOG_LOST, AUDIT_LOG_QUEUE_DEPTH, metrics_enabled
+
+POLICY_BLOCK = "block"
+POLICY_DROP_OLDEST = "drop_oldest"
+POLICY_SPILL = "spill"
+
+
+class AuditLogSink:
+    """
+    审计日志后台写入器: 请求内只入队, 后台线程按条数或时间间隔批量写库
+
+    队列满时按 policy 处理:
+        block: 等待最多 block_timeout 秒, 仍然满则丢弃; 事件循环中通过 aput 在线程池中等待, 不阻塞事件循环
+        drop_oldest: 丢弃队列中最早的一条
+        spill: 写入本地 spill_path 文件(jsonl), 可事后补录
+    """
+
+    def __init__(self, conf: AuditLogConfig):
+        self.conf = conf
+        self._queue: "queue.Queue[AuditLog]" = queue.Queue(maxsize=conf.max_queue_size)
+        self._stop_event = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._spill_lock = threading.Lock()
+        # 同时发布到 /metrics: 队列深度、写库耗时、丢弃/落盘条数
+        self._metrics_enabled = metrics_enabled()
+        self._stats = {
+            "enqueued": 0,
+            "flushed": 0,
+            "dropped": 0,
+            "spilled": 0,
+            "failed": 0,
+            "flush_count": 0,
+            "last_flush_ms": 0.0,
+            "max_flush_ms": 0.0,
+            "total_flush_ms": 0.0,
+        }
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running or not self.conf.async_write:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="audit-log-sink", daemon=True)
+        self._thread.start()
+        logger.info(f"audit log sink started, policy={self.conf.policy} batch_size={self.conf.batch_size}")
+
+    def stop(self, timeout: float = 10):
+        """停止后台线程, 并写完队列中剩余的日志"""
+        if not self.running:
+            return
+        self._stop_event.set()
+        self._thread.join(timeout)
+        self._thread = None
+        # 线程超时退出时, 剩余的在当前线程写完
+        self._flush(self._drain())
+        logger.info(f"audit log sink stopped, metrics={self.metrics()}")
+
+    async def aput(self, audit_log: AuditLog):
+        """
+        在事件循环中入队, 不阻塞事件循环: 队列未满时直接入队, drop_oldest 在当前线程处理;
+        未启动时的同步写库、block 策略的等待、spill 写文件都可能阻塞, 放到线程池执行
+        """
+        if self.running:
+            if self._offer(audit_log):
+                return
+            if self.conf.policy == POLICY_DROP_OLDEST:
+                self._overflow(audit_log)
+                return
+        await asyncio.to_thread(self.put, audit_log)
+
+    def put(self, audit_log: AuditLog):
+        """同步入队, 供脚本和线程中调用, 事件循环中使用 aput; block 策略下队列满时会阻塞调用线程"""
+        # 未启动(如脚本中直接调用)时同步写入
+        if not self.running:
+            insert(audit_log)
+            return
+
+        if self.conf.policy == POLICY_BLOCK:
+            try:
+                self._queue.put(audit_log, timeout=self.conf.block_timeout)
+                self._stats["enqueued"] += 1
+                self._observe_depth()
+            except queue.Full:
+                self._drop(audit_log)
+            return
+        if not self._offer(audit_log):
+            self._overflow(audit_log)
+
+    def metrics(self) -> dict:
+        stats = dict(self._stats)
+        stats["queue_depth"] = self._queue.qsize()
+        stats["queue_capacity"] = self.conf.max_queue_size
+        stats["avg_flush_ms"] = round(stats["total_flush_ms"] / stats["flush_count"], 3) if stats["flush_count"] else 0.0
+        return stats
+
+    def _offer(self, audit_log: AuditLog) -> bool:
+        try:
+            self._queue.put_nowait(audit_log)
+        except queue.Full:
+            return False
+        self._stats["enqueued"] += 1
+        self._observe_depth()
+        return True
+
+    def _overflow(self, audit_log: AuditLog):
+        """队列满时按 drop_oldest / spill 策略处理, 其它策略丢弃"""
+        policy = self.conf.policy
+        if policy == POLICY_DROP_OLDEST:
+            try:
+                self._queue.get_nowait()
+                self._count_lost("dropped")
+            except queue.Empty:
+                pass
+            if not self._offer(audit_log):
+                self._count_lost("dropped")
+        elif policy == POLICY_SPILL:
+            self._spill([audit_log])
+        else:
+            self._drop(audit_log)
+
+    def _drop(self, audit_log: AuditLog):
+        self._count_lost("dropped")
+        logger.error(f"audit log queue full, drop log: {audit_log.event_type} operator={audit_log.operator_id}")
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            batch = self._collect()
+            if batch:
+                self._flush(batch)
+
+    def _collect(self) -> List[AuditLog]:
+        """等待第一条日志, 然后在 flush_interval 内尽量攒够 batch_size 条"""
+        try:
+            batch = [self._queue.get(timeout=self.conf.flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.conf.flush_interval
+        while len(batch) < self.conf.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self._stop_event.is_set():
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _drain(self) -> List[AuditLog]:
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                return batch
+
+    def _flush(self, batch: List[AuditLog]):
+        self._observe_depth()
+        for start in range(0, len(batch), self.conf.batch_size):
+            chunk = batch[start : start + self.conf.batch_size]
+            begin = time.perf_counter()
+            status = "error"
+            try:
+                AuditLogDao.insert_audit_logs(chunk)
+                self._stats["flushed"] += len(chunk)
+                status = "ok"
+            except Exception as e:
+                self._stats["failed"] += len(chunk)
+                logger.error(f"audit log flush failed, spill {len(chunk)} logs: {e}")
+                self._spill(chunk)
+            cost = (time.perf_counter() - begin) * 1000
+            if self._metrics_enabled:
+                AUDIT_LOG_FLUSH_SECONDS.labels(status).observe(cost / 1000)
+            self._stats["flush_count"] += 1
+            self._stats["last_flush_ms"] = round(cost, 3)
+            self._stats["total_flush_ms"] += cost
+            self._stats["max_flush_ms"] = max(self._stats["max_flush_ms"], round(cost, 3))
+
+    def _spill(self, audit_logs: List[AuditLog]):
+        path = self.conf.spill_path
+        try:
+            with self._spill_lock:
+                os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+                with open(path, "ab") as f:
+                    for one in audit_logs:
+                        f.write(orjson.dumps(one.model_dump()) + b"\n")
+            self._count_lost("spilled", len(audit_logs))
+        except Exception as e:
+            self._count_lost("dropped", len(audit_logs))
+            logger.error(f"audit log spill failed, drop {len(audit_logs)} logs: {e}")
+
+    def _count_lost(self, outcome: str, count: int = 1):
+        """dropped: 丢弃; spilled: 写入 spill 文件待补录"""
+        self._stats[outcome] += count
+        if self._metrics_enabled:
+            AUDIT_LOG_LOST.labels(outcome).inc(count)
+
+    def _observe_depth(self):
+        if self._metrics_enabled:
+            AUDIT_LOG_QUEUE_DEPTH.set(self._queue.qsize())
+
+
+audit_log_sink = AuditLogSink(settings.audit_log)
@@ -1,11 +1,11 @@
-from app.cache.redis import redis_client
+from app.cache.redis import async_redis_client
 
 
 async def verify_captcha(captcha: str, captcha_key: str):
     # check captcha
-    captcha_value = redis_client.get(captcha_key)
+    captcha_value = await async_redis_client.get(captcha_key)
     if captcha_value:
-        redis_client.delete(captcha_key)
+        await async_redis_client.delete(captcha_key)
         return captcha_value.lower() == captcha.lower()
     else:
         return False
@@ -3,41 +3,150 @@
 # @Date: 2025-10-02
 # @Version: 1.0
 # @License: H
-# @Desc: 腾讯云COS对象存储服务
+# @Desc: 对象存储服务, 具体存储由 app.api.services.storage 中的后端实现
 
+import asyncio
 import base64
+import contextvars
+import functools
 import hashlib
 import os
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from io import BytesIO
-from typing import Optional, Tuple
+from typing import Any, BinaryIO, Callable, List, Optional, Tuple
 
 from PIL import Image as PILImage
-from qcloud_cos import CosConfig, CosS3Client
+from PIL import ImageFile
 
+from app.api.services.storage import StorageBackend, create_storage
+from app.constants import COS_BATCH_DELETE_SIZE, IMAGE_HEADER_SNIFF_SIZE, UPLOAD_CHUNK_SIZE
 from app.settings import settings
 from app.utils.logger import logger
+from app.utils.tracing import KIND_CLIENT, span
 
 
 class COSService:
-    """腾讯云COS对象存储服务"""
+    """对象存储服务: 图片处理 + 存储后端 + 线程池异步门面"""
 
     def __init__(self):
-        # 从配置文件读取腾讯云COS配置
-        self.secret_id = settings.cos.secret_id
-        self.secret_key = settings.cos.secret_key
-        self.region = settings.cos.region
-        self.bucket = settings.cos.bucket
-        self.domain = settings.cos.domain
-
-        if not all([self.secret_id, self.secret_key, self.bucket]):
-            logger.warning("腾讯云COS配置不完整，请检查配置文件")
-            self.client = None
+        # 存储后端由 settings.storage.backend 选择, 默认腾讯云COS
+        self.storage: StorageBackend = create_storage()
+        self.bucket = self.storage.bucket
+
+        # 阻塞的存储/PIL调用放到独立线程池中执行, 避免阻塞事件循环
+        conf = settings.storage
+        self.max_workers = conf.max_workers
+        self.max_concurrency = conf.max_concurrency
+        self.timeout = conf.timeout
+        self.upload_timeout = conf.upload_timeout
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="storage")
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._stats = {"in_flight": 0, "waiting": 0, "completed": 0, "errors": 0, "timeouts": 0}
+
+    async def _run(self, op: str, func: Callable, *args, timeout: Optional[float] = None, **kwargs) -> Any:
+        """
+        在线程池中执行阻塞调用
+        超时只结束等待, 已开始的线程无法中断, 其占用的并发额度在线程实际结束后才释放
+        :param op: 操作名称, 用于日志和链路追踪
+        :param func: 阻塞函数
+        :param timeout: 超时秒数, 包含排队时间
+        """
+        with span(f"cos.{op}", "cos", KIND_CLIENT, backend=settings.storage.backend) as current:
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + (timeout or self.timeout)
+
+            self._stats["waiting"] += 1
+            queued_at = loop.time()
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), deadline - loop.time())
+            except asyncio.TimeoutError:
+                self._stats["timeouts"] += 1
+                raise ValueError(f"COS操作排队超时: {op}")
+            finally:
+                self._stats["waiting"] -= 1
+            if current is not None:
+                current.attributes["queue_ms"] = round((loop.time() - queued_at) * 1000, 3)
+
+            self._stats["in_flight"] += 1
+            # run_in_executor 不复制 contextvars, 复制后线程中的日志带有 trace_id, span 挂在当前 span 下
+            context = contextvars.copy_context()
+            future = loop.run_in_executor(self._executor, functools.partial(context.run, func, *args, **kwargs))
+            future.add_done_callback(self._on_done)
+            try:
+                return await asyncio.wait_for(asyncio.shield(future), max(deadline - loop.time(), 0))
+            except asyncio.TimeoutError:
+                self._stats["timeouts"] += 1
+                logger.error(f"COS操作超时: {op}, timeout={timeout or self.timeout}")
+                raise ValueError(f"COS操作超时: {op}")
+
+    def _on_done(self, future: asyncio.Future):
+        self._stats["in_flight"] -= 1
+        if future.cancelled() or future.exception():
+            self._stats["errors"] += 1
         else:
-            # 初始化COS客户端
-            config = CosConfig(Region=self.region, SecretId=self.secret_id, SecretKey=self.secret_key, Scheme="https")
-            self.client = CosS3Client(config)
+            self._stats["completed"] += 1
+        self._semaphore.release()
+
+    def metrics(self) -> dict:
+        """线程池饱和度"""
+        stats = dict(self._stats)
+        stats["max_workers"] = self.max_workers
+        stats["max_concurrency"] = self.max_concurrency
+        stats["saturation"] = round(min(stats["in_flight"], self.max_workers) / self.max_workers, 3)
+        return stats
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+    async def async_upload_base64_image(self, base64_data: str, file_name: str, prefix: str = "images") -> dict:
+        """upload_base64_image 的异步版本"""
+        return await self._run(
+            "upload_base64_image", self.upload_base64_image, base64_data, file_name, prefix, timeout=self.upload_timeout
+        )
+
+    async def async_decode_base64_image(self, base64_data: str) -> bytes:
+        """decode_base64_image 的异步版本"""
+        return await self._run("decode_base64_image", self.decode_base64_image, base64_data)
+
+    async def async_digest_stream(self, stream: BinaryIO) -> dict:
+        """digest_stream 的异步版本"""
+        return await self._run("digest_stream", self.digest_stream, stream, timeout=self.upload_timeout)
+
+    async def async_upload_stream(
+        self, stream: BinaryIO, file_name: str, prefix: str = "images", content_type: Optional[str] = None
+    ) -> dict:
+        """upload_stream 的异步版本"""
+        return await self._run(
+            "upload_stream", self.upload_stream, stream, file_name, prefix, content_type, timeout=self.upload_timeout
+        )
+
+    async def async_delete_image(self, cos_key: str) -> bool:
+        """delete_image 的异步版本"""
+        return await self._run("delete_image", self.delete_image, cos_key)
+
+    async def async_get_image(self, cos_key: str) -> bytes:
+        """get_image 的异步版本"""
+        return await self._run("get_image", self.get_image, cos_key)
+
+    async def async_delete_images(self, cos_keys: List[str]) -> List[str]:
+        """
+        delete_images 的异步版本, 按 COS_BATCH_DELETE_SIZE 分批并发删除
+        :return: 删除失败的key
+        """
+        chunks = [cos_keys[i : i + COS_BATCH_DELETE_SIZE] for i in range(0, len(cos_keys), COS_BATCH_DELETE_SIZE)]
+        results = await asyncio.gather(
+            *[self._run("delete_images", self.delete_images, chunk) for chunk in chunks], return_exceptions=True
+        )
+        failed = []
+        for chunk, result in zip(chunks, results):
+            if isinstance(result, Exception):
+                logger.error(f"批量删除COS图片失败: {result}")
+                failed.extend(chunk)
+            else:
+                failed.extend(result)
+        return failed
 
     def _generate_cos_key(self, file_name: str, prefix: str = "images") -> str:
         """
@@ -66,6 +175,22 @@ class COSService:
             logger.error(f"获取图片信息失败: {e}")
             return None, None
 
+    def _sniff_image_size(self, header: bytes) -> Tuple[Optional[int], Optional[int]]:
+        """
+        只解析文件头部获取图片宽高, 不解码整张图片
+        :param header: 文件开头的若干字节
+        :return: (width, height)
+        """
+        parser = ImageFile.Parser()
+        try:
+            for start in range(0, len(header), IMAGE_HEADER_SNIFF_SIZE):
+                parser.feed(header[start : start + IMAGE_HEADER_SNIFF_SIZE])
+                if parser.image:
+                    return parser.image.size
+        except Exception as e:
+            logger.error(f"获取图片信息失败: {e}")
+        return None, None
+
     def _calculate_md5(self, data: bytes) -> str:
         """
         计算数据的MD5值
@@ -74,44 +199,63 @@ class COSService:
         """
         return hashlib.md5(data).hexdigest()
 
+    def decode_base64_image(self, base64_data: str) -> bytes:
+        """
+        解码base64图片数据, 支持 data:image/jpeg;base64,xxx 格式
+        :param base64_data: base64编码的图片数据
+        :return: 图片二进制数据
+        """
+        # 如果包含data:image/jpeg;base64,前缀，先去除
+        if "," in base64_data:
+            base64_data = base64_data.split(",")[1]
+        return base64.b64decode(base64_data)
+
+    def digest_stream(self, stream: BinaryIO, chunk_size: int = UPLOAD_CHUNK_SIZE) -> dict:
+        """
+        分片读取一遍文件流, 计算MD5、大小和宽高, 读完后回到原位置, 用于上传前去重
+        :param stream: 可seek的文件流
+        :return: {"md5", "file_size", "width", "height"}
+        """
+        start = stream.tell()
+        md5 = hashlib.md5()
+        file_size = 0
+
+        chunk = stream.read(chunk_size)
+        width, height = self._sniff_image_size(chunk[: IMAGE_HEADER_SNIFF_SIZE * 4])
+        while chunk:
+            md5.update(chunk)
+            file_size += len(chunk)
+            chunk = stream.read(chunk_size)
+
+        stream.seek(start)
+        return {"md5": md5.hexdigest(), "file_size": file_size, "width": width, "height": height}
+
     def upload_base64_image(self, base64_data: str, file_name: str, prefix: str = "images") -> dict:
         """
-        上传base64编码的图片到腾讯云COS
+        上传base64编码的图片到对象存储
         :param base64_data: base64编码的图片数据
         :param file_name: 原始文件名
         :param prefix: 存储路径前缀
         :return: 上传结果字典
         """
-        if not self.client:
-            raise ValueError("腾讯云COS客户端未初始化，请检查配置")
-
         try:
             # 解码base64数据
-            # 如果包含data:image/jpeg;base64,前缀，先去除
-            if "," in base64_data:
-                base64_data = base64_data.split(",")[1]
-
-            image_data = base64.b64decode(base64_data)
+            image_data = self.decode_base64_image(base64_data)
 
             # 获取图片信息
             width, height = self._get_image_info(image_data)
             md5_value = self._calculate_md5(image_data)
 
-            # 生成COS存储key
+            # 生成存储key
             cos_key = self._generate_cos_key(file_name, prefix)
 
-            # 上传到COS
-            response = self.client.put_object(
-                Bucket=self.bucket, Body=image_data, Key=cos_key, ContentType=self._get_content_type(file_name)
-            )
+            # 上传到存储
+            etag = self.storage.put(cos_key, image_data, self._get_content_type(file_name))
 
             # 生成访问URL
-            if self.domain:
-                cos_url = f"https://{self.domain}/{cos_key}"
-            else:
-                cos_url = f"https://{self.bucket}.cos.{self.region}.myqcloud.com/{cos_key}"
+            cos_url = self._get_cos_url(cos_key)
 
-            logger.info(f"图片上传成功: {cos_key}, ETag: {response.get('ETag')}")
+            logger.info(f"图片上传成功: {cos_key}, ETag: {etag}")
 
             return {
                 "cos_key": cos_key,
@@ -121,30 +265,119 @@ class COSService:
                 "width": width,
                 "height": height,
                 "md5": md5_value,
-                "etag": response.get("ETag", "").strip('"'),
+                "etag": etag,
             }
 
         except Exception as e:
-            logger.error(f"上传图片到COS失败: {e}")
+            logger.error(f"上传图片到存储失败: {e}")
             raise ValueError(f"上传图片失败: {str(e)}")
 
+    def upload_stream(
+        self,
+        stream: BinaryIO,
+        file_name: str,
+        prefix: str = "images",
+        content_type: Optional[str] = None,
+        chunk_size: int = UPLOAD_CHUNK_SIZE,
+    ) -> dict:
+        """
+        分片读取文件流上传到对象存储, 内存占用只与 chunk_size 相关
+        :param stream: 文件流(如 UploadFile.file)
+        :param file_name: 原始文件名
+        :param prefix: 存储路径前缀
+        :param content_type: 文件类型, 为空时按扩展名推断
+        :param chunk_size: 分片大小
+        :return: 上传结果字典, 与 upload_base64_image 一致
+        """
+        cos_key = self._generate_cos_key(file_name, prefix)
+        content_type = content_type or self._get_content_type(file_name)
+        md5 = hashlib.md5()
+        file_size = 0
+
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            raise ValueError("图片数据不能为空")
+        width, height = self._sniff_image_size(chunk[: IMAGE_HEADER_SNIFF_SIZE * 4])
+
+        def chunks():
+            # 边读边计算MD5和大小, 交给存储后端写入
+            nonlocal chunk, file_size
+            while chunk:
+                md5.update(chunk)
+                file_size += len(chunk)
+                yield chunk
+                chunk = stream.read(chunk_size)
+
+        try:
+            etag = self.storage.put_chunks(cos_key, chunks(), content_type)
+            logger.info(f"图片上传成功: {cos_key}, size: {file_size}, ETag: {etag}")
+
+            return {
+                "cos_key": cos_key,
+                "cos_url": self._get_cos_url(cos_key),
+                "bucket": self.bucket,
+                "file_size": file_size,
+                "width": width,
+                "height": height,
+                "md5": md5.hexdigest(),
+                "content_type": content_type,
+                "etag": etag,
+            }
+
+        except Exception as e:
+            logger.error(f"上传图片到存储失败: {e}")
+            raise ValueError(f"上传图片失败: {str(e)}")
+
+    def get_image(self, cos_key: str) -> bytes:
+        """
+        读取图片内容
+        :param cos_key: 存储key
+        :return: 图片二进制数据
+        """
+        return self.storage.get(cos_key)
+
+    def presign(self, cos_key: str, expires: int = 3600) -> str:
+        """
+        生成有时效的访问URL
+        :param cos_key: 存储key
+        :param expires: 有效秒数
+        """
+        return self.storage.presign(cos_key, expires)
+
     def delete_image(self, cos_key: str) -> bool:
         """
-        从COS删除图片
-        :param cos_key: COS存储key
+        从对象存储删除图片
+        :param cos_key: 存储key
         :return: 是否成功
         """
-        if not self.client:
-            raise ValueError("腾讯云COS客户端未初始化，请检查配置")
-
         try:
-            self.client.delete_object(Bucket=self.bucket, Key=cos_key)
+            self.storage.delete(cos_key)
             logger.info(f"图片删除成功: {cos_key}")
             return True
         except Exception as e:
-            logger.error(f"删除COS图片失败: {e}")
+            logger.error(f"删除存储图片失败: {e}")
             return False
 
+    def delete_images(self, cos_keys: List[str]) -> List[str]:
+        """
+        批量删除图片, 单次最多 COS_BATCH_DELETE_SIZE 个
+        :param cos_keys: 存储key列表
+        :return: 删除失败的key
+        """
+        if not cos_keys:
+            return []
+        failed = self.storage.batch_delete(cos_keys)
+        logger.info(f"批量删除图片: {len(cos_keys)} 个, 失败 {len(failed)} 个")
+        return failed
+
+    def _get_cos_url(self, cos_key: str) -> str:
+        """
+        生成访问URL
+        :param cos_key: 存储key
+        :return: 访问URL
+        """
+        return self.storage.url(cos_key)
+
     def _get_content_type(self, file_name: str) -> str:
         """
         根据文件名获取Content-Type
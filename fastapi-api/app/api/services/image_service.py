@@ -0,0 +1,151 @@
+# -*- coding:utf-8 -*-
+# @Author: H
+# @Date: 2025-10-20
+# @Version: 1.0
+# @License: H
+# @Desc: 图片存储: 按内容(md5 + 大小)去重, 多条记录共享同一个COS对象时按引用计数删除
+"""
+复用已有COS对象(查到已有记录 -> 插入新记录)与释放COS对象(删除记录 -> 检查引用 -> 删除COS对象)之间存在竞争:
+复用方查到记录后、插入新记录前, 并发的永久删除可能认为对象已无引用并删除, 新记录指向不存在的文件
+两者都在同一个 cos_key 的锁内执行: 进程内 asyncio.Lock + 配置了 redis 时的跨进程租约
+    复用方持锁后重新确认对象仍被引用再插入记录, 已无引用时重新上传
+    释放方持锁后检查引用并删除, 此时复用方的新记录要么已插入(跳过删除), 要么会在重新确认时发现对象已删除
+"""
+import asyncio
+import contextlib
+import time
+import uuid
+import weakref
+from typing import BinaryIO, Callable, List, Optional
+
+from sqlmodel import select
+
+from app.api.services.cos_service import cos_service
+from app.cache.redis import async_redis_client
+from app.constants import IMAGE_OBJECT_LOCK_PREFIX, IMAGE_OBJECT_LOCK_TTL_MS, IMAGE_OBJECT_LOCK_WAIT
+from app.db import async_dao
+from app.db.models.img import Image
+from app.utils.logger import logger
+
+# cos_key -> 进程内锁, 没有协程持有时自动回收
+_local_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+
+@contextlib.asynccontextmanager
+async def object_lock(cos_key: str):
+    """
+    cos_key 的互斥锁, 超过 IMAGE_OBJECT_LOCK_WAIT 秒未获取到时抛出 TimeoutError
+    redis 不可用时退化为进程内锁并记录告警, 不影响上传和删除
+    """
+    lock = _local_locks.get(cos_key)
+    if lock is None:
+        lock = _local_locks[cos_key] = asyncio.Lock()
+    async with lock:
+        if not async_redis_client:
+            yield
+            return
+        key, token = IMAGE_OBJECT_LOCK_PREFIX + cos_key, uuid.uuid4().hex
+        if not await _acquire_lease(key, token):
+            # redis 不可用: 只有进程内锁, 多进程之间仍可能竞争
+            logger.warning(f"image object lock falls back to process lock: {cos_key}")
+            yield
+            return
+        try:
+            yield
+        finally:
+            try:
+                await async_redis_client.release_lease(key, token)
+            except Exception as e:
+                # 租约到期后自动释放
+                logger.error(f"release image object lock failed: {cos_key} {e}")
+
+
+async def _acquire_lease(key: str, token: str) -> bool:
+    """获取到租约返回 True, redis 出错返回 False, 超过 IMAGE_OBJECT_LOCK_WAIT 秒仍被占用时抛出 TimeoutError"""
+    deadline = time.monotonic() + IMAGE_OBJECT_LOCK_WAIT
+    while True:
+        try:
+            if await async_redis_client.acquire_lease(key, token, IMAGE_OBJECT_LOCK_TTL_MS):
+                return True
+        except Exception as e:
+            logger.error(f"acquire image object lock failed: {key} {e}")
+            return False
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"acquire image object lock timeout: {key}")
+        await asyncio.sleep(0.05)
+
+
+async def store_image(
+    stream: BinaryIO,
+    file_name: str,
+    make_record: Callable[[dict], Image],
+    content_type: Optional[str] = None,
+) -> Image:
+    """
+    上传图片并插入图片记录, 相同内容的图片已存在时直接复用其 cos_key/cos_url, 不再重复上传
+    :param stream: 可seek的文件流
+    :param file_name: 原始文件名
+    :param make_record: 由上传结果创建图片记录, 上传结果与 COSService.upload_stream 一致, 复用时 duplicate 为 True
+    :param content_type: 文件类型
+    :return: 已插入的图片记录
+    """
+    digest = await cos_service.async_digest_stream(stream)
+    if not digest["file_size"]:
+        raise ValueError("图片数据不能为空")
+
+    existing = await async_dao.select_one(Image, Image.md5 == digest["md5"], Image.file_size == digest["file_size"])
+    if existing:
+        async with object_lock(existing.cos_key):
+            # 查询之后对象可能已被并发的永久删除释放, 持锁后重新确认仍被引用
+            if await _referenced_keys([existing.cos_key]):
+                logger.info(f"图片内容已存在, 复用COS对象: {existing.cos_key}")
+                db_image = make_record(
+                    {
+                        **digest,
+                        "cos_key": existing.cos_key,
+                        "cos_url": existing.cos_url,
+                        "bucket": existing.bucket,
+                        "content_type": content_type or existing.file_type,
+                        "etag": "",
+                        "duplicate": True,
+                    }
+                )
+                await async_dao.insert(db_image)
+                return db_image
+        logger.info(f"复用的COS对象已被删除, 重新上传: {existing.cos_key}")
+
+    # 新上传的 cos_key 唯一, 不会与释放竞争
+    upload_result = await cos_service.async_upload_stream(stream, file_name, content_type=content_type)
+    upload_result["duplicate"] = False
+    db_image = make_record(upload_result)
+    await async_dao.insert(db_image)
+    return db_image
+
+
+async def release_objects(cos_keys: List[str]) -> List[str]:
+    """
+    在图片记录被永久删除之后调用, 只删除已经没有任何记录引用的COS对象
+    按 cos_key 排序依次加锁, 避免与其它批量释放互相等待
+    :param cos_keys: 被删除记录的 cos_key
+    :return: 删除失败的key
+    """
+    cos_keys = sorted(set(cos_keys))
+    if not cos_keys:
+        return []
+    async with contextlib.AsyncExitStack() as stack:
+        try:
+            for key in cos_keys:
+                await stack.enter_async_context(object_lock(key))
+        except TimeoutError as e:
+            # 记录已删除, 对象暂不删除只会多占存储, 不影响数据
+            logger.warning(f"释放COS对象时获取锁超时, 跳过删除: {e}")
+            return cos_keys
+        still_used = await _referenced_keys(cos_keys)
+        orphans = [key for key in cos_keys if key not in still_used]
+        if len(orphans) < len(cos_keys):
+            logger.info(f"{len(cos_keys) - len(orphans)} 个COS对象仍被其它图片引用, 跳过删除")
+        return await cos_service.async_delete_images(orphans) if orphans else []
+
+
+async def _referenced_keys(cos_keys: List[str]) -> set:
+    return set(await async_dao.execute(select(Image.cos_key).where(Image.cos_key.in_(cos_keys)).distinct()))
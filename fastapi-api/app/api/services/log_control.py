@@ -0,0 +1,86 @@
+# -*- coding:utf-8 -*-
+# @Author: H
+# @Date: 2025-10-20
+# @Version: 1.0
+# @License: H
+# @Desc: 运行时调整日志级别和请求日志采样率, 并同步到所有 worker 进程
+"""
+两种方式:
+    1. 管理接口 PUT /api/admin/log_control: 修改当前进程后发布到 redis 的 settings.logger_conf.control_channel,
+       其它 worker 的 redis_subscriber 收到后应用; 未配置 redis 时只修改处理该请求的进程
+    2. 修改 settings.logger_conf.control_file(JSON, 字段同接口参数)后向各 worker 发送 SIGUSR2:
+       pkill -USR2 -f -P <uvicorn 主进程 pid> spawn_main
+       只发给 worker 进程, 主进程和 multiprocessing 的 resource_tracker 没有注册 SIGUSR2, 收到会退出
+"""
+import asyncio
+import os
+import signal
+import uuid
+from typing import Dict, Optional
+
+import orjson
+from pydantic import BaseModel
+
+from app.cache.pubsub import redis_subscriber
+from app.cache.redis import async_redis_client
+from app.settings import settings
+from app.utils.logger import logger, update_log_control
+
+# 区分消息来源, 忽略自己发布的消息
+_instance_id = uuid.uuid4().hex
+
+
+class LogControlUpdate(BaseModel):
+    """日志控制参数, 为空的字段保持不变"""
+
+    level: Optional[str] = None
+    module_levels: Optional[Dict[str, str]] = None
+    sample_rate: Optional[float] = None
+    slow_request_ms: Optional[float] = None
+
+
+async def apply_and_broadcast(update: LogControlUpdate) -> dict:
+    """修改当前进程的日志配置并通知其它进程, 参数无效时抛出 ValueError"""
+    changes = update.model_dump(exclude_none=True)
+    current = update_log_control(**changes)
+    if async_redis_client:
+        try:
+            message = orjson.dumps({"src": _instance_id, "changes": changes})
+            await async_redis_client.publish(settings.logger_conf.control_channel, message)
+        except Exception as e:
+            logger.error(f"publish log control failed: {e}")
+    return current
+
+
+def on_message(data: bytes):
+    """处理其它进程发布的日志控制消息, 在 redis_subscriber 线程中执行"""
+    message = orjson.loads(data)
+    if message.get("src") != _instance_id:
+        update_log_control(**message.get("changes", {}))
+
+
+def reload_from_file():
+    """SIGUSR2: 从 control_file 读取并应用日志控制参数"""
+    path = settings.logger_conf.control_file
+    try:
+        with open(path, "rb") as f:
+            update = LogControlUpdate(**orjson.loads(f.read()))
+        update_log_control(**update.model_dump(exclude_none=True))
+    except Exception as e:
+        logger.error(f"reload log control from {path} failed: {e}")
+
+
+def install_signal_handler():
+    """在事件循环中处理 SIGUSR2, 避免在信号处理函数中写日志时与 loguru 持有的锁死锁"""
+    if not hasattr(signal, "SIGUSR2"):
+        return
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGUSR2, reload_from_file)
+    except (NotImplementedError, RuntimeError, ValueError) as e:
+        logger.warning(f"install SIGUSR2 handler failed: {e}")
+        return
+    logger.debug(f"SIGUSR2 reloads log control from {settings.logger_conf.control_file}, pid={os.getpid()}")
+
+
+if redis_subscriber:
+    redis_subscriber.subscribe(settings.logger_conf.control_channel, on_message)
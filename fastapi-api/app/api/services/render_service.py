@@ -0,0 +1,136 @@
+# -*- coding:utf-8 -*-
+# @Author: H
+# @Date: 2025-10-20
+# @Version: 1.0
+# @License: H
+# @Desc: 图片按需缩放/转码: 进程池处理 + 磁盘 LRU 结果缓存
+"""
+/img/render/{image_id}?w=&h=&fmt=&q= 的处理流程:
+    1. 根据 Image.md5 和参数计算强 ETag, 与 If-None-Match 一致时直接返回 304, 不读取存储和缓存
+    2. 缓存 key 为 (md5, 参数), 命中时由 FileResponse 直接发送缓存文件
+    3. 未命中时通过 COSService 读取原图, 在进程池中缩放/编码, 写入缓存后返回;
+       同一进程内相同 key 的并发请求只处理一次
+缩放/编码是 CPU 密集的纯 Python 调用链(Pillow 释放 GIL 的部分有限), 放到进程池中避免占用事件循环所在进程的 CPU
+"""
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from typing import Optional
+
+from app.api.services.cos_service import cos_service
+from app.cache.disk import DiskLRUCache
+from app.cache.stampede import SingleFlight
+from app.db.models.img import Image
+from app.settings import RenderConfig, settings
+from app.utils import image_render
+from app.utils.logger import logger
+from app.utils.tracing import span
+
+# 缩放/编码实现变化(如重采样算法、编码参数)导致输出不同时加一, 使旧缓存和客户端的 ETag 失效
+RENDER_VERSION = 1
+
+
+@dataclass(frozen=True)
+class RenderParams:
+    width: Optional[int]
+    height: Optional[int]
+    fmt: str
+    quality: int
+
+    @classmethod
+    def create(cls, width: Optional[int], height: Optional[int], fmt: str, quality: int, max_size: int):
+        """校验参数, 无效时抛出 ValueError"""
+        fmt = fmt.lower()
+        if fmt == "jpg":
+            fmt = "jpeg"
+        if fmt not in image_render.FORMATS:
+            raise ValueError(f"fmt 只支持 {', '.join(image_render.FORMATS)}")
+        for value in (width, height):
+            if value is not None and not 1 <= value <= max_size:
+                raise ValueError(f"w / h 的范围为 1~{max_size}")
+        if not 1 <= quality <= 100:
+            raise ValueError("q 的范围为 1~100")
+        # png 无损, 质量参数不影响输出, 统一后避免重复缓存
+        return cls(width, height, fmt, quality if fmt != "png" else 0)
+
+    @property
+    def media_type(self) -> str:
+        return image_render.FORMATS[self.fmt][1]
+
+    def cache_key(self, md5: str) -> str:
+        return f"{md5}_{self.width or 0}x{self.height or 0}_q{self.quality}_v{RENDER_VERSION}.{self.fmt}"
+
+    def etag(self, md5: str) -> str:
+        """强 ETag: 相同原图(md5)和参数的输出字节完全相同"""
+        return f'"{self.cache_key(md5)}"'
+
+
+class RenderService:
+    def __init__(self, conf: RenderConfig):
+        self.conf = conf
+        self.cache = DiskLRUCache(conf.cache_dir, conf.cache_max_bytes)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._flights = SingleFlight()
+        self._stats = {"renders": 0, "errors": 0, "timeouts": 0}
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # 应用进程中有日志、导出等后台线程, fork 后子进程可能继承被持有的锁, 使用 spawn
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.conf.max_workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    async def render(self, image: Image, params: RenderParams) -> str:
+        """返回缩放/转码结果的缓存文件路径"""
+        key = params.cache_key(image.md5)
+        path = self.cache.get(key)
+        if path is not None:
+            return path
+        return await self._flights.do(key, lambda: self._render(image.cos_key, key, params))
+
+    async def _render(self, cos_key: str, key: str, params: RenderParams) -> str:
+        data = await cos_service.async_get_image(cos_key)
+        loop = asyncio.get_running_loop()
+        with span("img.render", "app", fmt=params.fmt, width=params.width or 0, height=params.height or 0):
+            try:
+                output = await asyncio.wait_for(
+                    loop.run_in_executor(
+                        self._pool(),
+                        image_render.render,
+                        data,
+                        params.width,
+                        params.height,
+                        params.fmt,
+                        params.quality,
+                        self.conf.max_pixels,
+                    ),
+                    self.conf.timeout,
+                )
+            except asyncio.TimeoutError:
+                self._stats["timeouts"] += 1
+                raise ValueError("图片处理超时")
+            except BrokenProcessPool:
+                # 子进程异常退出(如内存不足被杀)后进程池不可用, 下次请求时重建
+                self._stats["errors"] += 1
+                self._executor = None
+                raise
+            except Exception:
+                self._stats["errors"] += 1
+                raise
+        self._stats["renders"] += 1
+        return await asyncio.to_thread(self.cache.put, key, output)
+
+    def metrics(self) -> dict:
+        return {**self._stats, "cache": self.cache.metrics()}
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+            logger.info(f"render service stopped, metrics={self.metrics()}")
+
+
+render_service = RenderService(settings.render)
@@ -0,0 +1,245 @@
+# -*- coding:utf-8 -*-
+# @Author: H
+# @Date: 2025-10-20
+# @Version: 1.0
+# @License: H
+# @Desc: 对象存储后端: 腾讯云COS / 本地磁盘, 通过 settings.storage.backend 选择
+
+import hashlib
+import hmac
+import itertools
+import os
+import tempfile
+import time
+from abc import ABC, abstractmethod
+from typing import Iterable, List, Optional
+
+from qcloud_cos import CosConfig, CosS3Client
+
+from app.settings import COSConfig, StorageConfig, settings
+from app.utils.logger import logger
+from app.utils.metrics import STORAGE_OPERATION_SECONDS, observe_methods
+
+# 记录耗时的存储调用
+_OBSERVED_METHODS = ["put", "put_chunks", "get", "delete", "batch_delete", "presign"]
+
+
+class StorageBackend(ABC):
+    """对象存储后端接口, 方法均为阻塞调用, 由 COSService 放到线程池执行"""
+
+    name: str
+    bucket: str
+
+    @abstractmethod
+    def put(self, key: str, data: bytes, content_type: str) -> str:
+        """写入对象, 返回 etag"""
+
+    @abstractmethod
+    def put_chunks(self, key: str, chunks: Iterable[bytes], content_type: str) -> str:
+        """分片写入对象, 返回 etag"""
+
+    @abstractmethod
+    def get(self, key: str) -> bytes:
+        """读取对象内容"""
+
+    @abstractmethod
+    def delete(self, key: str) -> bool:
+        """删除对象"""
+
+    @abstractmethod
+    def batch_delete(self, keys: List[str]) -> List[str]:
+        """批量删除对象, 返回删除失败的key"""
+
+    @abstractmethod
+    def url(self, key: str) -> str:
+        """对象的访问URL"""
+
+    @abstractmethod
+    def presign(self, key: str, expires: int = 3600) -> str:
+        """生成有时效的访问URL"""
+
+    def local_path(self, key: str) -> Optional[str]:
+        """对象在本机的文件路径, 非本地存储返回 None"""
+        return None
+
+
+@observe_methods(STORAGE_OPERATION_SECONDS, _OBSERVED_METHODS, "operation", backend="cos")
+class COSStorage(StorageBackend):
+    """腾讯云COS存储"""
+
+    name = "cos"
+
+    def __init__(self, conf: Optional[COSConfig]):
+        self.region = conf.region if conf else ""
+        self.bucket = conf.bucket if conf else ""
+        self.domain = conf.domain if conf else None
+
+        if not conf or not all([conf.secret_id, conf.secret_key, conf.bucket]):
+            logger.warning("腾讯云COS配置不完整，请检查配置文件")
+            self.client = None
+        else:
+            # 初始化COS客户端
+            config = CosConfig(Region=self.region, SecretId=conf.secret_id, SecretKey=conf.secret_key, Scheme="https")
+            self.client = CosS3Client(config)
+
+    def _check_client(self):
+        if not self.client:
+            raise ValueError("腾讯云COS客户端未初始化，请检查配置")
+
+    def put(self, key: str, data: bytes, content_type: str) -> str:
+        self._check_client()
+        response = self.client.put_object(Bucket=self.bucket, Body=data, Key=key, ContentType=content_type)
+        return response.get("ETag", "").strip('"')
+
+    def put_chunks(self, key: str, chunks: Iterable[bytes], content_type: str) -> str:
+        """只有一个分片时直接 put_object, 否则使用分块上传, 失败时中止分块上传"""
+        self._check_client()
+        chunks = iter(chunks)
+        first = next(chunks, b"")
+        second = next(chunks, None)
+        if second is None:
+            return self.put(key, first, content_type)
+
+        upload_id = self.client.create_multipart_upload(Bucket=self.bucket, Key=key, ContentType=content_type)[
+            "UploadId"
+        ]
+        parts = []
+        try:
+            for part_number, chunk in enumerate(itertools.chain([first, second], chunks), start=1):
+                part = self.client.upload_part(
+                    Bucket=self.bucket, Key=key, Body=chunk, PartNumber=part_number, UploadId=upload_id
+                )
+                parts.append({"PartNumber": part_number, "ETag": part["ETag"]})
+            response = self.client.complete_multipart_upload(
+                Bucket=self.bucket, Key=key, UploadId=upload_id, MultipartUpload={"Part": parts}
+            )
+        except Exception:
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id)
+            raise
+        return response.get("ETag", "").strip('"')
+
+    def get(self, key: str) -> bytes:
+        self._check_client()
+        response = self.client.get_object(Bucket=self.bucket, Key=key)
+        return response["Body"].get_raw_stream().read()
+
+    def delete(self, key: str) -> bool:
+        self._check_client()
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+        return True
+
+    def batch_delete(self, keys: List[str]) -> List[str]:
+        """使用 DeleteObjects 接口批量删除, 单次最多 1000 个"""
+        self._check_client()
+        if not keys:
+            return []
+        response = self.client.delete_objects(
+            Bucket=self.bucket, Delete={"Object": [{"Key": key} for key in keys], "Quiet": "true"}
+        )
+        errors = response.get("Error") or []
+        if isinstance(errors, dict):
+            errors = [errors]
+        for error in errors:
+            logger.error(f"删除COS图片失败: {error.get('Key')} {error.get('Code')} {error.get('Message')}")
+        return [error.get("Key") for error in errors]
+
+    def url(self, key: str) -> str:
+        if self.domain:
+            return f"https://{self.domain}/{key}"
+        return f"https://{self.bucket}.cos.{self.region}.myqcloud.com/{key}"
+
+    def presign(self, key: str, expires: int = 3600) -> str:
+        self._check_client()
+        return self.client.get_presigned_download_url(Bucket=self.bucket, Key=key, Expired=expires)
+
+
+@observe_methods(STORAGE_OPERATION_SECONDS, _OBSERVED_METHODS, "operation", backend="local")
+class LocalStorage(StorageBackend):
+    """
+    本地磁盘存储, 用于无网络凭证时本机运行和压测
+    写入先落临时文件再 os.replace, 保证读到的对象总是完整的; 读取由 FileResponse 直接从文件发送
+    """
+
+    name = "local"
+
+    def __init__(self, conf: StorageConfig, secret: str):
+        self.root = os.path.abspath(conf.root)
+        self.bucket = "local"
+        self.base_url = conf.base_url.rstrip("/")
+        self.public = conf.public
+        self._secret = (conf.sign_secret or secret).encode("utf-8")
+        os.makedirs(self.root, exist_ok=True)
+
+    def local_path(self, key: str) -> str:
+        path = os.path.abspath(os.path.join(self.root, key))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError(f"非法的存储key: {key}")
+        return path
+
+    def put(self, key: str, data: bytes, content_type: str) -> str:
+        return self.put_chunks(key, [data], content_type)
+
+    def put_chunks(self, key: str, chunks: Iterable[bytes], content_type: str) -> str:
+        path = self.local_path(key)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+
+        md5 = hashlib.md5()
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in chunks:
+                    md5.update(chunk)
+                    f.write(chunk)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return md5.hexdigest()
+
+    def get(self, key: str) -> bytes:
+        with open(self.local_path(key), "rb") as f:
+            return f.read()
+
+    def delete(self, key: str) -> bool:
+        try:
+            os.remove(self.local_path(key))
+        except FileNotFoundError:
+            pass
+        return True
+
+    def batch_delete(self, keys: List[str]) -> List[str]:
+        failed = []
+        for key in keys:
+            try:
+                self.delete(key)
+            except Exception as e:
+                logger.error(f"删除本地文件失败: {key} {e}")
+                failed.append(key)
+        return failed
+
+    def url(self, key: str) -> str:
+        return f"{self.base_url}/{key}"
+
+    def _signature(self, key: str, expires: int) -> str:
+        return hmac.new(self._secret, f"{key}:{expires}".encode("utf-8"), hashlib.sha256).hexdigest()
+
+    def presign(self, key: str, expires: int = 3600) -> str:
+        expires_at = int(time.time()) + expires
+        return f"{self.url(key)}?expires={expires_at}&signature={self._signature(key, expires_at)}"
+
+    def verify(self, key: str, expires: Optional[int], signature: Optional[str]) -> bool:
+        """校验预签名URL"""
+        if not expires or not signature or expires < time.time():
+            return False
+        return hmac.compare_digest(self._signature(key, expires), signature)
+
+
+def create_storage() -> StorageBackend:
+    """按配置创建存储后端"""
+    if settings.storage.backend == LocalStorage.name:
+        return LocalStorage(settings.storage, settings.jwt.secret)
+    return COSStorage(settings.cos)
@@ -7,7 +7,7 @@
 
 import functools
 import json
-from typing import List
+from typing import Any, List, Optional, Sequence
 
 from fastapi import Depends
 from fastapi_jwt_auth import AuthJWT
@@ -15,8 +15,16 @@ from fastapi_jwt_auth import AuthJWT
 from app.api.errcode.base import ApiError, UnAuthorizedError
 from app.api.errcode.user import UserLoginOfflineError
 from app.api.JWT import ACCESS_TOKEN_EXPIRE_TIME
-from app.db.dao import select_one
-from app.db.models.user import AdminRole, User
+from app.cache.local import TTLCache
+from app.cache.redis import async_redis_client
+from app.cache.stampede import cache_loader
+from app.constants import LOGIN_USER_CACHE_SIZE, LOGIN_USER_CACHE_TTL, LOGIN_USER_PREFIX
+from app.db.async_dao import select_by_pks, select_one
+from app.db.models.user import AdminRole, User, UserBrief
+from app.utils.logger import logger
+
+# 登录用户缓存: user_id -> (current_token, user_dict)
+_login_user_cache = TTLCache(maxsize=LOGIN_USER_CACHE_SIZE, ttl=LOGIN_USER_CACHE_TTL)
 
 
 def gen_user_jwt(db_user: User):
@@ -42,9 +50,86 @@ async def get_login_user(authorize: AuthJWT = Depends()) -> User:
 
     current_user = json.loads(authorize.get_jwt_subject())
 
-    # 获取access_token
-    user = select_one(User, User.id == current_user["user_id"])
+    user_id = current_user["user_id"]
+    user = await _get_cached_login_user(user_id, authorize._token)
+    if user:
+        return user
+
+    # 多个进程同时未命中时只有一个进程查询数据库, 其它进程等待其写入 redis
+    cached = await cache_loader.load_shared(
+        f"{LOGIN_USER_PREFIX}{user_id}", lambda: _read_login_user_l2(user_id), lambda: _load_login_user(user_id)
+    )
     # 登录被挤下线了，http状态码是200, code是特殊code
-    if user.current_token != authorize._token:
+    if not cached or cached[0] != authorize._token:
         raise UserLoginOfflineError()
-    return user
+    return User.model_validate(cached[1])
+
+
+async def _load_login_user(user_id: int) -> Optional[tuple]:
+    user = await select_one(User, User.id == user_id)
+    if user is None:
+        return None
+    return await _set_cached_login_user(user)
+
+
+async def _read_login_user_l2(user_id: int) -> Optional[tuple]:
+    cached = await _asafe(async_redis_client.get, f"{LOGIN_USER_PREFIX}{user_id}")
+    if cached:
+        _login_user_cache.set(user_id, cached)
+    return cached or None
+
+
+async def _get_cached_login_user(user_id: int, token: str) -> Optional[User]:
+    """
+    按 (user_id, token) 读取缓存的登录用户, token 不一致时视为未命中, 交由数据库判断是否被挤下线
+    """
+    cached = _login_user_cache.get(user_id)
+    if cached is None and async_redis_client:
+        cached = await _asafe(async_redis_client.get, f"{LOGIN_USER_PREFIX}{user_id}")
+        if cached:
+            _login_user_cache.set(user_id, cached)
+    if not cached or cached[0] != token:
+        return None
+    # 每次返回新的对象, 避免请求内修改污染缓存
+    return User.model_validate(cached[1])
+
+
+async def _set_cached_login_user(user: User) -> tuple:
+    cached = (user.current_token, user.model_dump())
+    _login_user_cache.set(user.id, cached)
+    if async_redis_client:
+        await _asafe(async_redis_client.set, f"{LOGIN_USER_PREFIX}{user.id}", cached, LOGIN_USER_CACHE_TTL)
+    return cached
+
+
+async def invalidate_login_user(user_id: int):
+    """
+    用户的 current_token / delete / role 等发生变化时调用, 清除登录用户缓存
+    """
+    _login_user_cache.delete(user_id)
+    if async_redis_client:
+        await _asafe(async_redis_client.delete, f"{LOGIN_USER_PREFIX}{user_id}")
+
+
+async def _asafe(func, *args):
+    """登录用户缓存的 redis 操作, redis 不可用时记录错误并视为未命中, 不影响登录和鉴权"""
+    try:
+        return await func(*args)
+    except Exception as e:
+        logger.error(f"login user cache redis error: {e}")
+        return None
+
+
+async def expand_users(rows: Sequence[Any], id_field: str, target: str) -> List[dict]:
+    """
+    列表接口的 expand: 按 rows 中每条记录的 id_field 关联用户, 以 UserBrief 放入 target 字段, 返回 model_dump() 字典列表
+    所有用户通过一次 select_by_pks 读取(先读 dao 缓存, 未命中的一次 IN 查询), 不存在的用户为 None
+    """
+    users = await select_by_pks(User, [getattr(row, id_field) for row in rows])
+    result = []
+    for row in rows:
+        item = row.model_dump()
+        user = users.get(item[id_field])
+        item[target] = UserBrief(id=user.id, user_name=user.user_name) if user else None
+        result.append(item)
+    return result
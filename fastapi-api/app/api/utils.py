@@ -4,18 +4,60 @@
 # @Version: 1.0
 # @License: H
 # @Desc: 
+import functools
+import ipaddress
 import string
 import random
 import hashlib
+from ipaddress import IPv4Network, IPv6Network
+from typing import Iterable, List, Optional, Set, Tuple, Union
+
 from fastapi import Request, WebSocket
 
+from app.api.errcode.base import InvalidArgument
+from app.settings import settings
+
+IPNetwork = Union[IPv4Network, IPv6Network]
+
 
 def get_request_ip(request: Request | WebSocket) -> str:
-    """ 获取客户端真实IP """
+    """
+    获取客户端真实IP
+    直连地址是可信代理(settings.proxy.trusted_proxies)时才读取 X-Forwarded-For, 从右往左取第一个不可信的地址;
+    最左边的值可由客户端任意伪造, 不能直接使用
+    """
+    peer = request.client.host if request.client else ''
+    if not is_trusted_proxy(peer):
+        return peer
     x_forwarded_for = request.headers.get('X-Forwarded-For')
-    if x_forwarded_for:
-        return x_forwarded_for.split(',')[0]
-    return request.client.host
+    hops = [hop.strip() for hop in (x_forwarded_for or '').split(',') if hop.strip()]
+    for hop in reversed(hops):
+        if not is_trusted_proxy(hop):
+            return hop
+    # 整条链路都是可信代理
+    return hops[0] if hops else peer
+
+
+def is_trusted_proxy(host: str) -> bool:
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return any(address in network for network in _trusted_networks(tuple(settings.proxy.trusted_proxies)))
+
+
+@functools.lru_cache(maxsize=8)
+def _trusted_networks(cidrs: Tuple[str, ...]) -> List[IPNetwork]:
+    return [ipaddress.ip_network(cidr, strict=False) for cidr in cidrs]
+
+
+def parse_expand(expand: Optional[str], allowed: Iterable[str]) -> Set[str]:
+    """ 解析逗号分隔的 expand 参数, 包含不支持的值时报错 """
+    names = {name.strip() for name in (expand or '').split(',') if name.strip()}
+    unknown = names.difference(allowed)
+    if unknown:
+        raise InvalidArgument(message=f"不支持的 expand: {', '.join(sorted(unknown))}")
+    return names
 
 
 def md5_hash(original_string: str):
@@ -0,0 +1,188 @@
+# -*- coding:utf-8 -*-
+# @Author: H
+# @Date: 2025-10-20
+# @Version: 1.0
+# @License: H
+# @Desc: 缓存值的编解码: pickle / orjson / msgpack 序列化, 可选 zlib / zstd / lz4 压缩
+"""
+编码后的数据以 1 个字节的头开始, 记录序列化方式和压缩方式, 解码时按头处理, 不依赖写入时的配置:
+
+    header = (compression << 4) | serializer
+
+pickle 协议2以上的数据总是以 0x80 开头, 而头字节最大为 0x3F, 因此没有头的旧数据按 pickle 读取
+
+msgpack / zstandard / lz4 为可选依赖, 未安装时使用对应编解码会抛出 ValueError
+"""
+import pickle
+import zlib
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, Optional
+
+import orjson
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:  # pragma: no cover
+    lz4_frame = None
+
+SERIALIZERS = {"pickle": 1, "orjson": 2, "msgpack": 3}
+COMPRESSIONS = {"none": 0, "zlib": 1, "zstd": 2, "lz4": 3}
+_SERIALIZER_NAMES = {v: k for k, v in SERIALIZERS.items()}
+_COMPRESSION_NAMES = {v: k for k, v in COMPRESSIONS.items()}
+_PICKLE_PROTO = 0x80
+
+
+def _default(obj: Any) -> Any:
+    """orjson / msgpack 不支持的类型: pydantic/SQLModel 对象转为字典, 时间转为 ISO 字符串"""
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump()
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    if isinstance(obj, Decimal):
+        return str(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not serializable")
+
+
+def _serialize(serializer: int, value: Any) -> bytes:
+    if serializer == SERIALIZERS["orjson"]:
+        return orjson.dumps(value, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    if serializer == SERIALIZERS["msgpack"]:
+        return msgpack.packb(value, default=_default, use_bin_type=True)
+    return pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _deserialize(serializer: int, data: bytes) -> Any:
+    if serializer == SERIALIZERS["orjson"]:
+        return orjson.loads(data)
+    if serializer == SERIALIZERS["msgpack"]:
+        return msgpack.unpackb(data, raw=False, strict_map_key=False)
+    if serializer == SERIALIZERS["pickle"]:
+        return pickle.loads(data)
+    raise ValueError(f"未知的序列化方式: {serializer}")
+
+
+def _compress(compression: int, data: bytes, level: Optional[int]) -> bytes:
+    if compression == COMPRESSIONS["zlib"]:
+        return zlib.compress(data, 6 if level is None else level)
+    if compression == COMPRESSIONS["zstd"]:
+        return zstandard.ZstdCompressor(level=3 if level is None else level).compress(data)
+    if compression == COMPRESSIONS["lz4"]:
+        return lz4_frame.compress(data, compression_level=0 if level is None else level)
+    return data
+
+
+def _decompress(compression: int, data: bytes) -> bytes:
+    if compression == COMPRESSIONS["zlib"]:
+        return zlib.decompress(data)
+    if compression == COMPRESSIONS["zstd"]:
+        return zstandard.ZstdDecompressor().decompress(data)
+    if compression == COMPRESSIONS["lz4"]:
+        return lz4_frame.decompress(data)
+    if compression == COMPRESSIONS["none"]:
+        return data
+    raise ValueError(f"未知的压缩方式: {compression}")
+
+
+class Codec:
+    """
+    缓存值编解码器
+    :param serializer: pickle / orjson / msgpack
+    :param compression: none / zlib / zstd / lz4
+    :param threshold: 序列化后超过多少字节才压缩, 小数据压缩收益低且更慢
+    :param level: 压缩级别, 为空时使用各算法的默认值
+
+    orjson / msgpack 的结果可被非 Python 程序读取(去掉头字节), 但元组会变为列表、时间会变为字符串,
+    只适合缓存可以还原为 JSON 类型的数据
+    """
+
+    def __init__(
+        self, serializer: str = "pickle", compression: str = "none", threshold: int = 1024, level: Optional[int] = None
+    ):
+        if serializer not in SERIALIZERS:
+            raise ValueError(f"不支持的序列化方式: {serializer}")
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"不支持的压缩方式: {compression}")
+        if serializer == "msgpack" and msgpack is None:
+            raise ValueError("使用 msgpack 需要安装 msgpack")
+        if compression == "zstd" and zstandard is None:
+            raise ValueError("使用 zstd 压缩需要安装 zstandard")
+        if compression == "lz4" and lz4_frame is None:
+            raise ValueError("使用 lz4 压缩需要安装 lz4")
+
+        self.serializer = serializer
+        self.compression = compression
+        self.threshold = threshold
+        self.level = level
+        self._serializer_id = SERIALIZERS[serializer]
+        self._compression_id = COMPRESSIONS[compression]
+
+    @classmethod
+    def from_spec(cls, spec: str, threshold: int = 1024) -> "Codec":
+        """按 "orjson" / "msgpack+zstd" 形式的字符串创建"""
+        serializer, _, compression = spec.partition("+")
+        return cls(serializer, compression or "none", threshold)
+
+    @property
+    def spec(self) -> str:
+        return self.serializer if self.compression == "none" else f"{self.serializer}+{self.compression}"
+
+    def encode(self, value: Any) -> bytes:
+        data = _serialize(self._serializer_id, value)
+        compression = COMPRESSIONS["none"]
+        if self._compression_id and len(data) >= self.threshold:
+            compressed = _compress(self._compression_id, data, self.level)
+            # 压缩后没有变小(如已压缩的数据)就存原始数据
+            if len(compressed) < len(data):
+                data, compression = compressed, self._compression_id
+        return bytes(((compression << 4) | self._serializer_id,)) + data
+
+    @staticmethod
+    def decode(data: Optional[bytes]) -> Any:
+        """按头字节解码, 与编码时使用的 Codec 无关"""
+        if not data:
+            return None
+        header = data[0]
+        if header == _PICKLE_PROTO:
+            # 没有头的旧数据
+            return pickle.loads(data)
+        serializer, compression = header & 0x0F, header >> 4
+        if serializer not in _SERIALIZER_NAMES or compression not in _COMPRESSION_NAMES:
+            raise ValueError(f"无法识别的缓存数据头: {header:#x}")
+        return _deserialize(serializer, _decompress(compression, data[1:]))
+
+    def __repr__(self):
+        return f"Codec({self.spec}, threshold={self.threshold})"
+
+
+class CodecRegistry:
+    """按 key 前缀选择编解码器, 最长前缀优先, 都不匹配时使用默认编解码器"""
+
+    def __init__(self, default: Codec):
+        self.default = default
+        self._prefixes: Dict[str, Codec] = {}
+
+    def register(self, prefix: str, codec: Codec):
+        self._prefixes[prefix] = codec
+        # 按长度倒序, 保证最长前缀先匹配
+        self._prefixes = dict(sorted(self._prefixes.items(), key=lambda item: len(item[0]), reverse=True))
+
+    def get(self, key: Any) -> Codec:
+        if isinstance(key, bytes):
+            key = key.decode("utf-8", "ignore")
+        for prefix, codec in self._prefixes.items():
+            if str(key).startswith(prefix):
+                return codec
+        return self.default
@@ -0,0 +1,113 @@
+# -*- coding:utf-8 -*-
+# @Author: H
+# @Date: 2025-10-20
+# @Version: 1.0
+# @License: H
+# @Desc: 磁盘缓存
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+
+class DiskLRUCache:
+    """按总大小淘汰的磁盘 LRU 缓存, 每个 key 一个文件, 线程安全
+
+    文件写入临时文件后 rename, 读取方不会读到写了一半的文件;
+    多个进程共享同一个目录时, 各进程只在内存中记录自己访问过的文件, 启动时按修改时间加载已有文件,
+    命中时更新文件修改时间, 因此目录总大小可能暂时超过 max_bytes, 超出部分不超过其它进程新写入的文件
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, int]" = OrderedDict()  # key -> 文件大小, 按访问时间排序
+        self._size = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0}
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key)
+
+    def get(self, key: str) -> Optional[str]:
+        """命中时返回文件路径"""
+        path = self.path(key)
+        with self._lock:
+            size = self._entries.get(key)
+            if size is None:
+                # 其它进程写入的文件
+                try:
+                    size = os.stat(path).st_size
+                except FileNotFoundError:
+                    self._stats["misses"] += 1
+                    return None
+                self._add(key, size)
+            elif not os.path.exists(path):
+                # 被其它进程淘汰
+                self._size -= self._entries.pop(key)
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return path
+
+    def put(self, key: str, data: bytes) -> str:
+        """写入文件并返回路径"""
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            if key in self._entries:
+                self._size -= self._entries.pop(key)
+            self._add(key, len(data))
+            self._evict(keep=key)
+        return path
+
+    def metrics(self) -> dict:
+        stats = dict(self._stats)
+        stats["entries"] = len(self._entries)
+        stats["size"] = self._size
+        stats["max_bytes"] = self.max_bytes
+        return stats
+
+    def _add(self, key: str, size: int):
+        self._entries[key] = size
+        self._size += size
+
+    def _evict(self, keep: Optional[str] = None):
+        while self._size > self.max_bytes and self._entries:
+            key, size = next(iter(self._entries.items()))
+            if key == keep:
+                break
+            del self._entries[key]
+            self._size -= size
+            self._stats["evictions"] += 1
+            try:
+                os.remove(self.path(key))
+            except FileNotFoundError:
+                pass
+
+    def _load(self):
+        files = []
+        for shard in os.scandir(self.directory):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith(".tmp"):
+                    continue
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.name, stat.st_size))
+        files.sort()
+        with self._lock:
+            for _, key, size in files:
+                self._add(key, size)
+            self._evict()
@@ -0,0 +1,87 @@
+# -*- coding:utf-8 -*-
+# @Author: H
+# @Date: 2025-10-20
+# @Version: 1.0
+# @License: H
+# @Desc: redis 发布订阅: 后台线程接收消息并分发给各 channel 的处理函数
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from app.cache.redis import RedisClient, redis_client
+from app.utils.logger import logger
+
+
+class RedisSubscriber:
+    """
+    在后台线程中订阅 redis channel, 收到消息后按 channel 调用注册的处理函数
+    连接断开时自动重连并重新订阅, 断开期间的消息会丢失, 依赖方需要能容忍(如缓存依赖 TTL 兜底)
+    """
+
+    def __init__(self, client: RedisClient):
+        self.client = client
+        self._handlers: Dict[str, List[Callable[[bytes], None]]] = {}
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def subscribe(self, channel: str, handler: Callable[[bytes], None]):
+        """注册处理函数, 需要在 start 之前调用"""
+        self._handlers.setdefault(channel, []).append(handler)
+
+    def start(self):
+        if self.running or not self._handlers:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="redis-subscriber", daemon=True)
+        self._thread.start()
+        logger.info(f"redis subscriber started, channels={list(self._handlers)}")
+
+    def stop(self, timeout: float = 5):
+        if not self.running:
+            return
+        self._stop_event.set()
+        self._thread.join(timeout)
+        self._thread = None
+        logger.info("redis subscriber stopped")
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            pubsub = None
+            try:
+                pubsub = self.client.connection.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(*self._handlers)
+                while not self._stop_event.is_set():
+                    message = pubsub.get_message(timeout=1.0)
+                    if message:
+                        self._dispatch(message)
+            except Exception as e:
+                logger.error(f"redis subscriber error, reconnect in 1s: {e}")
+                self._stop_event.wait(1)
+            finally:
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+
+    def _dispatch(self, message: dict):
+        channel = message["channel"]
+        if isinstance(channel, bytes):
+            channel = channel.decode()
+        for handler in self._handlers.get(channel, []):
+            begin = time.perf_counter()
+            try:
+                handler(message["data"])
+            except Exception as e:
+                logger.error(f"redis subscriber handler error, channel={channel}: {e}")
+            cost = (time.perf_counter() - begin) * 1000
+            if cost > 100:
+                logger.warning(f"redis subscriber handler slow, channel={channel} cost={cost:.1f}ms")
+
+
+# 未配置 redis 时为 None
+redis_subscriber = RedisSubscriber(redis_client) if redis_client else None
@@ -0,0 +1,163 @@
+# -*- coding:utf-8 -*-
+# @Author: H
+# @Date: 2025-10-20
+# @Version: 1.0
+# @License: H
+# @Desc: 限流: redis Lua 脚本实现的滑动窗口 / 令牌桶, 未配置 redis 或 redis 异常时退化为进程内限流
+"""
+每条规则的计数 key 为 rl_{规则名}:{维度值}, 维度为 ip / user / global
+滑动窗口使用有序集合记录窗口内每次请求的时间, 令牌桶使用哈希记录剩余令牌和上次补充时间,
+两种脚本都在一次 EVALSHA 中完成判断和计数, 多进程之间没有竞争
+
+进程内限流只在当前进程内计数, 多进程部署下实际上限为 limit * 进程数
+"""
+import math
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass
+from typing import List, Optional
+
+from app.cache.local import TTLCache
+from app.cache.redis import AsyncRedisClient, async_redis_client
+from app.settings import RateLimitConfig, RateLimitRule, settings
+from app.utils.logger import logger
+
+SLIDING_WINDOW = "sliding_window"
+TOKEN_BUCKET = "token_bucket"
+
+RATE_LIMIT_PREFIX = "rl_"
+
+# KEYS[1]: 计数key  ARGV: 当前毫秒, 窗口毫秒, 上限, 本次请求的唯一标识
+# 返回 {是否允许, 剩余次数, 需要等待的毫秒数}
+_SLIDING_WINDOW_LUA = """
+local key = KEYS[1]
+local now = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local limit = tonumber(ARGV[3])
+redis.call("ZREMRANGEBYSCORE", key, 0, now - window)
+local count = redis.call("ZCARD", key)
+if count < limit then
+    redis.call("ZADD", key, now, ARGV[4])
+    redis.call("PEXPIRE", key, window)
+    return {1, limit - count - 1, 0}
+end
+local oldest = redis.call("ZRANGE", key, 0, 0, "WITHSCORES")
+return {0, 0, tonumber(oldest[2]) + window - now}
+"""
+
+# KEYS[1]: 计数key  ARGV: 当前毫秒, 窗口毫秒, 桶容量; 每 window/limit 毫秒补充一个令牌
+_TOKEN_BUCKET_LUA = """
+local key = KEYS[1]
+local now = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local capacity = tonumber(ARGV[3])
+local rate = capacity / window
+local data = redis.call("HMGET", key, "tokens", "ts")
+local tokens = tonumber(data[1]) or capacity
+local ts = tonumber(data[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+else
+    wait = math.ceil((1 - tokens) / rate)
+end
+redis.call("HSET", key, "tokens", tostring(tokens), "ts", now)
+redis.call("PEXPIRE", key, window)
+return {allowed, math.floor(tokens), wait}
+"""
+
+
+@dataclass
+class RateLimitResult:
+    allowed: bool
+    limit: int
+    remaining: int
+    retry_after: float  # 秒
+
+
+class MemoryRateLimiter:
+    """进程内限流, 与 redis 脚本的算法一致"""
+
+    def __init__(self, maxsize: int = 100000):
+        self._windows = TTLCache(maxsize=maxsize)
+        self._buckets = TTLCache(maxsize=maxsize)
+
+    def hit(self, rule: RateLimitRule, key: str, now_ms: int) -> RateLimitResult:
+        window_ms = rule.window * 1000
+        if rule.algorithm == TOKEN_BUCKET:
+            rate = rule.limit / window_ms
+            tokens, ts = self._buckets.get(key, (float(rule.limit), now_ms))
+            tokens = min(rule.limit, tokens + max(0, now_ms - ts) * rate)
+            allowed = tokens >= 1
+            tokens = tokens - 1 if allowed else tokens
+            self._buckets.set(key, (tokens, now_ms), ttl=rule.window)
+            wait_ms = 0 if allowed else math.ceil((1 - tokens) / rate)
+            return RateLimitResult(allowed, rule.limit, math.floor(tokens), wait_ms / 1000)
+
+        hits: deque = self._windows.get(key)
+        if hits is None:
+            hits = deque()
+        while hits and hits[0] <= now_ms - window_ms:
+            hits.popleft()
+        if len(hits) < rule.limit:
+            hits.append(now_ms)
+            self._windows.set(key, hits, ttl=rule.window)
+            return RateLimitResult(True, rule.limit, rule.limit - len(hits), 0)
+        return RateLimitResult(False, rule.limit, 0, (hits[0] + window_ms - now_ms) / 1000)
+
+
+class RateLimiter:
+    def __init__(self, conf: RateLimitConfig, client: Optional[AsyncRedisClient]):
+        self.conf = conf
+        self.client = client
+        self.memory = MemoryRateLimiter()
+        self._scripts = {}
+        self._stats = {"allowed": 0, "rejected": 0, "redis_errors": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.conf.enabled and bool(self.conf.rules)
+
+    def match(self, method: str, path: str) -> List[RateLimitRule]:
+        """匹配请求的规则, path 以规则的 path 开头即匹配"""
+        return [
+            rule
+            for rule in self.conf.rules
+            if path.startswith(rule.path) and (not rule.methods or method in rule.methods)
+        ]
+
+    def metrics(self) -> dict:
+        return dict(self._stats)
+
+    async def hit(self, rule: RateLimitRule, identity: str) -> RateLimitResult:
+        key = f"{RATE_LIMIT_PREFIX}{rule.name}:{identity}"
+        now_ms = int(time.time() * 1000)
+        result = None
+        if self.client is not None:
+            try:
+                result = await self._redis_hit(rule, key, now_ms)
+            except Exception as e:
+                self._stats["redis_errors"] += 1
+                logger.error(f"rate limit redis error, fallback to memory: {e}")
+        if result is None:
+            result = self.memory.hit(rule, key, now_ms)
+        self._stats["allowed" if result.allowed else "rejected"] += 1
+        return result
+
+    async def _redis_hit(self, rule: RateLimitRule, key: str, now_ms: int) -> RateLimitResult:
+        script = self._scripts.get(rule.algorithm)
+        if script is None:
+            lua = _TOKEN_BUCKET_LUA if rule.algorithm == TOKEN_BUCKET else _SLIDING_WINDOW_LUA
+            script = self._scripts[rule.algorithm] = self.client.connection.register_script(lua)
+        args = [now_ms, rule.window * 1000, rule.limit]
+        if rule.algorithm != TOKEN_BUCKET:
+            args.append(f"{now_ms}-{uuid.uuid4().hex[:8]}")
+        allowed, remaining, wait_ms = await script(keys=[key], args=args)
+        return RateLimitResult(bool(allowed), rule.limit, int(remaining), int(wait_ms) / 1000)
+
+
+rate_limiter = RateLimiter(settings.rate_limit, async_redis_client)
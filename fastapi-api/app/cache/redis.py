@@ -1,185 +1,347 @@
-import pickle
-from typing import Dict
+import ast
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 
 import redis
+import redis.asyncio as aioredis
 from redis import ConnectionPool, RedisCluster
+from redis.asyncio.cluster import ClusterNode as AsyncClusterNode
+from redis.asyncio.cluster import RedisCluster as AsyncRedisCluster
+from redis.asyncio.retry import Retry as AsyncRetry
+from redis.asyncio.sentinel import Sentinel as AsyncSentinel
 from redis.backoff import ExponentialBackoff
 from redis.cluster import ClusterNode
 from redis.retry import Retry
 from redis.sentinel import Sentinel
 
-from app.settings import settings
+from app.cache.codec import Codec, CodecRegistry
+from app.settings import RedisConfig, settings
 from app.utils.logger import logger
+from app.utils.metrics import REDIS_COMMAND_SECONDS, observe_methods
+from app.utils.tracing import traced_methods
 
 
+# 值等于 token 时才删除, 保证只释放自己持有的租约
+_RELEASE_LEASE_LUA = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+def create_codecs(conf: RedisConfig) -> CodecRegistry:
+    """按配置创建编解码器: 默认编解码器 + 按 key 前缀指定的编解码器"""
+    codecs = CodecRegistry(Codec.from_spec(conf.codec, conf.compress_threshold))
+    for prefix, spec in conf.key_codecs.items():
+        codecs.register(prefix, Codec.from_spec(spec, conf.compress_threshold))
+    return codecs
+
+
+def _dumps(codecs: CodecRegistry, key: Any, value: Any, codec: Optional[Codec]) -> bytes:
+    codec = codec or codecs.get(key)
+    try:
+        return codec.encode(value)
+    except TypeError as exc:
+        raise TypeError(f"RedisCache could not encode the value with {codec.spec}. ") from exc
+
+
+def _loads(value: Optional[bytes]) -> Any:
+    return Codec.decode(value)
+
+
+def _parse_conf(conf: RedisConfig) -> Tuple[str, dict]:
+    """
+    解析 redis 配置, 返回 (mode, 连接参数)
+    url 为字符串时是单机模式, 为字典时按 mode 区分 sentinel(默认) / cluster
+    """
+    pool_kwargs = {
+        "socket_timeout": conf.socket_timeout,
+        "socket_connect_timeout": conf.socket_connect_timeout,
+        "health_check_interval": conf.health_check_interval,
+    }
+    if not isinstance(conf.url, dict):
+        return "single", pool_kwargs
+
+    redis_conf = dict(conf.url)
+    mode = redis_conf.pop("mode", "sentinel")
+    pool_kwargs.update(redis_conf)
+    if mode == "sentinel":
+        # sentinel_hosts 形如 ["('127.0.0.1', 26379)"]
+        pool_kwargs["sentinel_hosts"] = [
+            ast.literal_eval(x) if isinstance(x, str) else tuple(x) for x in pool_kwargs["sentinel_hosts"]
+        ]
+    return mode, pool_kwargs
+
+
+# 记录耗时的方法, 每个方法可能包含多条 redis 命令(如 pipeline)
+_OBSERVED_METHODS = [
+    "set", "setNx", "hsetkey", "hset", "get", "incr", "expire_key", "delete", "rpush", "publish", "exists"
+]
+_ASYNC_OBSERVED_METHODS = _OBSERVED_METHODS + ["acquire_lease", "release_lease", "mget", "mset"]
+
+
+@traced_methods(_OBSERVED_METHODS, "redis", **{"db.system": "redis"})
+@observe_methods(REDIS_COMMAND_SECONDS, _OBSERVED_METHODS, "command", client="sync")
 class RedisClient:
-    def __init__(self, url, max_connections=10):
-        # # 哨兵模式
-        if isinstance(settings.redis.url, Dict):
-            redis_conf = dict(settings.redis.url)
-            mode = redis_conf.pop("mode", "sentinel")
-            if mode == "cluster":
-                # 集群模式
-                cluster_url = ""
-                if "startup_nodes" in redis_conf:
-                    first_node = redis_conf["startup_nodes"][0]
-                    cluster_url = f"redis://{first_node['host']}:{first_node['port']}"
-                    redis_conf["startup_nodes"] = [
-                        ClusterNode(node.get("host"), node.get("port")) for node in redis_conf["startup_nodes"]
-                    ]
-                self.connection = RedisCluster.from_url(
-                    cluster_url, **redis_conf, retry=Retry(ExponentialBackoff(), 6), cluster_error_retry_attempts=1
-                )
-                return
-            hosts = [eval(x) for x in redis_conf.pop("sentinel_hosts")]
-            password = redis_conf.pop("sentinel_password")
-            master = redis_conf.pop("sentinel_master")
-            sentinel = Sentinel(sentinels=hosts, socket_timeout=0.1, password=password)
-            # 获取主节点的连接
-            self.connection = sentinel.master_for(master, socket_timeout=0.1, **redis_conf)
+    """
+    同步 redis 客户端, 供后台线程等同步代码使用, async 路由中请使用 AsyncRedisClient
+    连接由连接池长期持有, 集群模式由 RedisCluster 按 key 的 slot 路由到对应节点
+    """
 
+    def __init__(self, conf: RedisConfig):
+        self.codecs = create_codecs(conf)
+        mode, kwargs = _parse_conf(conf)
+        if mode == "cluster":
+            startup_nodes = [ClusterNode(node["host"], node["port"]) for node in kwargs.pop("startup_nodes")]
+            self.connection = RedisCluster(
+                startup_nodes=startup_nodes,
+                max_connections=conf.max_connections,
+                retry=Retry(ExponentialBackoff(), 6),
+                cluster_error_retry_attempts=1,
+                **kwargs,
+            )
+        elif mode == "sentinel":
+            hosts = kwargs.pop("sentinel_hosts")
+            password = kwargs.pop("sentinel_password", None)
+            master = kwargs.pop("sentinel_master")
+            sentinel = Sentinel(sentinels=hosts, socket_timeout=conf.socket_timeout, password=password)
+            # 获取主节点的连接
+            self.connection = sentinel.master_for(master, max_connections=conf.max_connections, **kwargs)
         else:
             # 单机模式
-            self.pool = ConnectionPool.from_url(url, max_connections=max_connections)
+            self.pool = ConnectionPool.from_url(conf.url, max_connections=conf.max_connections, **kwargs)
             self.connection = redis.StrictRedis(connection_pool=self.pool)
 
-    def set(self, key, value, expiration=3600):
-        try:
-            if pickled := pickle.dumps(value):
-                self.cluster_nodes(key)
-                result = self.connection.setex(key, expiration, pickled)
-                if not result:
-                    raise ValueError("RedisCache could not set the value.")
-            else:
-                logger.error("pickle error, value={}", value)
-        except TypeError as exc:
-            raise TypeError("RedisCache only accepts values that can be pickled. ") from exc
-        finally:
-            self.close()
-
-    def setNx(self, key, value, expiration=3600):
-        try:
-            if pickled := pickle.dumps(value):
-                self.cluster_nodes(key)
-                result = self.connection.setnx(key, pickled)
-                self.connection.expire(key, expiration)
-                if not result:
-                    return False
-                return True
-        except TypeError as exc:
-            raise TypeError("RedisCache only accepts values that can be pickled. ") from exc
-        finally:
-            self.close()
+    def set(self, key, value, expiration=3600, codec: Optional[Codec] = None):
+        result = self.connection.setex(key, expiration, _dumps(self.codecs, key, value, codec))
+        if not result:
+            raise ValueError("RedisCache could not set the value.")
+
+    def setNx(self, key, value, expiration=3600, codec: Optional[Codec] = None):
+        # SET NX EX 一条命令完成, 不会出现设置成功但没有过期时间的 key
+        result = self.connection.set(key, _dumps(self.codecs, key, value, codec), nx=True, ex=expiration)
+        return bool(result)
 
     def hsetkey(self, name, key, value, expiration=3600):
-        try:
-            self.cluster_nodes(key)
-            r = self.connection.hset(name, key, value)
-            if expiration:
-                self.connection.expire(name, expiration)
-            return r
-        finally:
-            self.close()
+        r = self.connection.hset(name, key, value)
+        if expiration:
+            self.connection.expire(name, expiration)
+        return r
 
     def hset(self, name, map: dict, expiration=3600):
-        try:
-            self.cluster_nodes(name)
-            r = self.connection.hset(name, mapping=map)
-            if expiration:
-                self.connection.expire(name, expiration)
-            return r
-        finally:
-            self.close()
+        r = self.connection.hset(name, mapping=map)
+        if expiration:
+            self.connection.expire(name, expiration)
+        return r
 
     def hget(self, name, key):
-        try:
-            self.cluster_nodes(name)
-            return self.connection.hget(name, key)
-        finally:
-            self.close()
+        # hset 写入的是原始值, 不经过编解码
+        return self.connection.hget(name, key)
 
     def get(self, key):
-        try:
-            self.cluster_nodes(key)
-            value = self.connection.get(key)
-            return pickle.loads(value) if value else None
-        finally:
-            self.close()
+        return _loads(self.connection.get(key))
 
     def incr(self, key, expiration=3600) -> int:
-        try:
-            self.cluster_nodes(key)
-            value = self.connection.incr(key)
-            if expiration:
-                self.connection.expire(key, expiration)
-            return value
-        finally:
-            self.close()
+        value = self.connection.incr(key)
+        if expiration:
+            self.connection.expire(key, expiration)
+        return value
 
     def expire_key(self, key, expiration: int):
-        try:
-            self.cluster_nodes(key)
-            self.connection.expire(key, expiration)
-        finally:
-            self.close()
+        self.connection.expire(key, expiration)
 
-    def delete(self, key):
-        try:
-            self.cluster_nodes(key)
-            return self.connection.delete(key)
-        finally:
-            self.close()
+    def delete(self, *keys):
+        return self.connection.delete(*keys) if keys else 0
 
     def rpush(self, key, value):
-        try:
-            self.cluster_nodes(key)
-            return self.connection.rpush(key, value)
-        finally:
-            self.close()
+        return self.connection.rpush(key, value)
 
     def publish(self, key, value):
-        try:
-            self.cluster_nodes(key)
-            return self.connection.publish(key, value)
-        finally:
-            self.close()
+        return self.connection.publish(key, value)
 
     def exists(self, key):
-        try:
-            self.cluster_nodes(key)
-            return self.connection.exists(key)
-        finally:
-            self.close()
+        return self.connection.exists(key)
 
     def close(self):
+        """关闭连接池, 只在进程退出时调用"""
         self.connection.close()
 
     def __contains__(self, key):
         """Check if the key is in the cache."""
-        self.cluster_nodes(key)
         return False if key is None else self.connection.exists(key)
 
     def __getitem__(self, key):
         """Retrieve an item from the cache using the square bracket notation."""
-        self.cluster_nodes(key)
         return self.connection.get(key)
 
     def __setitem__(self, key, value):
         """Add an item to the cache using the square bracket notation."""
-        self.cluster_nodes(key)
         self.connection.set(key, value)
 
     def __delitem__(self, key):
         """Remove an item from the cache using the square bracket notation."""
-        self.cluster_nodes(key)
         self.connection.delete(key)
 
-    def cluster_nodes(self, key):
-        if isinstance(self.connection, RedisCluster) and self.connection.get_default_node() is None:
-            target = self.connection.get_node_from_key(key)
-            self.connection.set_default_node(target)
+
+@traced_methods(_ASYNC_OBSERVED_METHODS, "redis", **{"db.system": "redis"})
+@observe_methods(REDIS_COMMAND_SECONDS, _ASYNC_OBSERVED_METHODS, "command", client="async")
+class AsyncRedisClient:
+    """
+    基于 redis.asyncio 的客户端, 连接池在进程内长期复用, 在 lifespan 结束时调用 close 释放
+    单机 / 哨兵 / 集群三种模式接口一致, 集群模式下多 key 命令按 slot 拆分到各节点执行
+    """
+
+    def __init__(self, conf: RedisConfig):
+        self.codecs = create_codecs(conf)
+        self._release_script = None
+        mode, kwargs = _parse_conf(conf)
+        self.mode = mode
+        if mode == "cluster":
+            startup_nodes = [AsyncClusterNode(node["host"], node["port"]) for node in kwargs.pop("startup_nodes")]
+            self.connection = AsyncRedisCluster(
+                startup_nodes=startup_nodes,
+                max_connections=conf.max_connections,
+                retry=AsyncRetry(ExponentialBackoff(), 6),
+                cluster_error_retry_attempts=1,
+                **kwargs,
+            )
+        elif mode == "sentinel":
+            hosts = kwargs.pop("sentinel_hosts")
+            password = kwargs.pop("sentinel_password", None)
+            master = kwargs.pop("sentinel_master")
+            sentinel = AsyncSentinel(sentinels=hosts, socket_timeout=conf.socket_timeout, password=password)
+            self.connection = sentinel.master_for(master, max_connections=conf.max_connections, **kwargs)
+        else:
+            self.connection = aioredis.from_url(conf.url, max_connections=conf.max_connections, **kwargs)
+
+    @property
+    def is_cluster(self) -> bool:
+        return self.mode == "cluster"
+
+    async def ping(self) -> bool:
+        return await self.connection.ping()
+
+    async def close(self):
+        """关闭连接池"""
+        await self.connection.aclose()
+
+    def pipeline(self, transaction: bool = False):
+        """
+        批量发送命令, 用法:
+            async with async_redis_client.pipeline() as pipe:
+                pipe.get("a").incr("b")
+                results = await pipe.execute()
+        集群模式不支持事务, 命令按 slot 分发到各节点后合并结果
+        """
+        if self.is_cluster:
+            return self.connection.pipeline()
+        return self.connection.pipeline(transaction=transaction)
+
+    async def get(self, key):
+        return _loads(await self.connection.get(key))
+
+    async def set(self, key, value, expiration=3600, codec: Optional[Codec] = None):
+        result = await self.connection.setex(key, expiration, _dumps(self.codecs, key, value, codec))
+        if not result:
+            raise ValueError("RedisCache could not set the value.")
+
+    async def setNx(self, key, value, expiration=3600, codec: Optional[Codec] = None) -> bool:
+        result = await self.connection.set(key, _dumps(self.codecs, key, value, codec), nx=True, ex=expiration)
+        return bool(result)
+
+    async def acquire_lease(self, key: str, token: str, ttl_ms: int) -> bool:
+        """SET key token NX PX ttl_ms, 获取成功返回 True, 租约到期自动释放"""
+        return bool(await self.connection.set(key, token, nx=True, px=ttl_ms))
+
+    async def release_lease(self, key: str, token: str) -> bool:
+        """只释放自己持有的租约, 避免租约过期后误删其它进程的租约"""
+        if self._release_script is None:
+            self._release_script = self.connection.register_script(_RELEASE_LEASE_LUA)
+        return bool(await self._release_script(keys=[key], args=[token]))
+
+    async def mget(self, keys: Iterable) -> List[Any]:
+        """批量读取, 不存在的 key 对应 None"""
+        keys = list(keys)
+        if not keys:
+            return []
+        if self.is_cluster:
+            values = await self.connection.mget_nonatomic(keys)
+        else:
+            values = await self.connection.mget(keys)
+        return [_loads(value) for value in values]
+
+    async def mset(self, mapping: Dict[Any, Any], expiration=3600, codec: Optional[Codec] = None):
+        """批量写入并设置过期时间, 一次往返"""
+        if not mapping:
+            return
+        async with self.pipeline() as pipe:
+            for key, value in mapping.items():
+                pipe.setex(key, expiration, _dumps(self.codecs, key, value, codec))
+            await pipe.execute()
+
+    async def hsetkey(self, name, key, value, expiration=3600):
+        async with self.pipeline() as pipe:
+            pipe.hset(name, key, value)
+            if expiration:
+                pipe.expire(name, expiration)
+            return (await pipe.execute())[0]
+
+    async def hset(self, name, map: dict, expiration=3600):
+        async with self.pipeline() as pipe:
+            pipe.hset(name, mapping=map)
+            if expiration:
+                pipe.expire(name, expiration)
+            return (await pipe.execute())[0]
+
+    async def hget(self, name, key):
+        # hset 写入的是原始值, 不经过编解码
+        return await self.connection.hget(name, key)
+
+    async def incr(self, key, expiration=3600) -> int:
+        async with self.pipeline() as pipe:
+            pipe.incr(key)
+            if expiration:
+                pipe.expire(key, expiration)
+            return (await pipe.execute())[0]
+
+    async def expire_key(self, key, expiration: int):
+        await self.connection.expire(key, expiration)
+
+    async def delete(self, *keys) -> int:
+        """删除一个或多个 key, 集群模式下由客户端按 slot 拆分"""
+        if not keys:
+            return 0
+        return await self.connection.delete(*keys)
+
+    async def rpush(self, key, value):
+        return await self.connection.rpush(key, value)
+
+    async def publish(self, key, value):
+        return await self.connection.publish(key, value)
+
+    async def exists(self, key):
+        return await self.connection.exists(key)
+
+
+# 未配置 redis 时为 None, 调用方需判断
+redis_client = RedisClient(settings.redis) if settings.redis else None
+async_redis_client = AsyncRedisClient(settings.redis) if settings.redis else None
+
+
+async def init_redis():
+    """应用启动时调用, 预先建立连接并检查 redis 是否可用"""
+    if not async_redis_client:
+        return
+    try:
+        await async_redis_client.ping()
+        logger.info(f"redis connected, mode={async_redis_client.mode}")
+    except Exception as e:
+        logger.error(f"redis connect failed: {e}")
 
 
-# 示例用法
-# redis_client = RedisClient(settings.redis.url)
-redis_client = None
+async def close_redis():
+    """应用退出时调用, 释放连接池"""
+    if async_redis_client:
+        await async_redis_client.close()
+    if redis_client:
+        redis_client.close()
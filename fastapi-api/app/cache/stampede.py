@@ -0,0 +1,266 @@
+# -*- coding:utf-8 -*-
+# @Author: H
+# @Date: 2025-10-20
+# @Version: 1.0
+# @License: H
+# @Desc: 缓存击穿保护: 进程内合并并发请求(single-flight) + 跨进程租约 + 提前刷新(XFetch) + 过期后先返回旧值
+"""
+用法:
+
+    from app.cache.stampede import cache_loader
+
+    data = await cache_loader.get_or_load("hot_images", lambda: load_hot_images(), ttl=60)
+
+缓存的值为 {"v": 值, "d": 上次计算耗时(秒), "e": 过期时间戳}, redis 中实际保留 ttl + stale_ttl 秒:
+    1. 同一进程内同一个 key 同时只有一个协程在读缓存/计算, 其它协程等待它的结果
+    2. 未过期时按 XFetch 以一定概率提前刷新, 计算越慢、越接近过期, 提前刷新的概率越大
+    3. 需要刷新时用 SET NX PX 抢租约, 只有抢到的进程重新计算;
+       已有旧值(提前刷新或处于 stale_ttl 内)时直接返回旧值, 在后台刷新
+    4. 没有旧值且没抢到租约时, 轮询等待其它进程写入, 超过 wait_timeout 后自己计算
+未配置 redis 时只做第 1 步
+
+缓存格式和失效由调用方自己管理时(dao 缓存的 L2、登录用户缓存), 在未命中后用 load_shared 只做第 3、4 步的租约和等待
+"""
+import asyncio
+import math
+import random
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+from app.cache.redis import AsyncRedisClient, async_redis_client
+from app.utils.logger import logger
+
+LEASE_PREFIX = "lease_"
+
+
+class SingleFlight:
+    """进程内合并同一个 key 的并发调用, 只有第一个调用真正执行, 其它调用等待并共享结果或异常"""
+
+    def __init__(self):
+        self._flights: Dict[str, asyncio.Future] = {}
+
+    async def do(self, key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        future = self._flights.get(key)
+        if future is not None:
+            # shield: 等待方被取消时不影响正在执行的调用
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._flights[key] = future
+        try:
+            result = await func()
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # 没有其它等待方时避免 "exception was never retrieved" 警告
+            future.exception()
+            raise
+        finally:
+            self._flights.pop(key, None)
+
+    def __len__(self):
+        return len(self._flights)
+
+
+def should_refresh_early(entry: dict, beta: float, now: Optional[float] = None) -> bool:
+    """
+    XFetch: now - delta * beta * ln(rand) >= expiry 时提前刷新
+    delta 为上次计算耗时, beta > 1 更倾向于提前刷新
+    """
+    now = time.time() if now is None else now
+    return now - entry["d"] * beta * math.log(1.0 - random.random()) >= entry["e"]
+
+
+class CacheLoader:
+    def __init__(
+        self,
+        client: Optional[AsyncRedisClient],
+        stale_ttl: int = 60,
+        beta: float = 1.0,
+        lease_ms: int = 10000,
+        wait_timeout: float = 3.0,
+    ):
+        """
+        :param client: redis 客户端, 为空时只做进程内合并
+        :param stale_ttl: 过期后仍可作为旧值返回的秒数
+        :param beta: XFetch 参数
+        :param lease_ms: 重新计算的租约毫秒数, 应大于计算耗时
+        :param wait_timeout: 没有旧值时等待其它进程计算结果的最长秒数
+        """
+        self.client = client
+        self.stale_ttl = stale_ttl
+        self.beta = beta
+        self.lease_ms = lease_ms
+        self.wait_timeout = wait_timeout
+        self._single_flight = SingleFlight()
+        self._background: Set[asyncio.Task] = set()
+        self._stats = {"hit": 0, "stale": 0, "early_refresh": 0, "load": 0, "wait": 0, "wait_timeout": 0}
+
+    def metrics(self) -> dict:
+        stats = dict(self._stats)
+        stats["in_flight"] = len(self._single_flight)
+        stats["background"] = len(self._background)
+        return stats
+
+    async def get_or_load(self, key: str, loader: Callable[[], Awaitable[Any]], ttl: int = 60) -> Any:
+        """
+        读取缓存, 需要时调用 loader 重新计算并写入
+        :param key: 缓存 key
+        :param loader: 无参数的异步函数, 返回要缓存的值
+        :param ttl: 缓存有效秒数
+        """
+        if self.client is None:
+            return await self._single_flight.do(key, loader)
+        return await self._single_flight.do(key, lambda: self._get_or_load(key, loader, ttl))
+
+    async def load_shared(
+        self,
+        key: str,
+        read: Callable[[], Awaitable[Optional[Any]]],
+        load: Callable[[], Awaitable[Any]],
+    ) -> Any:
+        """
+        缓存格式和过期由调用方管理时(如 dao 缓存的 L2、登录用户缓存)的跨进程合并, 在调用方缓存未命中后调用:
+        抢到租约的进程执行 load(由 load 写入缓存), 其它进程轮询 read 等待写入;
+        持有租约的进程结束但没有写入(记录不存在、load 失败)或超过 wait_timeout 时自己执行 load
+        不做提前刷新和旧值返回, 未配置 redis 时只做进程内合并
+        """
+        if self.client is None:
+            return await self._single_flight.do(key, load)
+        return await self._single_flight.do(key, lambda: self._load_shared(key, read, load))
+
+    async def delete(self, key: str):
+        if self.client is not None:
+            await self.client.delete(key)
+
+    async def _load_shared(
+        self,
+        key: str,
+        read: Callable[[], Awaitable[Optional[Any]]],
+        load: Callable[[], Awaitable[Any]],
+    ) -> Any:
+        token = await self._acquire(key)
+        if token:
+            try:
+                return await load()
+            finally:
+                await self._release(key, token)
+
+        self._stats["wait"] += 1
+        deadline = time.monotonic() + self.wait_timeout
+        delay = 0.02
+        while time.monotonic() < deadline:
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.2)
+            value = await read()
+            if value is not None:
+                return value
+            if not await self._leased(key):
+                break
+        else:
+            self._stats["wait_timeout"] += 1
+            logger.warning(f"cache loader wait timeout, load without lease: {key}")
+        return await load()
+
+    async def _get_or_load(self, key: str, loader: Callable[[], Awaitable[Any]], ttl: int) -> Any:
+        entry = await self._read(key)
+        now = time.time()
+        if entry is not None:
+            if entry["e"] > now and not should_refresh_early(entry, self.beta, now):
+                self._stats["hit"] += 1
+                return entry["v"]
+            # 提前刷新或已过期: 抢到租约的进程在后台刷新, 所有请求先返回旧值
+            self._stats["early_refresh" if entry["e"] > now else "stale"] += 1
+            token = await self._acquire(key)
+            if token:
+                task = asyncio.create_task(self._refresh(key, loader, ttl, token))
+                self._background.add(task)
+                task.add_done_callback(self._on_background_done)
+            return entry["v"]
+
+        token = await self._acquire(key)
+        if token:
+            return await self._refresh(key, loader, ttl, token)
+
+        # 其它进程正在计算, 等待其写入
+        self._stats["wait"] += 1
+        deadline = time.monotonic() + self.wait_timeout
+        delay = 0.02
+        while time.monotonic() < deadline:
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.2)
+            entry = await self._read(key)
+            if entry is not None:
+                return entry["v"]
+        self._stats["wait_timeout"] += 1
+        logger.warning(f"cache loader wait timeout, load without lease: {key}")
+        return await self._load(key, loader, ttl)
+
+    def _on_background_done(self, task: asyncio.Task):
+        self._background.discard(task)
+        # 异常已在 _refresh 中记录
+        if not task.cancelled():
+            task.exception()
+
+    async def _refresh(self, key: str, loader: Callable[[], Awaitable[Any]], ttl: int, token: str) -> Any:
+        try:
+            return await self._load(key, loader, ttl)
+        except Exception as e:
+            logger.error(f"cache loader refresh failed: {key} {e}")
+            raise
+        finally:
+            await self._release(key, token)
+
+    async def _load(self, key: str, loader: Callable[[], Awaitable[Any]], ttl: int) -> Any:
+        self._stats["load"] += 1
+        begin = time.time()
+        value = await loader()
+        delta = time.time() - begin
+        entry = {"v": value, "d": delta, "e": begin + delta + ttl}
+        try:
+            await self.client.set(key, entry, ttl + self.stale_ttl)
+        except Exception as e:
+            logger.error(f"cache loader write failed: {key} {e}")
+        return value
+
+    async def _read(self, key: str) -> Optional[dict]:
+        try:
+            entry = await self.client.get(key)
+        except Exception as e:
+            logger.error(f"cache loader read failed: {key} {e}")
+            return None
+        if isinstance(entry, dict) and {"v", "d", "e"} <= entry.keys():
+            return entry
+        return None
+
+    async def _acquire(self, key: str) -> Optional[str]:
+        token = uuid.uuid4().hex
+        try:
+            if await self.client.acquire_lease(LEASE_PREFIX + key, token, self.lease_ms):
+                return token
+        except Exception as e:
+            # redis 不可用时视为抢到租约, 由当前进程计算
+            logger.error(f"cache loader acquire lease failed: {key} {e}")
+            return token
+        return None
+
+    async def _release(self, key: str, token: str):
+        try:
+            await self.client.release_lease(LEASE_PREFIX + key, token)
+        except Exception as e:
+            logger.error(f"cache loader release lease failed: {key} {e}")
+
+    async def _leased(self, key: str) -> bool:
+        try:
+            return bool(await self.client.exists(LEASE_PREFIX + key))
+        except Exception as e:
+            logger.error(f"cache loader check lease failed: {key} {e}")
+            return False
+
+
+cache_loader = CacheLoader(async_redis_client)
@@ -8,3 +8,23 @@
 # redis key
 CAPTCHA_PREFIX = "cap_"
 PAGE_SIZE = 10
+
+# 登录用户缓存, 用户被踢下线后最多 LOGIN_USER_CACHE_TTL 秒内仍可能在其它进程命中旧缓存
+LOGIN_USER_PREFIX = "login_user_"
+LOGIN_USER_CACHE_TTL = 30
+LOGIN_USER_CACHE_SIZE = 10000
+
+# dao 主键缓存 key 前缀, 完整 key 为 dao_{表名}:{主键}
+DAO_CACHE_PREFIX = "dao_"
+
+# 流式上传: 分片大小(COS 分块上传要求除最后一块外不小于1MB), 解析图片宽高时读取的头部字节数
+UPLOAD_CHUNK_SIZE = 5 * 1024 * 1024
+IMAGE_HEADER_SNIFF_SIZE = 64 * 1024
+
+# COS 批量删除(DeleteObjects)单次请求最多的对象数
+COS_BATCH_DELETE_SIZE = 1000
+
+# 图片去重复用COS对象与释放COS对象之间的互斥锁(redis 租约), 完整 key 为 img_obj_lock_{cos_key}
+IMAGE_OBJECT_LOCK_PREFIX = "img_obj_lock_"
+IMAGE_OBJECT_LOCK_TTL_MS = 30 * 1000
+IMAGE_OBJECT_LOCK_WAIT = 10
@@ -1,6 +1,15 @@
 from contextvars import ContextVar
+from datetime import datetime
+from typing import Optional
 
 trace_id_ctx = ContextVar("trace_id", default="")
+# 当前请求的 INFO 及以下日志是否被采样输出, 请求之外(启动、后台线程)默认输出
+log_sampled_ctx = ContextVar("log_sampled", default=True)
+# 当前请求响应数据的验证器(如 last_modified), 由 ConditionalRoute 在每个请求中设置为新的 dict;
+# 同步接口在线程池中执行时 contextvar 是复制的, 因此写入 dict 而不是重新 set
+response_validators_ctx: ContextVar[Optional[dict]] = ContextVar("response_validators", default=None)
+# 当前请求的批量加载器(app.db.loader), 每个请求一个新的 dict, 请求之外为 None, 不做批量合并
+request_loaders_ctx: ContextVar[Optional[dict]] = ContextVar("request_loaders", default=None)
 
 
 def set_trace_id(trace_id: str = ""):
@@ -11,6 +20,23 @@ def get_trace_id():
     return trace_id_ctx.get()
 
 
+def set_log_sampled(sampled: bool = True):
+    return log_sampled_ctx.set(sampled)
+
+
+def get_log_sampled() -> bool:
+    return log_sampled_ctx.get()
+
+
 def set_request_context_var(**kwargs):
     trace_id = kwargs.get("trace_id", "")
     set_trace_id(trace_id)
+    set_log_sampled(kwargs.get("log_sampled", True))
+    request_loaders_ctx.set({})
+
+
+def set_last_modified(last_modified: datetime):
+    """记录当前响应数据的最后修改时间, 不在 ConditionalRoute 的请求中时忽略"""
+    validators = response_validators_ctx.get()
+    if validators is not None:
+        validators["last_modified"] = last_modified
@@ -0,0 +1,225 @@
+# -*- coding:utf-8 -*-
+# @Author: H
+# @Date: 2025-10-20
+# @Version: 1.0
+# @License: H
+# @Desc: dao 的异步版本, 基于 AsyncSession, 供 async def 路由使用, 接口与 app.db.dao 保持一致
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Type, TypeVar
+
+from sqlalchemy import text
+from sqlalchemy.sql import Select
+from sqlmodel import SQLModel, select
+
+from app.constants import PAGE_SIZE
+from app.db.base import async_session_getter, db_service
+from app.db.cache import cached_select, dao_cache, pk_column
+from app.db.loader import batched_select
+from app.db.pagination import (
+    COUNT_EXACT,
+    CountMode,
+    count_statement,
+    decode_cursor,
+    encode_cursor,
+    keyset_clause,
+    order_clauses,
+    order_columns,
+)
+from app.utils.logger import logger
+
+T = TypeVar("T", bound=SQLModel)
+
+
+# 增删查改
+async def insert(obj: T) -> T:
+    async with async_session_getter() as session:
+        session.add(obj)
+        await session.commit()
+        await session.refresh(obj)
+    await dao_cache.ainvalidate(dao_cache.keys_for_objects([obj]))
+    return obj
+
+
+async def insert_bulk(obj_list: list[T]) -> None:
+    async with async_session_getter() as session:
+        await session.run_sync(lambda sync_session: sync_session.bulk_save_objects(obj_list))
+        await session.commit()
+    await dao_cache.ainvalidate(dao_cache.keys_for_objects(obj_list))
+
+
+async def update(model: Type[T], obj: T) -> T:
+    async with async_session_getter() as session:
+        # 将 Pydantic 对象转换为 SQLModel 对象
+        db_obj = model(**obj.model_dump())
+        # 使用 merge 来更新数据库中的对象
+        db_obj = await session.merge(db_obj)
+
+        await session.commit()
+        await session.refresh(db_obj)
+    await dao_cache.ainvalidate(dao_cache.keys_for_objects([db_obj]))
+    return db_obj
+
+
+async def update_where(model: Type[T], values: Dict[str, Any], *whereclause) -> int:
+    """按条件批量更新, 一条 UPDATE 语句, 返回影响行数"""
+    async with async_session_getter() as session:
+        keys = await dao_cache.aaffected_keys(session, model, whereclause)
+        query = model.__table__.update().where(*whereclause).values(**values)
+        result = await session.execute(query)
+        await session.commit()
+    await dao_cache.ainvalidate(keys)
+    return result.rowcount
+
+
+async def delete(model: Type[T], *whereclause) -> int:
+    async with async_session_getter() as session:
+        keys = await dao_cache.aaffected_keys(session, model, whereclause)
+        query = model.__table__.delete().where(*whereclause)
+        result = await session.execute(query)
+        await session.commit()
+    await dao_cache.ainvalidate(keys)
+    return result.rowcount
+
+
+async def execute(query: Select) -> Any:
+    async with async_session_getter() as session:
+        return (await session.exec(query)).all()
+
+
+async def select_by_pks(model: Type[T], pks: Iterable[Any]) -> Dict[Any, T]:
+    """
+    按主键批量查询, 返回 主键 -> 对象, 不存在的主键不在结果中
+    先读 dao 缓存(L1 + 一次 MGET), 未命中的主键一次 IN 查询, 查询结果写回缓存
+    """
+    data = await select_data_by_pks(model, pks)
+    return {pk: model.model_validate(value) for pk, value in data.items()}
+
+
+async def select_data_by_pks(model: Type[T], pks: Iterable[Any]) -> Dict[Any, dict]:
+    """select_by_pks 返回 model_dump() 字典的版本, 结果的 key 为传入的主键值"""
+    pks = list(dict.fromkeys(pk for pk in pks if pk is not None))
+    if not pks:
+        return {}
+    column = pk_column(model)
+    if column is None:
+        raise ValueError(f"{model.__name__} has no single-column primary key")
+
+    result = {}
+    keys = {pk: dao_cache.key(model, pk) for pk in pks} if dao_cache.enabled else {}
+    if keys:
+        cached = await dao_cache.aget_many(list(keys.values()))
+        result = {pk: cached[key] for pk, key in keys.items() if key in cached}
+    missing = [pk for pk in pks if pk not in result]
+    if not missing:
+        return result
+
+    # 数据库返回的主键类型可能与传入的不同(如传入字符串), 按字符串对应回传入的值
+    by_str = {str(pk): pk for pk in missing}
+    loaded = {}
+    async with async_session_getter() as session:
+        rows = (await session.exec(select(model).where(column.in_(missing)))).all()
+    for row in rows:
+        pk = by_str.get(str(getattr(row, column.key)))
+        if pk is None:
+            continue
+        result[pk] = row.model_dump()
+        if keys:
+            loaded[keys[pk]] = result[pk]
+    await dao_cache.aset_many(loaded)
+    return result
+
+
+@batched_select(select_data_by_pks)
+@cached_select
+async def select_one(model: Type[T], *whereclause) -> T:
+    return await select_one_fresh(model, *whereclause)
+
+
+async def select_one_fresh(model: Type[T], *whereclause) -> T:
+    """
+    不经过 dao 缓存和批量加载, 直接查询数据库
+    读出后修改再整行 update 的写路径使用, 避免把其它进程缓存中的旧数据写回
+    """
+    async with async_session_getter() as session:
+        query: Select = select(model)
+        query = query.where(*whereclause)
+        return (await session.exec(query)).first()
+
+
+async def select_all(model: Type[T], *whereclause, order_by: Optional[List[Any]] = None) -> List[T]:
+    async with async_session_getter() as session:
+        query: Select = select(model)
+        query = query.where(*whereclause)
+        if order_by:
+            query = query.order_by(*order_by)
+        return (await session.exec(query)).all()
+
+
+async def select_page(
+    model: Type[T],
+    page: int = 1,
+    page_size: int = PAGE_SIZE,
+    *whereclause,
+    order_by: Optional[List[Any]] = None,
+    count: CountMode = COUNT_EXACT,
+) -> Tuple:
+    """分页查询"""
+    async with async_session_getter() as session:
+        offset = (page - 1) * page_size
+        limit = page_size
+
+        query = select(model)
+        query = query.where(*whereclause)
+
+        if order_by:
+            query = query.order_by(*order_by)
+
+        count_query = count_statement(model, query, bool(whereclause), db_service.engine.dialect.name, count)
+        total = await session.scalar(count_query) if count_query is not None else None
+        data = (await session.exec(query.offset(offset).limit(limit))).all()
+
+        return data, {"page_num": page, "page_size": page_size, "total_size": total}
+
+
+async def select_cursor_page(
+    model: Type[T],
+    *whereclause,
+    cursor: Optional[str] = None,
+    page_size: int = PAGE_SIZE,
+    order_by: Optional[List[Any]] = None,
+    count: CountMode = COUNT_EXACT,
+) -> Tuple:
+    """游标(keyset)分页, 参见 app.db.dao.select_cursor_page"""
+    columns = order_columns(model, order_by)
+    async with async_session_getter() as session:
+        query = select(model).where(*whereclause)
+        count_query = count_statement(model, query, bool(whereclause), db_service.engine.dialect.name, count)
+        total = await session.scalar(count_query) if count_query is not None else None
+
+        if cursor:
+            query = query.where(keyset_clause(columns, decode_cursor(cursor, columns)))
+        # 多取一条用于判断是否还有下一页
+        data = (await session.exec(query.order_by(*order_clauses(columns)).limit(page_size + 1))).all()
+
+        next_cursor = None
+        if len(data) > page_size:
+            data = data[:page_size]
+            next_cursor = encode_cursor(data[-1], columns)
+        return data, {"page_size": page_size, "total_size": total, "next_cursor": next_cursor}
+
+
+# --------------------------SQL CRUD
+## input: string sql
+## output : dictionary
+async def select_sql(sql: str) -> List[Any]:
+    logger.info(sql)
+    async with async_session_getter() as session:
+        rows = (await session.execute(text(sql))).fetchall()
+        return rows
+
+
+async def execute_sql(sql: str) -> int:
+    logger.info(sql)
+    async with async_session_getter() as session:
+        result = await session.execute(text(sql))
+        await session.commit()
+        return result.rowcount
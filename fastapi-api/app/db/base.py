@@ -7,9 +7,11 @@
 import os
 import traceback
 import uuid
-from contextlib import contextmanager
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator
 
 from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from app.db.service import DatabaseService
 from app.settings import settings
@@ -32,6 +34,20 @@ def session_getter() -> Session:
         session.close()
 
 
+@asynccontextmanager
+async def async_session_getter() -> AsyncIterator[AsyncSession]:
+    """轻量级异步session context, 不阻塞事件循环"""
+    session = AsyncSession(db_service.async_engine, expire_on_commit=False)
+    try:
+        yield session
+    except Exception:
+        logger.info(f"Async session rollback because of exception:{traceback.format_exc()}")
+        await session.rollback()
+        raise
+    finally:
+        await session.close()
+
+
 def read_from_conf(file_path: str) -> str:
     if "/" not in file_path:
         # Get current path
@@ -0,0 +1,308 @@
+# -*- coding:utf-8 -*-
+# @Author: H
+# @Date: 2025-10-20
+# @Version: 1.0
+# @License: H
+# @Desc: dao 按主键读取的两级缓存: 进程内 LRU(L1) + redis(L2), 写操作后失效, 通过 redis 发布订阅通知其它进程
+"""
+只缓存 where 条件恰好为 "主键 == 值" 的 select_one, 例如 select_one(Image, Image.id == image_id)
+缓存 key 为 dao_{表名}:{主键}, 值为 model_dump() 字典, 命中时每次构造新的对象返回
+
+dao / async_dao 的 insert / insert_bulk / update / update_where / delete 在提交后调用 invalidate,
+删除 L1、L2 中对应的 key, 并发布到 settings.dao_cache.channel, 其它进程收到后删除各自的 L1
+
+L2 未命中时通过 cache_loader.load_shared 抢租约, 多个进程同时未命中同一主键时只有一个进程查询数据库
+
+一致性: 并发读写时, 读到旧数据的请求可能在失效之后写回缓存, 最多持续到 TTL 过期;
+未配置 redis 时只有 L1, 多进程部署下其它进程最多在 l1_ttl 秒内读到旧数据
+"""
+import functools
+import inspect
+import uuid
+from typing import Any, Dict, Iterable, List, Optional, Type
+
+import orjson
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.elements import BinaryExpression, BindParameter
+from sqlmodel import SQLModel, select
+
+from app.cache.local import TTLCache
+from app.cache.pubsub import redis_subscriber
+from app.cache.redis import async_redis_client, redis_client
+from app.cache.stampede import SingleFlight, cache_loader
+from app.constants import DAO_CACHE_PREFIX
+from app.settings import DaoCacheConfig, settings
+from app.utils.logger import logger
+
+
+def pk_column(model: Type[SQLModel]):
+    """单列主键返回主键列, 复合主键不缓存"""
+    columns = list(model.__table__.primary_key.columns)
+    return columns[0] if len(columns) == 1 else None
+
+
+def pk_values(model: Type[SQLModel], whereclause: tuple) -> Optional[List[Any]]:
+    """
+    where 条件只有 "主键 == 值" 或 "主键 IN (...)" 时返回主键值列表, 否则返回 None
+    """
+    pk = pk_column(model)
+    if pk is None or len(whereclause) != 1:
+        return None
+    expr = whereclause[0]
+    if not isinstance(expr, BinaryExpression) or not isinstance(expr.right, BindParameter):
+        return None
+    left = expr.left
+    if getattr(left, "table", None) is not model.__table__ or left.key != pk.key:
+        return None
+    if expr.operator is operators.eq:
+        return [expr.right.value]
+    if expr.operator is operators.in_op and expr.right.expanding:
+        return list(expr.right.value)
+    return None
+
+
+def single_pk_value(model: Type[SQLModel], whereclause: tuple) -> Optional[Any]:
+    """where 条件恰好为 "主键 == 值" 时返回该值, 否则返回 None"""
+    values = pk_values(model, whereclause)
+    if not values or len(values) != 1 or whereclause[0].operator is not operators.eq:
+        return None
+    return values[0]
+
+
+class DaoCache:
+    def __init__(self, conf: DaoCacheConfig):
+        self.conf = conf
+        self.local = TTLCache(maxsize=conf.l1_size, ttl=conf.l1_ttl)
+        # 区分消息来源, 忽略自己发布的失效消息
+        self.instance_id = uuid.uuid4().hex
+        self._stats = {"l1_hit": 0, "l2_hit": 0, "miss": 0, "invalidated": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.conf.enabled
+
+    def key(self, model: Type[SQLModel], pk: Any) -> str:
+        return f"{DAO_CACHE_PREFIX}{model.__tablename__}:{pk}"
+
+    def key_for(self, model: Type[SQLModel], whereclause: tuple) -> Optional[str]:
+        """可以缓存的查询返回缓存 key, 否则返回 None"""
+        if not self.enabled:
+            return None
+        value = single_pk_value(model, whereclause)
+        return self.key(model, value) if value is not None else None
+
+    def affected_keys(self, session, model: Type[SQLModel], whereclause: tuple) -> List[str]:
+        """
+        update_where / delete 影响的缓存 key, 在执行写操作之前、同一个 session 中调用
+        where 条件不是主键时先查询出受影响的主键
+        """
+        if not self.enabled or pk_column(model) is None:
+            return []
+        values = pk_values(model, whereclause)
+        if values is None:
+            values = session.exec(select(pk_column(model)).where(*whereclause)).all()
+        return [self.key(model, value) for value in values]
+
+    async def aaffected_keys(self, session, model: Type[SQLModel], whereclause: tuple) -> List[str]:
+        """affected_keys 的异步版本"""
+        if not self.enabled or pk_column(model) is None:
+            return []
+        values = pk_values(model, whereclause)
+        if values is None:
+            values = (await session.exec(select(pk_column(model)).where(*whereclause))).all()
+        return [self.key(model, value) for value in values]
+
+    def keys_for_objects(self, objs: Iterable[SQLModel]) -> List[str]:
+        keys = []
+        for obj in objs:
+            pk = pk_column(type(obj))
+            value = getattr(obj, pk.key, None) if pk is not None else None
+            if value is not None:
+                keys.append(self.key(type(obj), value))
+        return keys
+
+    def metrics(self) -> dict:
+        stats = dict(self._stats)
+        stats["l1_size"] = len(self.local)
+        return stats
+
+    # 读
+    def get(self, key: str) -> Optional[dict]:
+        data = self.local.get(key)
+        if data is not None:
+            self._stats["l1_hit"] += 1
+            return data
+        if redis_client:
+            data = self._safe(redis_client.get, key)
+            if data is not None:
+                self._stats["l2_hit"] += 1
+                self.local.set(key, data)
+                return data
+        self._stats["miss"] += 1
+        return None
+
+    async def aget(self, key: str) -> Optional[dict]:
+        data = self.local.get(key)
+        if data is not None:
+            self._stats["l1_hit"] += 1
+            return data
+        if async_redis_client:
+            data = await self._asafe(async_redis_client.get, key)
+            if data is not None:
+                self._stats["l2_hit"] += 1
+                self.local.set(key, data)
+                return data
+        self._stats["miss"] += 1
+        return None
+
+    async def aget_remote(self, key: str) -> Optional[dict]:
+        """只读 L2, 等待其它进程写入时轮询使用, 未命中不计入统计"""
+        if not async_redis_client:
+            return None
+        data = await self._asafe(async_redis_client.get, key)
+        if data is not None:
+            self._stats["l2_hit"] += 1
+            self.local.set(key, data)
+        return data
+
+    async def aget_many(self, keys: List[str]) -> Dict[str, dict]:
+        """批量读取, 返回命中的 key -> 数据; L1 未命中的 key 通过一次 MGET 读取 L2"""
+        result, missing = {}, []
+        for key in keys:
+            data = self.local.get(key)
+            if data is not None:
+                result[key] = data
+            else:
+                missing.append(key)
+        self._stats["l1_hit"] += len(result)
+        if missing and async_redis_client:
+            values = await self._asafe(async_redis_client.mget, missing) or []
+            for key, data in zip(missing, values):
+                if data is not None:
+                    self._stats["l2_hit"] += 1
+                    self.local.set(key, data)
+                    result[key] = data
+        self._stats["miss"] += len(keys) - len(result)
+        return result
+
+    # 写
+    def set(self, key: str, data: dict):
+        self.local.set(key, data)
+        if redis_client:
+            self._safe(redis_client.set, key, data, self.conf.l2_ttl)
+
+    async def aset(self, key: str, data: dict):
+        self.local.set(key, data)
+        if async_redis_client:
+            await self._asafe(async_redis_client.set, key, data, self.conf.l2_ttl)
+
+    async def aset_many(self, mapping: Dict[str, dict]):
+        for key, data in mapping.items():
+            self.local.set(key, data)
+        if mapping and async_redis_client:
+            await self._asafe(async_redis_client.mset, mapping, self.conf.l2_ttl)
+
+    # 失效
+    def invalidate(self, keys: List[str]):
+        if not self.enabled or not keys:
+            return
+        self._invalidate_local(keys)
+        if redis_client:
+            self._safe(redis_client.delete, *keys)
+            self._safe(redis_client.publish, self.conf.channel, self._message(keys))
+
+    async def ainvalidate(self, keys: List[str]):
+        if not self.enabled or not keys:
+            return
+        self._invalidate_local(keys)
+        if async_redis_client:
+            await self._asafe(async_redis_client.delete, *keys)
+            await self._asafe(async_redis_client.publish, self.conf.channel, self._message(keys))
+
+    def on_message(self, data: bytes):
+        """处理其它进程发布的失效消息"""
+        message = orjson.loads(data)
+        if message.get("src") != self.instance_id:
+            self._invalidate_local(message.get("keys", []))
+
+    def _invalidate_local(self, keys: List[str]):
+        for key in keys:
+            self.local.delete(key)
+        self._stats["invalidated"] += len(keys)
+
+    def _message(self, keys: List[str]) -> bytes:
+        return orjson.dumps({"src": self.instance_id, "keys": keys})
+
+    # redis 不可用时退化为只用 L1, 不影响数据库读写
+    @staticmethod
+    def _safe(func, *args):
+        try:
+            return func(*args)
+        except Exception as e:
+            logger.error(f"dao cache redis error: {e}")
+            return None
+
+    @staticmethod
+    async def _asafe(func, *args):
+        try:
+            return await func(*args)
+        except Exception as e:
+            logger.error(f"dao cache redis error: {e}")
+            return None
+
+
+dao_cache = DaoCache(settings.dao_cache)
+# 同一进程内同一主键并发未命中时只查询一次数据库
+_single_flight = SingleFlight()
+if redis_subscriber and dao_cache.enabled:
+    redis_subscriber.subscribe(settings.dao_cache.channel, dao_cache.on_message)
+
+
+def cached_select(func):
+    """
+    select_one 的读穿透缓存装饰器, 支持同步和异步函数
+    被装饰函数的签名须为 (model, *whereclause)
+    """
+    if inspect.iscoroutinefunction(func):
+
+        @functools.wraps(func)
+        async def async_wrapper(model: Type[SQLModel], *whereclause):
+            key = dao_cache.key_for(model, whereclause)
+            if key is None:
+                return await func(model, *whereclause)
+
+            async def query():
+                obj = await func(model, *whereclause)
+                if obj is None:
+                    return None
+                data = obj.model_dump()
+                await dao_cache.aset(key, data)
+                return data
+
+            async def load():
+                data = await dao_cache.aget(key)
+                if data is not None:
+                    return data
+                # L2 也未命中: 多个进程同时未命中时只有抢到租约的进程查询数据库, 其它进程等待其写入 L2
+                return await cache_loader.load_shared(key, lambda: dao_cache.aget_remote(key), query)
+
+            # 合并后的调用共享同一份数据, 各自构造新的对象
+            data = await _single_flight.do(key, load)
+            return model.model_validate(data) if data is not None else None
+
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(model: Type[SQLModel], *whereclause):
+        key = dao_cache.key_for(model, whereclause)
+        if key is None:
+            return func(model, *whereclause)
+        data = dao_cache.get(key)
+        if data is not None:
+            return model.model_validate(data)
+        obj = func(model, *whereclause)
+        if obj is not None:
+            dao_cache.set(key, obj.model_dump())
+        return obj
+
+    return wrapper
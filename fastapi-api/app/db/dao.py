@@ -11,7 +11,18 @@ from sqlalchemy.sql import Select
 from sqlalchemy.sql.functions import func
 from sqlalchemy import text
 
-from app.db.base import session_getter
+from app.db.base import db_service, session_getter
+from app.db.cache import cached_select, dao_cache
+from app.db.pagination import (
+    COUNT_EXACT,
+    CountMode,
+    count_statement,
+    decode_cursor,
+    encode_cursor,
+    keyset_clause,
+    order_clauses,
+    order_columns,
+)
 from app.utils.logger import logger
 from app.constants import PAGE_SIZE
 
@@ -23,13 +34,15 @@ def insert(obj: T) -> T:
         session.add(obj)
         session.commit()
         session.refresh(obj)
-        return obj
+    dao_cache.invalidate(dao_cache.keys_for_objects([obj]))
+    return obj
 
 # 增删查改  
 def insert_bulk(obj_list: list[T]) -> T:
     with session_getter () as session:
         session.bulk_save_objects(obj_list)
         session.commit()
+    dao_cache.invalidate(dao_cache.keys_for_objects(obj_list))
         
 def update(model: Type[T], obj: T) -> T:
     with session_getter () as session:
@@ -40,21 +53,35 @@ def update(model: Type[T], obj: T) -> T:
 
         session.commit()
         session.refresh(db_obj)
-        return db_obj
+    dao_cache.invalidate(dao_cache.keys_for_objects([db_obj]))
+    return db_obj
+
+def update_where(model: Type[T], values: Dict[str, Any], *whereclause) -> int:
+    """按条件批量更新, 一条 UPDATE 语句, 返回影响行数"""
+    with session_getter () as session:
+        keys = dao_cache.affected_keys(session, model, whereclause)
+        query = model.__table__.update().where(*whereclause).values(**values)
+        result = session.exec(query)
+        session.commit()
+    dao_cache.invalidate(keys)
+    return result.rowcount
 
 def delete(model: Type[T],  *whereclause) -> int:
     with session_getter () as session:
+        keys = dao_cache.affected_keys(session, model, whereclause)
         query: Select = select(model)
         query = model.__table__.delete()
         query = query.where(*whereclause)
         result = session.exec(query)
         session.commit()
-        return result.rowcount
+    dao_cache.invalidate(keys)
+    return result.rowcount
 
 def exeute(query: Select) -> Any:
     with session_getter () as session:
         return session.exec(query).all()
 
+@cached_select
 def select_one(model: Type[T], *whereclause) -> T:
     with session_getter () as session:
         query: Select = select(model)
@@ -69,7 +96,7 @@ def select_all(model: Type[T], *whereclause, order_by: Optional[List[Any]] = Non
             query = query.order_by(*order_by)
         return session.exec(query).all()
 
-def select_page(model: Type[T], page: int = 1, page_size: int = PAGE_SIZE, *whereclause, order_by: Optional[List[Any]] = None) -> Tuple:
+def select_page(model: Type[T], page: int = 1, page_size: int = PAGE_SIZE, *whereclause, order_by: Optional[List[Any]] = None, count: CountMode = COUNT_EXACT) -> Tuple:
     with session_getter() as session:
         """分页查询"""
         offset = (page - 1) * page_size
@@ -81,12 +108,36 @@ def select_page(model: Type[T], page: int = 1, page_size: int = PAGE_SIZE, *wher
         if order_by:
             query = query.order_by(*order_by)
 
-        total = session.exec(select(func.count()).select_from(query.subquery())).one()
+        count_query = count_statement(model, query, bool(whereclause), db_service.engine.dialect.name, count)
+        total = session.scalar(count_query) if count_query is not None else None
         data = session.exec(query.offset(offset).limit(limit)).all()
         
         # paginated_data, total, current_page, total_pages 
         return data, {"page_num": page, "page_size": page_size, "total_size": total}
 
+def select_cursor_page(model: Type[T], *whereclause, cursor: Optional[str] = None, page_size: int = PAGE_SIZE, order_by: Optional[List[Any]] = None, count: CountMode = COUNT_EXACT) -> Tuple:
+    """
+    游标(keyset)分页, 按 order_by 列的值定位下一页, 不使用 OFFSET, 深度翻页耗时不随页码增长
+    :param cursor: 上一页返回的 next_cursor, 为空表示第一页
+    :return: data, {"page_size", "total_size", "next_cursor"}, next_cursor 为 None 表示没有下一页
+    """
+    columns = order_columns(model, order_by)
+    with session_getter() as session:
+        query = select(model).where(*whereclause)
+        count_query = count_statement(model, query, bool(whereclause), db_service.engine.dialect.name, count)
+        total = session.scalar(count_query) if count_query is not None else None
+
+        if cursor:
+            query = query.where(keyset_clause(columns, decode_cursor(cursor, columns)))
+        # 多取一条用于判断是否还有下一页
+        data = session.exec(query.order_by(*order_clauses(columns)).limit(page_size + 1)).all()
+
+        next_cursor = None
+        if len(data) > page_size:
+            data = data[:page_size]
+            next_cursor = encode_cursor(data[-1], columns)
+        return data, {"page_size": page_size, "total_size": total, "next_cursor": next_cursor}
+
 
 #--------------------------SQL CRUD
 ## input: string sql
@@ -0,0 +1,113 @@
+# -*- coding:utf-8 -*-
+# @Author: H
+# @Date: 2025-10-20
+# @Version: 1.0
+# @License: H
+# @Desc: 请求内批量加载(DataLoader): 合并同一请求中并发的按主键查询
+"""
+async_dao.select_one 被 batched_select 装饰, 请求内 where 条件为 "主键 == 值" 的调用交给该请求、该模型的 BatchLoader:
+同一轮事件循环中发起的 load 合并为一次 async_dao.select_data_by_pks(先读 dao 缓存, 未命中的主键一次 IN 查询)
+
+    users = await asyncio.gather(*(async_dao.select_one(User, User.id == user_id) for user_id in user_ids))
+
+上例只执行一次 IN 查询; 依次 await 的调用之间没有并发, 各自查询(仍会命中 dao 缓存)
+加载器保存在 request_loaders_ctx 中, 由 CustomMiddleware 在每个请求开始时重置, 请求之外(后台任务、脚本)不合并
+加载器不缓存结果, 请求内先写后读不会读到旧数据
+"""
+import asyncio
+import functools
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Type
+
+from sqlmodel import SQLModel
+
+from app.context import request_loaders_ctx
+from app.db.cache import single_pk_value
+from app.settings import settings
+
+BatchFunction = Callable[[List[Any]], Awaitable[Dict[Any, Any]]]
+
+
+class BatchLoader:
+    """同一轮事件循环中的 load(key) 合并为一次 batch_fn(keys), batch_fn 返回 key -> 值, 缺少的 key 得到 None"""
+
+    def __init__(self, batch_fn: BatchFunction, max_batch_size: int = 500):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self._pending: Dict[Any, asyncio.Future] = {}
+        self._tasks = set()
+        self._stats = {"loads": 0, "batches": 0}
+
+    async def load(self, key: Any) -> Optional[Any]:
+        self._stats["loads"] += 1
+        future = self._pending.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            # 当前这一轮中已就绪的任务都执行到各自的 load 之后再发起查询
+            if not self._pending:
+                loop.call_soon(self._dispatch)
+            future = self._pending[key] = loop.create_future()
+        # 多个调用方共享同一个 future, 其中一个被取消时不影响其它调用方
+        return await asyncio.shield(future)
+
+    async def load_many(self, keys: List[Any]) -> List[Optional[Any]]:
+        return list(await asyncio.gather(*(self.load(key) for key in keys)))
+
+    def metrics(self) -> dict:
+        return dict(self._stats)
+
+    def _dispatch(self):
+        batch, self._pending = self._pending, {}
+        keys = list(batch)
+        for start in range(0, len(keys), self.max_batch_size):
+            chunk = {key: batch[key] for key in keys[start : start + self.max_batch_size]}
+            task = asyncio.ensure_future(self._run(chunk))
+            # 保留任务引用, 避免执行中被回收
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: Dict[Any, asyncio.Future]):
+        self._stats["batches"] += 1
+        try:
+            results = await self.batch_fn(list(batch))
+        except Exception as e:
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for key, future in batch.items():
+            if not future.done():
+                future.set_result(results.get(key))
+
+
+def request_loader(name: Any, batch_fn: BatchFunction) -> Optional[BatchLoader]:
+    """当前请求中名为 name 的加载器, 不存在时用 batch_fn 创建; 不在请求中时返回 None"""
+    loaders = request_loaders_ctx.get()
+    if loaders is None:
+        return None
+    loader = loaders.get(name)
+    if loader is None:
+        loader = loaders[name] = BatchLoader(batch_fn, settings.dao_cache.max_batch_size)
+    return loader
+
+
+def batched_select(batch_fn: Callable[[Type[SQLModel], List[Any]], Awaitable[Dict[Any, dict]]]):
+    """
+    异步 select_one 的装饰器, 请求内按主键的查询通过 BatchLoader 合并, 其余调用原样执行
+    batch_fn(model, pks) 返回 主键 -> model_dump() 字典, 每个调用方各自构造新的对象
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(model: Type[SQLModel], *whereclause):
+            if not settings.dao_cache.batch_load or request_loaders_ctx.get() is None:
+                return await func(model, *whereclause)
+            pk = single_pk_value(model, whereclause)
+            if pk is None:
+                return await func(model, *whereclause)
+            loader = request_loader(model, functools.partial(batch_fn, model))
+            data = await loader.load(pk)
+            return model.model_validate(data) if data is not None else None
+
+        return wrapper
+
+    return decorator
@@ -11,6 +11,7 @@ from typing import List, Optional
 
 from app.db.base import session_getter, generate_uuid
 from app.db.models.base import SQLModelSerializable, SQLModelSerializableTime
+from app.db.models.user import UserBrief
 from sqlalchemy import Column, DateTime, delete, text, update, Text, func, or_, JSON
 from sqlmodel import Field, select
 
@@ -83,6 +84,13 @@ class AuditLog(AuditLogBase, table=True):
     id: str = Field(default_factory=generate_uuid, primary_key=True, index=True, description="主键，uuid格式")
 
 
+class AuditLogRead(AuditLogBase):
+    """审计日志响应模型, expand=operator 时附带操作用户"""
+
+    id: str
+    operator: Optional[UserBrief] = None
+
+
 class AuditLogDao(AuditLogBase):
 
 
@@ -55,16 +55,15 @@ class SQLModelSerializable(SQLModel):
         json_dumps = orjson_dumps
 
     def to_dict(self):
+        # model_dump 已取出各字段的值, 只需转换 datetime / UUID, 不再逐列 getattr
         result = self.model_dump()
-        for column in result:
-            value = getattr(self, column)
+        for column, value in result.items():
             if isinstance(value, datetime):
                 # 将datetime对象转换为字符串
-                value = value.isoformat()
+                result[column] = value.isoformat()
             elif isinstance(value, UUID):
                 # 将UUID对象转换为字符串
-                value = value.hex
-            result[column] = value
+                result[column] = value.hex
         return result
 
 
@@ -9,13 +9,14 @@ from datetime import datetime
 from typing import Optional
 
 from pydantic import field_validator
-from sqlalchemy import Column, Integer, String, Text
+from sqlalchemy import Column, Index, Integer, String, Text
 from sqlmodel import Field
 
 from app.db.models.base import (
     SQLModelSerializable,
     SQLModelSerializableTime,
 )
+from app.db.models.user import UserBrief
 
 
 class ImageBase(SQLModelSerializable):
@@ -25,7 +26,7 @@ class ImageBase(SQLModelSerializable):
     file_size: int = Field(default=0, description="文件大小(字节)")
     file_type: str = Field(default="image/jpeg", description="文件类型")
     cos_url: str = Field(sa_column=Column(String(length=512)), description="腾讯云COS访问URL")
-    cos_key: str = Field(sa_column=Column(String(length=512)), description="COS存储key")
+    cos_key: str = Field(sa_column=Column(String(length=512), index=True), description="COS存储key")
     bucket: str = Field(default="", description="存储桶名称")
     md5: Optional[str] = Field(default=None, description="文件MD5值")
     width: Optional[int] = Field(default=None, description="图片宽度")
@@ -39,6 +40,8 @@ class Image(ImageBase, SQLModelSerializableTime, table=True):
     """图片数据库模型"""
 
     __tablename__ = "image"
+    # 按内容去重: 上传时按 (md5, file_size) 查找已存在的COS对象
+    __table_args__ = (Index("ix_image_md5_file_size", "md5", "file_size"),)
 
     id: Optional[int] = Field(default=None, primary_key=True)
 
@@ -98,6 +101,12 @@ class ImageRead(ImageBase):
         from_attributes = True
 
 
+class ImageListItem(ImageRead):
+    """图片列表项, expand=uploader 时附带上传者"""
+
+    uploader: Optional[UserBrief] = None
+
+
 class ImageQuery(SQLModelSerializable):
     """图片查询模型"""
 
@@ -76,6 +76,13 @@ class UserRead(SQLModelSerializableTime, UserBase):
     role: Optional[str]
 
 
+class UserBrief(SQLModelSerializable):
+    """关联展开(expand)时附带的用户摘要"""
+
+    id: int
+    user_name: str
+
+
 class UserLoginRead(UserRead):
     current_token: Optional[str]
 
@@ -0,0 +1,107 @@
+# -*- coding:utf-8 -*-
+# @Author: H
+# @Date: 2025-10-20
+# @Version: 1.0
+# @License: H
+# @Desc: 分页辅助: 游标(keyset)分页的游标编解码、条件构造, 以及可选的总数统计
+import base64
+from datetime import date, datetime
+from typing import Any, List, Literal, Optional, Tuple, Type
+
+import orjson
+from sqlalchemy import and_, or_, text
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.elements import ClauseElement, UnaryExpression
+from sqlalchemy.sql.functions import func
+from sqlmodel import SQLModel, select
+
+from app.api.errcode.base import InvalidArgument
+
+# 总数统计方式: 精确 count(*) / 估算(MySQL 表统计信息) / 不统计
+CountMode = Literal["exact", "estimated", "none"]
+COUNT_EXACT = "exact"
+COUNT_ESTIMATED = "estimated"
+COUNT_NONE = "none"
+
+
+def order_columns(model: Type[SQLModel], order_by: Optional[List[Any]]) -> List[Tuple[Any, bool]]:
+    """
+    解析 order_by 为 [(column, is_desc)], 末尾补充主键保证排序唯一
+    :param model: 模型类
+    :param order_by: 例如 [Image.id.desc()] 或 [Image.create_time.desc(), Image.id.desc()]
+    注意: SQLite 以文本保存时间, server_default 写入的格式与绑定参数不同, 时间列做游标仅在 MySQL 等原生时间类型下可靠
+    """
+    columns = []
+    for expr in order_by or []:
+        if isinstance(expr, UnaryExpression) and expr.modifier in (operators.desc_op, operators.asc_op):
+            columns.append((expr.element, expr.modifier is operators.desc_op))
+        else:
+            columns.append((expr.__clause_element__() if hasattr(expr, "__clause_element__") else expr, False))
+
+    keys = {column.key for column, _ in columns}
+    for pk in model.__table__.primary_key.columns:
+        if pk.key not in keys:
+            # 主键跟随第一列的排序方向
+            columns.append((pk, columns[0][1] if columns else False))
+    return columns
+
+
+def order_clauses(columns: List[Tuple[Any, bool]]) -> List[Any]:
+    return [column.desc() if desc else column.asc() for column, desc in columns]
+
+
+def encode_cursor(row: SQLModel, columns: List[Tuple[Any, bool]]) -> str:
+    """将一行数据中排序列的值编码为不透明的游标"""
+    values = [getattr(row, column.key) for column, _ in columns]
+    return base64.urlsafe_b64encode(orjson.dumps(values)).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, columns: List[Tuple[Any, bool]]) -> List[Any]:
+    try:
+        values = orjson.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except Exception:
+        raise InvalidArgument(message="分页游标无效")
+    if not isinstance(values, list) or len(values) != len(columns):
+        raise InvalidArgument(message="分页游标无效")
+
+    # orjson 会把时间序列化为字符串, 这里还原为列对应的类型
+    result = []
+    for (column, _), value in zip(columns, values):
+        if isinstance(value, str) and _python_type(column) in (datetime, date):
+            value = _python_type(column).fromisoformat(value)
+        result.append(value)
+    return result
+
+
+def _python_type(column) -> Optional[type]:
+    try:
+        return column.type.python_type
+    except (AttributeError, NotImplementedError):
+        return None
+
+
+def keyset_clause(columns: List[Tuple[Any, bool]], values: List[Any]) -> ClauseElement:
+    """
+    构造 "排在游标之后" 的条件, 例如 (a desc, id desc) 展开为
+    a < :a OR (a = :a AND id < :id)
+    """
+    conditions = []
+    for i, (column, desc) in enumerate(columns):
+        equals = [columns[j][0] == values[j] for j in range(i)]
+        after = column < values[i] if desc else column > values[i]
+        conditions.append(and_(*equals, after))
+    return or_(*conditions)
+
+
+def count_statement(model: Type[SQLModel], query, has_filter: bool, dialect_name: str, count: CountMode):
+    """
+    构造总数统计语句, 返回 None 表示不统计
+    estimated 仅在 MySQL 且无过滤条件时读取 information_schema 的表行数估算值, 其它情况退化为精确统计
+    """
+    if count == COUNT_NONE:
+        return None
+    if count == COUNT_ESTIMATED and not has_filter and dialect_name == "mysql":
+        return text(
+            "SELECT TABLE_ROWS FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :name"
+        ).bindparams(name=model.__tablename__)
+    return select(func.count()).select_from(query.subquery())
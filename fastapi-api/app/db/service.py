@@ -7,12 +7,26 @@
 
 from typing import TYPE_CHECKING
 
+from app.utils import tracing
 from app.utils.logger import logger
+from app.utils.metrics import instrument_engine
 from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import create_async_engine
 from sqlmodel import Session, SQLModel, create_engine
 
 if TYPE_CHECKING:
     from sqlalchemy.engine import Engine
+    from sqlalchemy.ext.asyncio import AsyncEngine
+
+# 同步驱动 -> 异步驱动 的映射
+ASYNC_DRIVERS = {
+    'mysql': 'mysql+aiomysql',
+    'mysql+pymysql': 'mysql+aiomysql',
+    'sqlite': 'sqlite+aiosqlite',
+    'sqlite+pysqlite': 'sqlite+aiosqlite',
+    'postgresql': 'postgresql+asyncpg',
+    'postgresql+psycopg2': 'postgresql+asyncpg',
+}
 
 
 class DatabaseService():
@@ -22,6 +36,11 @@ class DatabaseService():
         self.database_url = database_url
 
         self.engine = self._create_engine()
+        self.async_engine = self._create_async_engine()
+        instrument_engine(self.engine, 'sync')
+        instrument_engine(self.async_engine.sync_engine, 'async')
+        tracing.instrument_engine(self.engine, 'sync')
+        tracing.instrument_engine(self.async_engine.sync_engine, 'async')
 
     def _create_engine(self) -> 'Engine':
         """Create the engine for the database."""
@@ -31,6 +50,19 @@ class DatabaseService():
             connect_args = {}
         return create_engine(self.database_url, connect_args=connect_args, pool_size=100, max_overflow=20, pool_pre_ping=True)
 
+    @property
+    def async_database_url(self) -> str:
+        """将同步驱动的url转换为对应的异步驱动url"""
+        scheme, sep, rest = self.database_url.partition('://')
+        return f'{ASYNC_DRIVERS.get(scheme, scheme)}{sep}{rest}'
+
+    def _create_async_engine(self) -> 'AsyncEngine':
+        """Create the asyncio engine for the database."""
+        if self.database_url and self.database_url.startswith('sqlite'):
+            # aiosqlite 默认使用 NullPool, 不支持连接池参数
+            return create_async_engine(self.async_database_url)
+        return create_async_engine(self.async_database_url, pool_size=100, max_overflow=20, pool_pre_ping=True)
+
     def __enter__(self):
         self._session = Session(self.engine)
         return self._session
@@ -48,6 +80,11 @@ class DatabaseService():
         with Session(self.engine) as session:
             yield session
 
+    async def dispose(self):
+        """释放连接池"""
+        await self.async_engine.dispose()
+        self.engine.dispose()
+
     def create_db_and_tables(self):
         logger.debug(
             f'Creating database and tables --{len(SQLModel.metadata.sorted_tables)}')
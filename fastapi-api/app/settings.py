@@ -17,6 +17,24 @@ class LoggerConf(BaseModel):
     level: str = "DEBUG"
     format: str = "<level>[{level.name} process-{process.id}-{thread.id} {name}:{line}]</level> - <level>trace={extra[trace_id]} {message}</level>"  # noqa
     handlers: List[Dict] = []
+    # 日志模式: dev 使用 Rich 渲染控制台; prod 输出纯文本控制台 + JSON-lines 文件, 由后台线程写入
+    mode: str = "dev"
+    enqueue: bool = True  # prod 模式下控制台日志由后台线程写入, 请求线程只负责格式化和入队
+    console: bool = True  # prod 模式下是否输出到 stderr
+    json_file: str = "logs/app.{pid}.jsonl"  # prod 模式的 JSON-lines 文件, {pid} 替换为进程号, 为空时不输出
+    rotation: str = "100 MB"  # 按大小("100 MB")或时间("00:00" / "1 day")切分文件
+    retention: str = "7 days"
+    compression: Optional[str] = None  # 切分后的压缩格式, 例如 gz
+    # 请求日志按 trace_id 采样, WARNING 及以上、慢请求和 5xx 请求的结束日志始终输出
+    sample_rate: float = 1.0  # 0~1
+    slow_request_ms: float = 1000
+    module_levels: Dict[str, str] = {}  # 按模块设置级别, 例如 {"app.db": "WARNING"}, 按最长前缀匹配
+    # 运行时调整日志级别/采样率: 管理接口通过 redis 发布到所有 worker, 或修改 control_file 后向 worker 发送 SIGUSR2
+    control_channel: str = "log_control"
+    control_file: str = "logs/log_control.json"
+    # 运行时可调到的最低级别: handler 启动时固定为该级别(启动级别更低时取启动级别), 运行时只修改 log_filter 的级别,
+    # 不重建 handler; 调高(如 INFO)可以让更低级别的日志在 loguru 入口处直接跳过, 但运行时不能调到它以下
+    runtime_min_level: str = "DEBUG"
 
     @classmethod
     def parse_logger_sink(cls, sink: str) -> str:
@@ -39,12 +57,57 @@ class COSConfig(BaseModel):
     domain: Optional[str] = None
 
 
+class StorageConfig(BaseModel):
+    """对象存储配置"""
+
+    backend: str = "cos"  # 存储后端: cos / local
+    # 本地存储配置
+    root: str = "data/storage"  # 文件根目录
+    base_url: str = "/api/img/file"  # 访问URL前缀, 由 /img/file 路由读取本地文件
+    public: bool = True  # 关闭后只能通过预签名URL访问
+    sign_secret: str = ""  # 预签名密钥, 为空时使用 jwt.secret
+    # 异步调用的线程池配置
+    max_workers: int = 16  # 执行阻塞存储/PIL调用的线程数
+    max_concurrency: int = 64  # 同时提交(含排队)的最大操作数, 超出的请求在协程中等待
+    timeout: float = 30  # 普通操作超时秒数
+    upload_timeout: float = 120  # 上传操作超时秒数
+
+
+class RenderConfig(BaseModel):
+    """图片缩放/转码(/img/render)配置"""
+
+    cache_dir: str = "data/render_cache"  # 结果缓存目录, 多个 worker 进程共享
+    cache_max_bytes: int = 1024 * 1024 * 1024  # 缓存总大小上限, 超出后淘汰最久未访问的文件
+    max_workers: int = 2  # 缩放/编码使用的进程数
+    max_size: int = 4096  # 输出宽高上限
+    max_pixels: int = 50_000_000  # 原图像素上限, 防止解压炸弹
+    timeout: float = 30  # 单次缩放/编码超时秒数
+    cache_max_age: int = 86400  # 响应头 Cache-Control 的 max-age
+
+
 class DatabaseConfig(BaseModel):
     """数据库配置"""
 
     url: str
 
 
+class RedisConfig(BaseModel):
+    """redis配置"""
+
+    # 单机: redis://:password@host:6379/0
+    # 哨兵: {mode: sentinel, sentinel_hosts: ["('host', 26379)"], sentinel_master: mymaster, sentinel_password: xx}
+    # 集群: {mode: cluster, startup_nodes: [{host: host, port: 6379}], password: xx}
+    url: Union[str, Dict]
+    max_connections: int = 50  # 每个进程(集群模式下每个节点)的最大连接数
+    socket_timeout: float = 5
+    socket_connect_timeout: float = 2
+    health_check_interval: int = 30  # 空闲连接复用前的健康检查间隔秒数
+    # 缓存值编解码, 格式为 "序列化[+压缩]", 序列化: pickle / orjson / msgpack, 压缩: zlib / zstd / lz4
+    codec: str = "pickle"  # 默认编解码
+    key_codecs: Dict[str, str] = {}  # 按 key 前缀指定编解码, 例如 {"img_": "msgpack+zstd"}
+    compress_threshold: int = 1024  # 序列化后超过多少字节才压缩
+
+
 class JWTConfig(BaseModel):
     """JWT配置"""
 
@@ -52,6 +115,126 @@ class JWTConfig(BaseModel):
     expires: int
 
 
+class DaoCacheConfig(BaseModel):
+    """dao 按主键读取的两级缓存和请求内批量加载配置"""
+
+    enabled: bool = True
+    l1_size: int = 10000  # 进程内缓存条数
+    l1_ttl: float = 30  # 进程内缓存秒数, 也是未配置 redis 时多进程间读到旧数据的最长时间
+    l2_ttl: int = 300  # redis 缓存秒数
+    channel: str = "dao_cache_invalidate"  # 跨进程失效通知的 redis channel
+    # 请求内并发的 select_one(Model, Model.id == x) 合并为一次 IN 查询(app.db.loader)
+    batch_load: bool = True
+    max_batch_size: int = 500  # 单次 IN 查询的主键数上限
+
+
+class RateLimitRule(BaseModel):
+    """限流规则"""
+
+    name: str  # 规则名, 用于计数key
+    path: str  # 路径前缀, 例如 /api/user/login
+    methods: List[str] = []  # 为空时匹配所有方法
+    limit: int  # 窗口内允许的请求数(令牌桶容量)
+    window: int = 60  # 窗口秒数
+    key: str = "ip"  # 计数维度: ip / user(已登录用户, 未登录时按ip) / global
+    algorithm: str = "sliding_window"  # sliding_window / token_bucket
+
+
+class RateLimitConfig(BaseModel):
+    """限流配置"""
+
+    enabled: bool = True
+    rules: List[RateLimitRule] = [
+        RateLimitRule(name="login", path="/api/user/login", methods=["POST"], limit=10, window=60),
+        RateLimitRule(name="regist", path="/api/user/regist", methods=["POST"], limit=5, window=60),
+    ]
+
+
+class ProxyConfig(BaseModel):
+    """反向代理配置"""
+
+    # 可信代理的地址(CIDR), 只有直连地址属于其中时才读取 X-Forwarded-For 中的客户端 IP
+    trusted_proxies: List[str] = ["127.0.0.1/32", "::1/128"]
+
+
+class AuditLogConfig(BaseModel):
+    """审计日志异步批量写入配置"""
+
+    async_write: bool = True  # 关闭后退化为请求内同步写入
+    batch_size: int = 100  # 攒够多少条写一次
+    flush_interval: float = 1.0  # 最长多少秒写一次
+    max_queue_size: int = 10000
+    policy: str = "block"  # 队列满时的策略: block / drop_oldest / spill
+    block_timeout: float = 1.0  # block 策略最长等待秒数, 超时后丢弃
+    spill_path: str = "logs/audit_spill.jsonl"  # spill 策略及写库失败时落盘的文件
+
+
+class MetricsConfig(BaseModel):
+    """Prometheus 指标配置"""
+
+    enabled: bool = True
+    path: str = "/metrics"
+    # 多进程部署时各 worker 写指标文件的目录, 环境变量 PROMETHEUS_MULTIPROC_DIR 优先
+    multiproc_dir: str = ""
+    # HTTP 请求和对象存储耗时的直方图桶(秒)
+    buckets: List[float] = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+
+
+class CompressionConfig(BaseModel):
+    """响应压缩配置, br 需要安装 brotli, zstd 需要安装 zstandard, 未安装的编码自动跳过"""
+
+    enabled: bool = True
+    min_size: int = 1024  # 小于该字节数的响应不压缩
+    encodings: List[str] = ["zstd", "br", "gzip"]  # 动态响应的编码, 客户端都支持时按此顺序选择
+    gzip_level: int = 6
+    brotli_quality: int = 4
+    zstd_level: int = 3
+    thread_threshold: int = 64 * 1024  # 大于该字节数的响应体在线程池中压缩, 不占用事件循环
+    exclude_paths: List[str] = []  # 不压缩的路径前缀
+    # /static 预压缩文件(同目录下的 .br / .zst / .gz), 启动时生成缺失或过期的文件
+    static_precompress: bool = True
+    static_encodings: List[str] = ["br", "zstd", "gzip"]
+
+
+class HttpCacheConfig(BaseModel):
+    """GET 接口的条件请求(ETag / Last-Modified -> 304)和 Cache-Control 配置"""
+
+    enabled: bool = True
+    # 未单独配置的路由使用的 Cache-Control, 默认允许浏览器缓存但每次使用前用 ETag 验证
+    default_cache_control: str = "private, no-cache"
+    # 路由模板 -> Cache-Control, 例如 {"/api/img/detail/{image_id}": "private, max-age=10"}
+    cache_control: Dict[str, str] = {}
+
+
+class FastResponseConfig(BaseModel):
+    """@trusted_response 接口的快速序列化配置"""
+
+    enabled: bool = True  # 关闭后所有接口都按 response_model 校验后再序列化
+    # 同时按 response_model 校验并比较两种结果, 不一致时输出 WARNING, 仅用于开发和测试环境
+    verify: bool = False
+
+
+class TracingConfig(BaseModel):
+    """链路追踪配置"""
+
+    enabled: bool = True
+    # 没有上游 traceparent 的请求按 trace_id 采样, 带 traceparent 的请求沿用上游的采样标记
+    sample_rate: float = 1.0  # 0~1
+    # 采样请求的导出方式: none / stdout / file / otlp
+    exporter: str = "none"
+    file: str = "logs/trace.{pid}.jsonl"  # file 导出, 每行一个请求, {pid} 替换为进程号
+    otlp_endpoint: str = "http://127.0.0.1:4318/v1/traces"  # OTLP/HTTP JSON 接收地址
+    otlp_headers: Dict[str, str] = {}
+    otlp_timeout: float = 5.0
+    service_name: str = "fastapi-api"
+    # 在响应头 Server-Timing 中返回采样请求的 db / redis / cos 耗时
+    server_timing: bool = True
+    max_spans_per_trace: int = 1000
+    batch_size: int = 256
+    flush_interval: float = 1.0
+    max_queue_size: int = 10000
+
+
 class Settings(BaseSettings):
     # 基础配置
     environment: Union[dict, str] = "local"
@@ -64,9 +247,45 @@ class Settings(BaseSettings):
     # JWT配置
     jwt: Optional[JWTConfig] = None
 
+    # redis配置, 为空时不使用 redis
+    redis: Optional[RedisConfig] = None
+
     # 腾讯云COS配置
     cos: Optional[COSConfig] = None
 
+    # 对象存储配置
+    storage: StorageConfig = StorageConfig()
+
+    # 图片缩放/转码配置
+    render: RenderConfig = RenderConfig()
+
+    # dao 缓存配置
+    dao_cache: DaoCacheConfig = DaoCacheConfig()
+
+    # 限流配置
+    rate_limit: RateLimitConfig = RateLimitConfig()
+
+    # 反向代理配置
+    proxy: ProxyConfig = ProxyConfig()
+
+    # 审计日志配置
+    audit_log: AuditLogConfig = AuditLogConfig()
+
+    # 指标配置
+    metrics: MetricsConfig = MetricsConfig()
+
+    # 响应压缩配置
+    compression: CompressionConfig = CompressionConfig()
+
+    # HTTP 条件请求和缓存策略
+    http_cache: HttpCacheConfig = HttpCacheConfig()
+
+    # 可信接口的快速序列化
+    fast_response: FastResponseConfig = FastResponseConfig()
+
+    # 链路追踪配置
+    tracing: TracingConfig = TracingConfig()
+
     class Config:
         extra = "allow"  # 允许动态添加额外字段
 
@@ -77,11 +296,11 @@ class Settings(BaseSettings):
 
 
 def load_settings_from_yaml(env: str) -> Settings:
-    """从YAML文件加载配置"""
-    if env != "prod":
-        config_path = os.path.join(Settings().base_dir, ".config.yaml")
-    else:
-        config_path = os.path.join(Settings().base_dir, ".config_prod.yaml")
+    """从YAML文件加载配置, 环境变量 CONFIG_FILE 指定配置文件时优先使用(如压测时使用临时配置)"""
+    config_path = os.getenv("CONFIG_FILE")
+    if not config_path:
+        config_name = ".config.yaml" if env != "prod" else ".config_prod.yaml"
+        config_path = os.path.join(Settings().base_dir, config_name)
 
     with open(config_path, "r", encoding="utf-8") as f:
         settings_dict = yaml.safe_load(f)
@@ -0,0 +1,235 @@
+# -*- coding:utf-8 -*-
+# @Author: H
+# @Date: 2025-10-20
+# @Version: 1.0
+# @License: H
+# @Desc: 响应压缩: Accept-Encoding 协商, gzip / br / zstd 编码, /static 预压缩文件
+"""
+动态响应由 CompressionMiddleware(app.utils.http_middleware) 压缩, 静态文件由 PrecompressedStaticFiles
+直接发送同目录下预先压缩好的 .br / .zst / .gz 文件; 预压缩文件在启动时(settings.compression.static_precompress)
+或构建镜像时生成:
+
+    python -c "from app.utils.compression import precompress_static; precompress_static('static')"
+
+br 需要安装 brotli, zstd 需要安装 zstandard, 未安装时对应的编码不参与协商
+"""
+import mimetypes
+import os
+import zlib
+from typing import Dict, Iterable, List, Optional
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Scope
+
+from app.settings import CompressionConfig, settings
+from app.utils.logger import logger
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+# 预压缩文件的后缀
+SUFFIXES = {"br": ".br", "zstd": ".zst", "gzip": ".gz"}
+
+# 压缩有收益的类型, 图片(svg 除外)、压缩包等已经压缩过
+_COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/json",
+    "application/x-ndjson",
+    "application/problem+json",
+    "application/javascript",
+    "application/xml",
+    "application/xhtml+xml",
+    "application/manifest+json",
+    "application/openmetrics-text",
+    "image/svg+xml",
+)
+
+
+def available(encoding: str) -> bool:
+    if encoding == "br":
+        return brotli is not None
+    if encoding == "zstd":
+        return zstandard is not None
+    return encoding == "gzip"
+
+
+def available_encodings(encodings: Iterable[str]) -> List[str]:
+    return [one for one in encodings if available(one)]
+
+
+def is_compressible(content_type: Optional[str]) -> bool:
+    return bool(content_type) and content_type.lower().startswith(_COMPRESSIBLE_TYPES)
+
+
+def parse_accept_encoding(header: Optional[str]) -> Dict[str, float]:
+    """解析 Accept-Encoding, 返回 编码 -> q 值"""
+    result = {}
+    for item in (header or "").split(","):
+        name, _, params = item.strip().partition(";")
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        result[name.strip().lower()] = q
+    return result
+
+
+def negotiate(header: Optional[str], encodings: List[str]) -> Optional[str]:
+    """按服务端顺序选择客户端接受(q > 0)的第一个编码, 都不接受时返回 None"""
+    if not header:
+        return None
+    accepted = parse_accept_encoding(header)
+    wildcard = accepted.get("*", 0.0)
+    for encoding in encodings:
+        if accepted.get(encoding, wildcard) > 0:
+            return encoding
+    return None
+
+
+def compress(encoding: str, data: bytes, conf: CompressionConfig) -> bytes:
+    if encoding == "gzip":
+        compressor = zlib.compressobj(conf.gzip_level, zlib.DEFLATED, 31)
+        return compressor.compress(data) + compressor.flush()
+    if encoding == "br":
+        return brotli.compress(data, quality=conf.brotli_quality)
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=conf.zstd_level).compress(data)
+    raise ValueError(f"unknown encoding: {encoding}")
+
+
+class StreamCompressor:
+    """流式响应的增量压缩, 每个分片压缩后立即 flush, 客户端可以及时解压已收到的数据"""
+
+    def __init__(self, encoding: str, conf: CompressionConfig):
+        self.encoding = encoding
+        if encoding == "gzip":
+            self._compressor = zlib.compressobj(conf.gzip_level, zlib.DEFLATED, 31)
+        elif encoding == "br":
+            self._compressor = brotli.Compressor(quality=conf.brotli_quality)
+        elif encoding == "zstd":
+            self._compressor = zstandard.ZstdCompressor(level=conf.zstd_level).compressobj()
+        else:
+            raise ValueError(f"unknown encoding: {encoding}")
+
+    def compress(self, data: bytes) -> bytes:
+        if self.encoding == "gzip":
+            return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+        if self.encoding == "br":
+            return self._compressor.process(data) + self._compressor.flush()
+        return self._compressor.compress(data) + self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        if self.encoding == "gzip":
+            return self._compressor.flush()
+        if self.encoding == "br":
+            return self._compressor.finish()
+        return self._compressor.flush()
+
+
+# 静态文件
+def precompress_static(directory: str, conf: CompressionConfig = settings.compression) -> int:
+    """
+    为目录中可压缩的文件生成同目录下的预压缩文件, 已存在且不早于原文件时跳过, 返回生成的文件数
+    使用各编码的最高压缩级别; 压缩后没有变小的文件不生成, 请求时发送原文件
+    多个 worker 同时启动时可能重复生成, 先写临时文件再 rename, 不会读到不完整的文件
+    """
+    encodings = available_encodings(conf.static_encodings)
+    suffixes = tuple(SUFFIXES.values())
+    created = 0
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if name.endswith(suffixes) or name.endswith(".tmp"):
+                continue
+            path = os.path.join(root, name)
+            if not is_compressible(mimetypes.guess_type(name)[0]):
+                continue
+            source = os.stat(path)
+            if source.st_size < conf.min_size:
+                continue
+            data = None
+            for encoding in encodings:
+                target = path + SUFFIXES[encoding]
+                if os.path.exists(target) and os.stat(target).st_mtime >= source.st_mtime:
+                    continue
+                if data is None:
+                    with open(path, "rb") as f:
+                        data = f.read()
+                output = _compress_max(encoding, data)
+                if len(output) >= len(data):
+                    continue
+                tmp_path = f"{target}.{os.getpid()}.tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(output)
+                os.replace(tmp_path, target)
+                created += 1
+    if created:
+        logger.info(f"precompressed {created} static files in {directory}, encodings={encodings}")
+    return created
+
+
+def _compress_max(encoding: str, data: bytes) -> bytes:
+    if encoding == "gzip":
+        compressor = zlib.compressobj(9, zlib.DEFLATED, 31)
+        return compressor.compress(data) + compressor.flush()
+    if encoding == "br":
+        return brotli.compress(data, quality=11)
+    return zstandard.ZstdCompressor(level=19).compress(data)
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """
+    客户端接受时发送同目录下的预压缩文件(.br / .zst / .gz), Content-Type 仍为原文件的类型
+    可压缩类型的响应都带有 Vary: Accept-Encoding, 避免共享缓存把压缩版本发给不支持的客户端
+    """
+
+    def __init__(self, *args, encodings: Optional[List[str]] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.encodings = available_encodings(encodings or settings.compression.static_encodings)
+
+    def file_response(self, full_path, stat_result: os.stat_result, scope: Scope, status_code: int = 200) -> Response:
+        request_headers = Headers(scope=scope)
+        media_type = mimetypes.guess_type(str(full_path))[0] or "text/plain"
+        if not is_compressible(media_type):
+            return super().file_response(full_path, stat_result, scope, status_code)
+
+        response = None
+        accepted = parse_accept_encoding(request_headers.get("accept-encoding"))
+        for encoding in self.encodings:
+            if accepted.get(encoding, accepted.get("*", 0.0)) <= 0:
+                continue
+            try:
+                sibling = f"{full_path}{SUFFIXES[encoding]}"
+                sibling_stat = os.stat(sibling)
+            except OSError:
+                continue
+            # 原文件更新后预压缩文件已过期
+            if sibling_stat.st_mtime < stat_result.st_mtime:
+                continue
+            response = FileResponse(
+                sibling,
+                status_code=status_code,
+                stat_result=sibling_stat,
+                media_type=media_type,
+                headers={"Content-Encoding": encoding},
+            )
+            break
+        if response is None:
+            response = FileResponse(full_path, status_code=status_code, stat_result=stat_result, media_type=media_type)
+        response.headers["Vary"] = "Accept-Encoding"
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
@@ -6,27 +6,339 @@
 # @Desc:
 
 # Define a custom middleware class
-from time import time
+import asyncio
+import json
+import math
+from time import perf_counter
+from typing import Optional
 from uuid import uuid4
 
+import jwt
 from fastapi import Request
-from app.utils.logger import logger
-from starlette.middleware.base import BaseHTTPMiddleware, RequestResponseEndpoint
+from fastapi.responses import ORJSONResponse
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from app.utils import compression
+from app.utils.logger import log_enabled, logger, should_sample, slow_request_seconds
+from app.utils.metrics import (
+    HTTP_REQUEST_SECONDS,
+    HTTP_REQUESTS,
+    HTTP_REQUESTS_IN_PROGRESS,
+    RouteResolver,
+)
+from app.utils.tracing import parse_traceparent, tracer
+from app.api.errcode.base import TooManyRequestsError
+from app.api.utils import get_request_ip
+from app.cache.rate_limit import RateLimiter, rate_limiter
 from app.context import set_request_context_var
+from app.settings import CompressionConfig, RateLimitRule, settings
 
+# 不受采样影响的 logger, 用于未采样请求中的慢请求和 5xx
+_forced_logger = logger.bind(force=True)
 
-class CustomMiddleware(BaseHTTPMiddleware):
-    """切面程序"""
 
-    async def dispatch(self, request: Request, call_next: RequestResponseEndpoint):
-        # You can modify the request before passing it to the next middleware or endpoint
-        trace_id = str(uuid4().hex)
-        set_request_context_var(trace_id=trace_id)
-        start_time = time()
+class CustomMiddleware:
+    """
+    切面程序(纯 ASGI): 注入 trace_id, 记录请求耗时、状态码和响应字节数
+    不像 BaseHTTPMiddleware 那样为每个请求创建额外的任务和响应流, 流式响应原样透传
+    请求头带有 W3C traceparent 时沿用其 trace_id 和采样标记, 响应头返回本服务的 traceparent,
+    被追踪采样的请求另外返回 Server-Timing(db / redis / cos / app 耗时分解)
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        upstream = _traceparent(scope) if tracer.enabled else None
+        trace_id = upstream[0] if upstream else uuid4().hex
+        # 按 trace_id 采样请求日志, 未采样的请求只输出 WARNING 及以上, 慢请求和 5xx 仍输出结束日志
+        sampled = should_sample(trace_id)
+        set_request_context_var(trace_id=trace_id, log_sampled=sampled)
+        trace = None
+        if tracer.enabled:
+            trace = tracer.start(
+                trace_id,
+                upstream[1] if upstream else None,
+                upstream[2] if upstream else tracer.should_sample(trace_id),
+                f"{scope['method']} {scope['path']}",
+                **{"http.method": scope["method"], "http.target": scope["path"]},
+            )
+        start_time = perf_counter()
+        # 日志级别高于 INFO 时不拼接日志参数
+        info_enabled = log_enabled("INFO")
+        status_code = 500
+        body_size = 0
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code, body_size
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if trace is not None:
+                    headers = MutableHeaders(scope=message)
+                    headers.append("traceparent", trace.traceparent)
+                    if trace.sampled and settings.tracing.server_timing:
+                        headers.append("Server-Timing", trace.server_timing())
+            elif message["type"] == "http.response.body":
+                body_size += len(message.get("body", b""))
+            await send(message)
+
         with logger.contextualize(trace_id=trace_id):
-            logger.info(f'{request.method} {request.url.path}')
-            response = await call_next(request)
-            process_time = round((time() - start_time) * 1000, 3)
-            logger.info(
-                f'{request.method} {request.url.path}  timecost={process_time}')
-            return response
+            if info_enabled and sampled:
+                logger.info("{} {}", scope["method"], scope["path"])
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                process_time = perf_counter() - start_time
+                if trace is not None:
+                    _finish_trace(trace, scope, status_code, process_time)
+                if info_enabled:
+                    if sampled or process_time >= slow_request_seconds() or status_code >= 500:
+                        (logger if sampled else _forced_logger).info(
+                            "{} {} status={} bytes={} timecost={}{}",
+                            scope["method"],
+                            scope["path"],
+                            status_code,
+                            body_size,
+                            round(process_time * 1000, 3),
+                            f" breakdown={trace.breakdown()}" if trace is not None and trace.sampled else "",
+                        )
+
+
+def _header(scope: Scope, name: bytes) -> Optional[str]:
+    for key, value in scope["headers"]:
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+def _traceparent(scope: Scope):
+    value = _header(scope, b"traceparent")
+    return parse_traceparent(value) if value else None
+
+
+def _finish_trace(trace, scope: Scope, status_code: int, process_time: float):
+    # 路由匹配后 FastAPI 把 APIRoute 写入 scope, span 名使用路由模板, 便于按接口聚合
+    route = scope.get("route")
+    if route is not None:
+        trace.root.name = f"{scope['method']} {route.path_format}"
+    tracer.finish(
+        trace,
+        int(process_time * 1e9),
+        error=f"HTTP {status_code}" if status_code >= 500 else None,
+        **{"http.status_code": status_code},
+    )
+
+
+class MetricsMiddleware:
+    """
+    Prometheus 指标中间件(纯 ASGI): 按 "方法 + 路由模板" 记录请求数、耗时和进行中的请求数
+    未匹配任何路由的请求统一记为 <unmatched>
+    """
+
+    def __init__(self, app: ASGIApp, exclude_paths: tuple = ()):
+        self.app = app
+        self.exclude_paths = set(exclude_paths)
+        self.resolver = RouteResolver()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["path"] in self.exclude_paths:
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        route = self.resolver.resolve(scope)
+        status_code = 500
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        in_progress = HTTP_REQUESTS_IN_PROGRESS.labels(method, route)
+        in_progress.inc()
+        start_time = perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_REQUEST_SECONDS.labels(method, route).observe(perf_counter() - start_time)
+            HTTP_REQUESTS.labels(method, route, str(status_code)).inc()
+            in_progress.dec()
+
+
+class RateLimitMiddleware:
+    """
+    限流中间件(纯 ASGI), 在路由和依赖注入之前执行, 被拒绝的请求不会访问数据库
+    规则见 settings.rate_limit, 超限返回 HTTP 429 及 Retry-After
+    """
+
+    def __init__(self, app: ASGIApp, limiter: RateLimiter = rate_limiter):
+        self.app = app
+        self.limiter = limiter
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not self.limiter.enabled:
+            await self.app(scope, receive, send)
+            return
+        rules = self.limiter.match(scope["method"], scope["path"])
+        if not rules:
+            await self.app(scope, receive, send)
+            return
+
+        request = Request(scope)
+        for rule in rules:
+            result = await self.limiter.hit(rule, self._identity(rule, request))
+            if not result.allowed:
+                logger.warning(f"rate limited: rule={rule.name} {scope['method']} {scope['path']}")
+                response = ORJSONResponse(
+                    content=TooManyRequestsError().return_resp().model_dump(),
+                    status_code=429,
+                    headers={
+                        "Retry-After": str(max(math.ceil(result.retry_after), 1)),
+                        "X-RateLimit-Limit": str(result.limit),
+                        "X-RateLimit-Remaining": "0",
+                    },
+                )
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+    @staticmethod
+    def _identity(rule: RateLimitRule, request: Request) -> str:
+        if rule.key == "global":
+            return "all"
+        if rule.key == "user":
+            user_id = _jwt_user_id(request)
+            if user_id is not None:
+                return f"user_{user_id}"
+        return get_request_ip(request)
+
+
+class CompressionMiddleware:
+    """
+    响应压缩中间件(纯 ASGI), 按 Accept-Encoding 和 settings.compression.encodings 的顺序选择 zstd / br / gzip
+    只压缩可压缩类型(JSON、文本等)且不小于 min_size 的响应, 已编码或带 Cache-Control: no-transform 的响应原样透传
+    完整响应体一次压缩, 不小于 thread_threshold 时在线程池中压缩; 流式响应逐个分片压缩并去掉 Content-Length
+    """
+
+    def __init__(self, app: ASGIApp, conf: CompressionConfig = settings.compression):
+        self.app = app
+        self.conf = conf
+        self.encodings = compression.available_encodings(conf.encodings)
+        self.exclude_paths = tuple(conf.exclude_paths)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        # HEAD 响应没有响应体, Content-Length 需要与 GET 一致, 不处理
+        if (
+            scope["type"] != "http"
+            or scope["method"] == "HEAD"
+            or (self.exclude_paths and scope["path"].startswith(self.exclude_paths))
+        ):
+            await self.app(scope, receive, send)
+            return
+        encoding = compression.negotiate(_header(scope, b"accept-encoding"), self.encodings)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await self.app(scope, receive, _CompressionResponder(self.conf, encoding, send))
+
+
+class _CompressionResponder:
+    """缓存 http.response.start 直到第一个响应体分片, 据此决定是否压缩以及按完整/流式响应处理"""
+
+    def __init__(self, conf: CompressionConfig, encoding: str, send: Send):
+        self.conf = conf
+        self.encoding = encoding
+        self.send = send
+        self.start: Optional[Message] = None
+        self.compressor: Optional[compression.StreamCompressor] = None
+
+    async def __call__(self, message: Message):
+        if message["type"] == "http.response.start":
+            self.start = message
+            return
+        if self.start is None:
+            # 响应头已发送
+            if self.compressor is not None and message["type"] == "http.response.body":
+                message = self._compress_chunk(message)
+            await self.send(message)
+            return
+
+        start, self.start = self.start, None
+        # http.response.pathsend 等扩展消息原样透传
+        if message["type"] != "http.response.body" or not self._compressible(start):
+            await self.send(start)
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        headers = MutableHeaders(scope=start)
+        if not message.get("more_body", False):
+            if len(body) < self.conf.min_size:
+                await self.send(start)
+                await self.send(message)
+                return
+            if len(body) >= self.conf.thread_threshold:
+                data = await asyncio.to_thread(compression.compress, self.encoding, body, self.conf)
+            else:
+                data = compression.compress(self.encoding, body, self.conf)
+            if len(data) >= len(body):
+                await self.send(start)
+                await self.send(message)
+                return
+            self._set_headers(headers)
+            headers["Content-Length"] = str(len(data))
+            await self.send(start)
+            await self.send({"type": "http.response.body", "body": data})
+            return
+
+        self.compressor = compression.StreamCompressor(self.encoding, self.conf)
+        self._set_headers(headers)
+        del headers["Content-Length"]
+        await self.send(start)
+        await self.send(self._compress_chunk(message))
+
+    def _compressible(self, start: Message) -> bool:
+        if start["status"] in (204, 304) or start["status"] < 200:
+            return False
+        headers = Headers(raw=start["headers"])
+        return (
+            "content-encoding" not in headers
+            and "no-transform" not in headers.get("cache-control", "")
+            and compression.is_compressible(headers.get("content-type"))
+        )
+
+    def _set_headers(self, headers: MutableHeaders):
+        headers["Content-Encoding"] = self.encoding
+        headers.add_vary_header("Accept-Encoding")
+        # 压缩后的字节与原响应不同, 强 ETag 改为弱 ETag
+        etag = headers.get("etag")
+        if etag and not etag.startswith("W/"):
+            headers["ETag"] = f"W/{etag}"
+
+    def _compress_chunk(self, message: Message) -> Message:
+        more_body = message.get("more_body", False)
+        data = self.compressor.compress(message.get("body", b""))
+        if not more_body:
+            data += self.compressor.finish()
+        return {"type": "http.response.body", "body": data, "more_body": more_body}
+
+
+def _jwt_user_id(request: Request):
+    """从 JWT 中取出用户ID, 只校验签名和有效期, 不查询数据库"""
+    authorization = request.headers.get("authorization", "")
+    if authorization[:7].lower() == "bearer ":
+        token = authorization[7:]
+    else:
+        token = request.cookies.get("access_token_cookie")
+    if not token:
+        return None
+    try:
+        payload = jwt.decode(token, settings.jwt.secret, algorithms=["HS256"])
+        return json.loads(payload["sub"]).get("user_id")
+    except Exception:
+        return None
@@ -0,0 +1,79 @@
+# -*- coding:utf-8 -*-
+# @Author: H
+# @Date: 2025-10-20
+# @Version: 1.0
+# @License: H
+# @Desc: 图片缩放/转码, 在进程池中执行
+"""
+本模块只依赖 Pillow, 进程池(spawn)的子进程导入它时不会加载应用配置、数据库等
+"""
+from io import BytesIO
+from typing import Optional, Tuple
+
+from PIL import Image as PILImage
+from PIL import ImageOps
+
+# fmt 参数 -> (Pillow 格式, Content-Type)
+FORMATS = {
+    "webp": ("WEBP", "image/webp"),
+    "jpeg": ("JPEG", "image/jpeg"),
+    "png": ("PNG", "image/png"),
+}
+
+# EXIF 方向为 5~8 时图片需要旋转 90 度, 显示的宽高与存储的宽高相反
+_TRANSPOSED_ORIENTATIONS = {5, 6, 7, 8}
+_EXIF_ORIENTATION = 0x0112
+
+
+def render(data: bytes, width: Optional[int], height: Optional[int], fmt: str, quality: int, max_pixels: int) -> bytes:
+    """
+    按比例缩小到 width x height 以内(不放大), 转换为 fmt 格式, 去掉 EXIF 等元数据
+    :param width: 最大宽度, 为空时只按高度缩放
+    :param height: 最大高度, 为空时只按宽度缩放
+    :param quality: webp / jpeg 的质量 1~100
+    :param max_pixels: 原图像素上限, 超过时抛出 PIL.Image.DecompressionBombError
+    """
+    pil_format, _ = FORMATS[fmt]
+    with PILImage.open(BytesIO(data)) as image:
+        # open 只解析文件头, 在解码之前检查尺寸
+        if image.size[0] * image.size[1] > max_pixels:
+            raise PILImage.DecompressionBombError(f"image too large: {image.size}")
+        box = _box(width, height, image.getexif().get(_EXIF_ORIENTATION, 1) in _TRANSPOSED_ORIENTATIONS)
+        if box is not None:
+            # thumbnail 在解码前调用 draft, JPEG 直接按 1/2~1/8 缩小解码;
+            # 其它格式先用 reduce 整数倍缩小, 最后一步才用 LANCZOS 重采样
+            image.thumbnail(box, PILImage.Resampling.LANCZOS, reducing_gap=2.0)
+        image = ImageOps.exif_transpose(image)
+        image = _convert_mode(image, pil_format)
+
+        output = BytesIO()
+        if pil_format == "WEBP":
+            image.save(output, pil_format, quality=quality, method=4)
+        elif pil_format == "JPEG":
+            image.save(output, pil_format, quality=quality, optimize=True, progressive=True)
+        else:
+            image.save(output, pil_format, compress_level=6)
+        return output.getvalue()
+
+
+def _box(width: Optional[int], height: Optional[int], transposed: bool) -> Optional[Tuple[int, int]]:
+    """thumbnail 的目标尺寸, 按原图存储方向(旋转之前)计算"""
+    if not width and not height:
+        return None
+    box = (width or 1 << 30, height or 1 << 30)
+    return (box[1], box[0]) if transposed else box
+
+
+def _convert_mode(image: PILImage.Image, pil_format: str) -> PILImage.Image:
+    has_alpha = image.mode in ("RGBA", "LA", "PA") or (image.mode == "P" and "transparency" in image.info)
+    if pil_format == "JPEG":
+        if has_alpha:
+            # JPEG 不支持透明通道, 透明部分填充白色
+            image = image.convert("RGBA")
+            background = PILImage.new("RGB", image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel("A"))
+            return background
+        return image if image.mode in ("RGB", "L") else image.convert("RGB")
+    if image.mode not in ("RGB", "RGBA", "L", "LA"):
+        return image.convert("RGBA" if has_alpha else "RGB")
+    return image
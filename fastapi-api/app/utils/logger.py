@@ -5,70 +5,308 @@
 # @License: H
 # @Desc:
 
+import asyncio
 import logging
+import os
+import queue
+import sys
+import threading
+import traceback
 from pathlib import Path
+from typing import Dict, List, Optional
 
 import orjson
 from loguru import logger
 from rich.console import Console
 from rich.logging import RichHandler
 
-from app.context import get_trace_id
+from app.context import get_log_sampled, get_trace_id
 from app.settings import LoggerConf
 
 VALID_LOG_LEVELS = ["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL", "EXCEPTION"]
 
+# 实际会输出的最低日志级别, 用于在拼接日志参数之前判断是否需要输出
+_min_level_no = 0
+# 所有 handler 中最低的级别, 由 configure 设置; 内置 handler 固定为 _handler_floor_no, 运行时由 log_filter 按级别过滤
+_static_min_level_no = 0
+_handler_floor_no = 0
 
-def serialize(record):
+# 运行时日志控制, 由 configure / update_log_control 设置
+_logger_conf: Optional[LoggerConf] = None
+_level_no = 0  # 全局级别
+_module_levels: Dict[str, int] = {}  # 模块前缀 -> 级别
+_module_level_cache: Dict[str, int] = {}  # 模块名 -> 生效的级别
+_sample_threshold = 1 << 32  # trace_id 前 8 位(32 bit)小于该值的请求被采样
+_slow_request_seconds = 1.0
+_WARNING_NO = 30
+
+
+def serialize(record) -> bytes:
     subset = {
         "timestamp": record["time"].timestamp(),
-        "message": record["message"],
         "level": record["level"].name,
+        "trace_id": record["extra"].get("trace_id", ""),
         "module": record["module"],
+        "line": record["line"],
+        "message": record["message"],
     }
+    if record["exception"] is not None:
+        subset["exception"] = "".join(traceback.format_exception(*record["exception"]))
     return orjson.dumps(subset)
 
 
+def json_format(record) -> str:
+    """JSON-lines sink 的格式函数, 只有该 sink 接收的记录才会序列化"""
+    record["extra"]["serialized"] = serialize(record).decode()
+    return "{extra[serialized]}\n"
+
+
 def patching(record):
     # Ensure that 'extra' exists in the record.
     # 优先使用已有 extra.trace_id（例如在中间件里通过 logger.contextualize 注入）
     # 若不存在则回填当前上下文中的 trace_id
-    record["extra"].setdefault("trace_id", get_trace_id() or "")
-    record["extra"]["serialized"] = serialize(record)
+    if not record["extra"].get("trace_id"):
+        record["extra"]["trace_id"] = get_trace_id() or ""
+
+
+def log_enabled(level: str) -> bool:
+    """是否有 handler 会输出该级别的日志"""
+    return logger.level(level).no >= _min_level_no
+
+
+def should_sample(trace_id: str) -> bool:
+    """按 trace_id 决定是否输出该请求的 INFO 及以下日志, 同一个 trace_id 在所有进程中结果一致"""
+    if _sample_threshold > 0xFFFFFFFF:
+        return True
+    try:
+        return int(trace_id[:8], 16) < _sample_threshold
+    except ValueError:
+        return True
+
+
+def slow_request_seconds() -> float:
+    return _slow_request_seconds
+
+
+def _module_level_no(name: str) -> int:
+    no = _module_level_cache.get(name)
+    if no is None:
+        no, matched = _level_no, -1
+        for prefix, level_no in _module_levels.items():
+            if (name == prefix or name.startswith(prefix + ".")) and len(prefix) > matched:
+                no, matched = level_no, len(prefix)
+        _module_level_cache[name] = no
+    return no
+
+
+def log_filter(record) -> bool:
+    """按模块级别过滤, 并丢弃未被采样的请求中 WARNING 以下的日志; extra.force 为真时不受采样影响"""
+    no = record["level"].no
+    if no < _module_level_no(record["name"] or ""):
+        return False
+    return no >= _WARNING_NO or get_log_sampled() or record["extra"].get("force", False)
+
+
+def _apply_control(logger_conf: LoggerConf):
+    """只修改 log_filter 读取的全局变量, 不涉及 handler, 可以在任意线程中调用"""
+    global _logger_conf, _level_no, _module_levels, _sample_threshold, _slow_request_seconds
+    _logger_conf = logger_conf
+    _level_no = logger.level(logger_conf.level.upper()).no
+    _module_levels = {name: logger.level(level.upper()).no for name, level in logger_conf.module_levels.items()}
+    _module_level_cache.clear()
+    _sample_threshold = int(min(max(logger_conf.sample_rate, 0.0), 1.0) * (1 << 32))
+    _slow_request_seconds = logger_conf.slow_request_ms / 1000
+    _refresh_min_level()
+
+
+def _control_level(level_no: int, module_levels: Dict[str, int]) -> int:
+    return min([level_no, *module_levels.values()])
+
+
+def _handler_level() -> int:
+    """全局和各模块级别中最低的, 具体过滤由 log_filter 完成"""
+    return _control_level(_level_no, _module_levels)
+
+
+def _refresh_min_level():
+    global _min_level_no
+    _min_level_no = max(_handler_level(), _static_min_level_no)
+    # 标准库日志在创建 LogRecord 之前按同样的级别过滤
+    logging.getLogger().setLevel(_min_level_no)
+
+
+def log_control() -> dict:
+    """当前进程的日志级别和采样配置"""
+    return {
+        "level": _logger_conf.level.upper(),
+        "module_levels": dict(_logger_conf.module_levels),
+        "sample_rate": _logger_conf.sample_rate,
+        "slow_request_ms": _logger_conf.slow_request_ms,
+    }
+
+
+def update_log_control(
+    level: Optional[str] = None,
+    module_levels: Optional[Dict[str, str]] = None,
+    sample_rate: Optional[float] = None,
+    slow_request_ms: Optional[float] = None,
+) -> dict:
+    """
+    运行时修改当前进程的日志级别/采样率, 只修改 log_filter 读取的级别, 不重建 handler,
+    可以在事件循环、redis 订阅线程中直接调用
+    级别名称无效或低于 handler 固定的级别(runtime_min_level)时抛出 ValueError
+    """
+    changes = {}
+    if level is not None:
+        changes["level"] = logger.level(level.upper()).name
+    if module_levels is not None:
+        changes["module_levels"] = {name: logger.level(value.upper()).name for name, value in module_levels.items()}
+    if sample_rate is not None:
+        changes["sample_rate"] = sample_rate
+    if slow_request_ms is not None:
+        changes["slow_request_ms"] = slow_request_ms
+    logger_conf = _logger_conf.model_copy(update=changes)
+    level_no = logger.level(logger_conf.level.upper()).no
+    module_levels = {name: logger.level(value.upper()).no for name, value in logger_conf.module_levels.items()}
+    if _control_level(level_no, module_levels) < _handler_floor_no:
+        floor = logger.level(logger_conf.runtime_min_level.upper()).name
+        raise ValueError(f"低于 runtime_min_level({floor}), 需修改配置后重启")
+    _apply_control(logger_conf)
+    # 使用 WARNING, 调高级别后仍能看到这条记录
+    logger.warning("log control updated: {}", changes)
+    return log_control()
+
+
+def _dev_handlers(logger_conf: LoggerConf) -> List[dict]:
+    return [
+        {
+            "sink": RichHandler(
+                console=Console(width=300),
+                markup=True,
+                log_time_format="[%Y-%m-%d %H:%M:%S.%f]",
+                show_path=False,
+                show_level=False,
+            ),
+            "format": logger_conf.format,
+            "level": _handler_floor_no,
+            "filter": log_filter,
+        }
+    ]
+
+
+class BackgroundStream:
+    """
+    loguru 的 stream sink: 请求线程把格式化好的字符串放入进程内队列, 由后台线程写入 stream
+    与 loguru 的 enqueue=True 相比不需要 pickle 整条日志记录、不经过跨进程管道
+    stream 阻塞(如 stdout 管道写满)时队列写满后丢弃日志, 不阻塞请求
+    """
+
+    def __init__(self, stream, maxsize: int = 100000):
+        self.stream = stream
+        self.dropped = 0
+        self._queue: "queue.Queue[Optional[str]]" = queue.Queue(maxsize)
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def write(self, message: str):
+        try:
+            self._queue.put_nowait(message)
+        except queue.Full:
+            self.dropped += 1
+
+    async def complete(self):
+        """await logger.complete() 时等待队列中的日志写完"""
+        await asyncio.to_thread(self._queue.join)
+
+    def stop(self):
+        """logger.remove 时调用, 写完剩余日志后结束后台线程"""
+        self._queue.put(None)
+        self._thread.join()
+        if self.dropped:
+            self.stream.write(f"{self.dropped} log messages dropped because the log queue was full\n")
+
+    def _run(self):
+        while True:
+            message = self._queue.get()
+            try:
+                if message is None:
+                    return
+                self.stream.write(message)
+                if self._queue.empty():
+                    self.stream.flush()
+            except Exception:
+                pass
+            finally:
+                self._queue.task_done()
+
+
+def _prod_handlers(logger_conf: LoggerConf) -> List[dict]:
+    """
+    prod 模式: 不使用 Rich, enqueue 时控制台日志由后台线程写入, 请求线程只做格式化和入队
+    JSON 文件写入页缓存, 由 loguru 负责按大小/时间切分;
+    多个 worker 进程不能安全地切分同一个文件, 因此 JSON 文件按进程号区分
+    """
+    handlers = []
+    if logger_conf.console:
+        handlers.append(
+            {
+                "sink": BackgroundStream(sys.stderr) if logger_conf.enqueue else sys.stderr,
+                "format": logger_conf.format,
+                "level": _handler_floor_no,
+                "filter": log_filter,
+                "colorize": False,
+            }
+        )
+    if logger_conf.json_file:
+        json_file = Path(logger_conf.json_file.replace("{pid}", str(os.getpid())))
+        json_file.parent.mkdir(parents=True, exist_ok=True)
+        handlers.append(
+            {
+                "sink": str(json_file),
+                "format": json_format,
+                "level": _handler_floor_no,
+                "filter": log_filter,
+                "rotation": logger_conf.rotation,
+                "retention": logger_conf.retention,
+                "compression": logger_conf.compression,
+            }
+        )
+    return handlers
 
 
 def configure(logger_conf: LoggerConf):
+    """启动时创建 handler, 运行时的级别调整见 update_log_control"""
+    global _static_min_level_no, _handler_floor_no
     log_level = logger_conf.level
 
     # log_format = log_format_dev if log_level.upper() == "DEBUG" else log_format_prod
     logger.remove()  # Remove default handlers
-    logger.patch(patching)
-    # Configure loguru to use RichHandler
-
+    _apply_control(logger_conf)
+    _handler_floor_no = min(logger.level(logger_conf.runtime_min_level.upper()).no, _handler_level())
+    prod = logger_conf.mode == "prod"
     logger.configure(
-        handlers=[
-            {
-                "sink": RichHandler(
-                    console=Console(width=300),
-                    markup=True,
-                    log_time_format="[%Y-%m-%d %H:%M:%S.%f]",
-                    show_path=False,
-                    show_level=False,
-                ),
-                "format": logger_conf.format,
-                "level": log_level.upper(),
-            }
-        ],
+        handlers=_prod_handlers(logger_conf) if prod else _dev_handlers(logger_conf),
         extra={"trace_id": ""},
+        patcher=patching,
     )
 
+    levels = [_handler_floor_no]
     for one in logger_conf.handlers:
         log_file = Path(one["sink"])
         log_file.parent.mkdir(parents=True, exist_ok=True)
+        one = {"filter": log_filter, **one}
         logger.add(**one)
+        levels.append(logger.level(str(one.get("level", "DEBUG")).upper()).no)
         logger.debug(f"Logger set up with log handler: {one['sink']}")
+    _static_min_level_no = min(levels)
+    _refresh_min_level()
+
+    logger.debug(f"Logger set up with log level: {log_level}, mode: {logger_conf.mode}")
+
 
-    logger.debug(f"Logger set up with log level: {log_level}")
+async def flush_logs():
+    """等待后台线程写完队列中的日志, 在进程退出前调用"""
+    await logger.complete()
 
 
 class InterceptHandler(logging.Handler):
@@ -0,0 +1,242 @@
+# -*- coding:utf-8 -*-
+# @Author: H
+# @Date: 2025-10-20
+# @Version: 1.0
+# @License: H
+# @Desc: Prometheus 指标: HTTP 路由耗时 / 进行中请求、数据库连接池与语句耗时、redis 命令耗时、对象存储调用耗时、审计日志队列
+"""
+多进程(uvicorn --workers 4 / gunicorn -w 4)部署时需要设置环境变量 PROMETHEUS_MULTIPROC_DIR
+(或 settings.metrics.multiproc_dir), 各 worker 把指标写入该目录下按 pid 区分的文件,
+/metrics 由任意一个 worker 汇总目录中所有文件后返回; 该目录须在启动前清空, 见 start.sh
+
+Gauge 使用 livesum 模式, 只汇总存活的 worker, worker 退出时在 lifespan 中调用 mark_process_dead
+"""
+import functools
+import inspect
+import os
+import time
+from typing import Iterable
+
+from app.settings import settings
+
+_multiproc_dir = os.getenv("PROMETHEUS_MULTIPROC_DIR") or settings.metrics.multiproc_dir
+if _multiproc_dir:
+    # prometheus_client 在导入时根据该环境变量决定是否使用多进程模式
+    os.makedirs(_multiproc_dir, exist_ok=True)
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = _multiproc_dir
+
+from prometheus_client import (  # noqa: E402
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from sqlalchemy import event  # noqa: E402
+from sqlalchemy.engine import Engine  # noqa: E402
+from starlette.requests import Request  # noqa: E402
+from starlette.responses import Response  # noqa: E402
+
+_BUCKETS = tuple(settings.metrics.buckets)
+# 数据库、redis 等单次调用比 HTTP 请求快一个数量级, 使用更细的桶
+_FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+HTTP_REQUESTS = Counter("http_requests_total", "HTTP 请求数", ["method", "route", "status"])
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "HTTP 请求耗时", ["method", "route"], buckets=_BUCKETS
+)
+HTTP_REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress", "进行中的 HTTP 请求数", ["method", "route"], multiprocess_mode="livesum"
+)
+
+DB_POOL_SIZE = Gauge("db_pool_size", "连接池大小", ["engine"], multiprocess_mode="livesum")
+DB_POOL_CHECKED_OUT = Gauge("db_pool_checked_out", "已借出的连接数", ["engine"], multiprocess_mode="livesum")
+DB_POOL_OVERFLOW = Gauge("db_pool_overflow", "超出 pool_size 的连接数", ["engine"], multiprocess_mode="livesum")
+DB_POOL_WAIT_SECONDS = Histogram(
+    "db_pool_wait_seconds", "从连接池获取连接的耗时", ["engine"], buckets=_FAST_BUCKETS
+)
+DB_STATEMENT_SECONDS = Histogram(
+    "db_statement_duration_seconds", "SQL 语句执行耗时", ["engine", "operation"], buckets=_FAST_BUCKETS
+)
+DB_STATEMENT_ERRORS = Counter("db_statement_errors_total", "SQL 语句执行失败数", ["engine", "operation"])
+
+REDIS_COMMAND_SECONDS = Histogram(
+    "redis_command_duration_seconds", "redis 客户端方法耗时", ["client", "command", "status"], buckets=_FAST_BUCKETS
+)
+STORAGE_OPERATION_SECONDS = Histogram(
+    "storage_operation_duration_seconds", "对象存储调用耗时", ["backend", "operation", "status"], buckets=_BUCKETS
+)
+
+AUDIT_LOG_QUEUE_DEPTH = Gauge("audit_log_queue_depth", "审计日志队列中待写入的条数", multiprocess_mode="livesum")
+AUDIT_LOG_FLUSH_SECONDS = Histogram(
+    "audit_log_flush_duration_seconds", "审计日志批量写库耗时", ["status"], buckets=_FAST_BUCKETS
+)
+AUDIT_LOG_LOST = Counter("audit_log_lost_total", "未能写库的审计日志数", ["outcome"])
+
+_SQL_OPERATIONS = {"SELECT", "INSERT", "UPDATE", "DELETE"}
+
+
+def metrics_enabled() -> bool:
+    return settings.metrics.enabled
+
+
+# HTTP
+class RouteResolver:
+    """把请求路径解析为路由模板(如 /api/img/{image_id}), 避免原始 URL 作为标签导致基数爆炸"""
+
+    UNMATCHED = "<unmatched>"
+
+    def __init__(self, maxsize: int = 2048):
+        self.maxsize = maxsize
+        self._cache = {}
+
+    def resolve(self, scope) -> str:
+        key = (scope["method"], scope["path"])
+        route = self._cache.get(key)
+        if route is not None:
+            return route
+        route = self._match(scope)
+        if len(self._cache) >= self.maxsize:
+            self._cache.clear()
+        self._cache[key] = route
+        return route
+
+    def _match(self, scope) -> str:
+        from starlette.routing import Match
+
+        app = scope.get("app")
+        router = getattr(app, "router", None)
+        partial = None
+        for route in getattr(router, "routes", []):
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route.path_format
+            if match == Match.PARTIAL and partial is None:
+                partial = route.path_format
+        return partial or self.UNMATCHED
+
+
+async def metrics_endpoint(request: Request) -> Response:
+    if _multiproc_dir:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+
+
+def mark_process_dead():
+    """worker 退出时清理 livesum Gauge 的数据文件"""
+    if _multiproc_dir:
+        multiprocess.mark_process_dead(os.getpid())
+
+
+# 数据库
+def instrument_engine(engine: Engine, name: str):
+    """
+    通过连接池和 engine 事件记录连接池状态、获取连接耗时和语句耗时
+    异步 engine 传入 async_engine.sync_engine
+    """
+    if not metrics_enabled():
+        return
+    pool = engine.pool
+    has_stats = hasattr(pool, "checkedout") and hasattr(pool, "overflow")
+
+    def update_pool_stats(returning: int = 0):
+        DB_POOL_SIZE.labels(name).set(pool.size())
+        DB_POOL_CHECKED_OUT.labels(name).set(pool.checkedout() - returning)
+        DB_POOL_OVERFLOW.labels(name).set(max(pool.overflow(), 0))
+
+    if has_stats:
+        event.listen(engine, "checkout", lambda *args: update_pool_stats())
+        # checkin 事件在连接放回池之前触发, 此时连接仍计入 checkedout
+        event.listen(engine, "checkin", lambda *args: update_pool_stats(returning=1))
+        update_pool_stats()
+
+    # 连接池没有 "开始获取连接" 事件, 包装 pool.connect 计算等待时间(含新建连接)
+    connect = pool.connect
+    wait_seconds = DB_POOL_WAIT_SECONDS.labels(name)
+
+    @functools.wraps(connect)
+    def timed_connect():
+        begin = time.perf_counter()
+        try:
+            return connect()
+        finally:
+            wait_seconds.observe(time.perf_counter() - begin)
+
+    pool.connect = timed_connect
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        begin = conn.info["metrics_query_start"].pop()
+        DB_STATEMENT_SECONDS.labels(name, _sql_operation(statement)).observe(time.perf_counter() - begin)
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(context):
+        starts = context.connection.info.get("metrics_query_start") if context.connection is not None else None
+        if starts:
+            starts.pop()
+        DB_STATEMENT_ERRORS.labels(name, _sql_operation(context.statement or "")).inc()
+
+
+def _sql_operation(statement: str) -> str:
+    operation = statement.lstrip()[:6].upper()
+    return operation if operation in _SQL_OPERATIONS else "OTHER"
+
+
+# redis / 对象存储
+def observe_methods(histogram: Histogram, methods: Iterable[str], label: str, **labels):
+    """
+    类装饰器, 记录指定方法的耗时, 同步和异步方法均支持
+    :param histogram: 标签为 (*labels, label, status) 的 Histogram
+    :param methods: 要记录的方法名
+    :param label: 方法名所在的标签
+    :param labels: 其它固定标签
+    """
+
+    def decorator(cls):
+        if not metrics_enabled():
+            return cls
+        for method in methods:
+            setattr(cls, method, _observed(getattr(cls, method), histogram, {**labels, label: method}))
+        return cls
+
+    return decorator
+
+
+def _observed(func, histogram: Histogram, labels: dict):
+    if inspect.iscoroutinefunction(func):
+
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            begin = time.perf_counter()
+            status = "error"
+            try:
+                result = await func(*args, **kwargs)
+                status = "ok"
+                return result
+            finally:
+                histogram.labels(**labels, status=status).observe(time.perf_counter() - begin)
+
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        begin = time.perf_counter()
+        status = "error"
+        try:
+            result = func(*args, **kwargs)
+            status = "ok"
+            return result
+        finally:
+            histogram.labels(**labels, status=status).observe(time.perf_counter() - begin)
+
+    return wrapper
@@ -0,0 +1,469 @@
+# -*- coding:utf-8 -*-
+# @Author: H
+# @Date: 2025-10-20
+# @Version: 1.0
+# @License: H
+# @Desc: 轻量链路追踪: W3C traceparent 透传, 请求内 db / redis / cos 子 span, 导出到 stdout / 文件 / OTLP
+"""
+CustomMiddleware 为每个请求解析或生成 traceparent, trace_id 同时作为日志的 trace_id;
+被采样的请求在 contextvar 中持有一个 Trace, 请求内的 span 记录到该 Trace, 请求结束后整体导出,
+未采样的请求及请求之外(启动、后台线程)的 span 不做任何记录
+
+    with span("img.thumbnail", "app", size=size):
+        ...
+
+数据库语句通过 engine 事件记录(instrument_engine), redis 方法通过 traced_methods 类装饰器记录,
+对象存储在 COSService._run 中记录, 阻塞调用在线程池中执行时复制当前 context
+
+导出在后台线程中批量进行, 请求线程只把完成的 Trace 放入队列, 队列满时丢弃;
+otlp 使用 OTLP/HTTP JSON 协议, 不依赖 opentelemetry SDK
+"""
+import functools
+import inspect
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterable, List, Optional
+
+import orjson
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.settings import TracingConfig, settings
+from app.utils.logger import logger
+
+# OTLP 的 SpanKind
+KIND_INTERNAL = 1
+KIND_SERVER = 2
+KIND_CLIENT = 3
+
+# Server-Timing 和耗时分解中单独统计的分类, 其余耗时记为 app
+BREAKDOWN_CATEGORIES = ("db", "redis", "cos")
+
+_TRACEPARENT_RE = re.compile(r"^([0-9a-f]{2})-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+_INVALID_TRACE_ID = "0" * 32
+_INVALID_SPAN_ID = "0" * 16
+
+_trace_ctx: ContextVar[Optional["Trace"]] = ContextVar("trace", default=None)
+_span_ctx: ContextVar[Optional["Span"]] = ContextVar("span", default=None)
+
+
+def new_span_id() -> str:
+    return f"{random.getrandbits(64) or 1:016x}"
+
+
+def parse_traceparent(value: str) -> Optional[tuple]:
+    """
+    解析 W3C traceparent, 格式错误时返回 None
+    :return: (trace_id, parent_span_id, sampled)
+    """
+    match = _TRACEPARENT_RE.match(value.strip().lower())
+    if not match:
+        return None
+    version, trace_id, parent_id, flags = match.groups()
+    if version == "ff" or trace_id == _INVALID_TRACE_ID or parent_id == _INVALID_SPAN_ID:
+        return None
+    return trace_id, parent_id, bool(int(flags, 16) & 1)
+
+
+def format_traceparent(trace_id: str, span_id: str, sampled: bool) -> str:
+    return f"00-{trace_id}-{span_id}-{'01' if sampled else '00'}"
+
+
+class Span:
+    __slots__ = (
+        "trace_id", "span_id", "parent_id", "name", "category", "kind", "start_ns", "duration_ns", "attributes", "error"
+    )
+
+    def __init__(
+        self, trace_id: str, parent_id: Optional[str], name: str, category: str, kind: int = KIND_INTERNAL, **attributes
+    ):
+        self.trace_id = trace_id
+        self.span_id = new_span_id()
+        self.parent_id = parent_id
+        self.name = name
+        self.category = category
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.duration_ns = 0
+        self.attributes = attributes
+        self.error: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        return {
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "category": self.category,
+            "start": self.start_ns / 1e9,
+            "duration_ms": round(self.duration_ns / 1e6, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class Trace:
+    """一个请求在当前进程内的所有 span, 根 span 为 HTTP 请求本身"""
+
+    def __init__(self, root: Span, sampled: bool, max_spans: int):
+        self.root = root
+        self.sampled = sampled
+        self.max_spans = max_spans
+        self.spans: List[Span] = []
+        self.dropped = 0
+        self._token = None
+
+    @property
+    def trace_id(self) -> str:
+        return self.root.trace_id
+
+    @property
+    def traceparent(self) -> str:
+        return format_traceparent(self.root.trace_id, self.root.span_id, self.sampled)
+
+    def add(self, one: Span):
+        # 线程池中的 span 也会写入, list.append 是原子的
+        if len(self.spans) < self.max_spans:
+            self.spans.append(one)
+        else:
+            self.dropped += 1
+
+    def breakdown(self) -> Dict[str, float]:
+        """
+        按分类汇总耗时(毫秒), 嵌套在同类 span 中的 span 不重复计算;
+        并发执行(asyncio.gather)的 span 各自计入, 分类之和可能超过请求总耗时
+        """
+        categories = {one.span_id: one.category for one in self.spans}
+        result = {category: 0.0 for category in BREAKDOWN_CATEGORIES}
+        for one in self.spans:
+            if one.category in result and categories.get(one.parent_id) != one.category:
+                result[one.category] += one.duration_ns / 1e6
+        total = self.root.duration_ns / 1e6
+        result["app"] = max(total - sum(result.values()), 0.0)
+        result["total"] = total
+        return {key: round(value, 3) for key, value in result.items()}
+
+    def server_timing(self) -> str:
+        """响应开始时的耗时分解, 此时根 span 尚未结束, total 取当前已耗时"""
+        elapsed_ns = time.time_ns() - self.root.start_ns
+        self.root.duration_ns = elapsed_ns
+        return ", ".join(f"{key};dur={value}" for key, value in self.breakdown().items())
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "name": self.root.name,
+            "start": self.root.start_ns / 1e9,
+            "duration_ms": round(self.root.duration_ns / 1e6, 3),
+            "breakdown": self.breakdown(),
+            "spans": [one.to_dict() for one in [self.root, *self.spans]],
+            "dropped_spans": self.dropped,
+        }
+
+
+def current_trace() -> Optional[Trace]:
+    return _trace_ctx.get()
+
+
+def current_traceparent() -> Optional[str]:
+    """当前 span 的 traceparent, 调用下游 HTTP 服务时放入请求头"""
+    trace = _trace_ctx.get()
+    if trace is None:
+        return None
+    parent = _span_ctx.get() or trace.root
+    return format_traceparent(trace.trace_id, parent.span_id, trace.sampled)
+
+
+@contextmanager
+def span(name: str, category: str = "app", kind: int = KIND_INTERNAL, **attributes):
+    """记录一个子 span, 同步和异步代码中均可使用; 当前请求未被采样时不做任何记录, yield None"""
+    trace = _trace_ctx.get()
+    if trace is None:
+        yield None
+        return
+    parent = _span_ctx.get() or trace.root
+    current = Span(trace.trace_id, parent.span_id, name, category, kind, **attributes)
+    token = _span_ctx.set(current)
+    begin = time.perf_counter_ns()
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current.duration_ns = time.perf_counter_ns() - begin
+        _span_ctx.reset(token)
+        trace.add(current)
+
+
+def record_span(
+    name: str, category: str, start_ns: int, duration_ns: int, error: Optional[str] = None, kind: int = KIND_CLIENT,
+    **attributes,
+):
+    """记录一个已经结束的 span, 用于无法包裹代码块的场景(如 engine 事件)"""
+    trace = _trace_ctx.get()
+    if trace is None:
+        return
+    parent = _span_ctx.get() or trace.root
+    one = Span(trace.trace_id, parent.span_id, name, category, kind, **attributes)
+    one.start_ns = start_ns
+    one.duration_ns = duration_ns
+    one.error = error
+    trace.add(one)
+
+
+class Tracer:
+    """请求级 trace 的创建、采样和导出"""
+
+    def __init__(self, conf: TracingConfig):
+        self.conf = conf
+        self._sample_threshold = int(min(max(conf.sample_rate, 0.0), 1.0) * (1 << 32))
+        self.exporter = create_exporter(conf)
+
+    @property
+    def enabled(self) -> bool:
+        return self.conf.enabled
+
+    def should_sample(self, trace_id: str) -> bool:
+        """与日志采样相同, 按 trace_id 前 8 位决定, 同一个 trace_id 在所有进程中结果一致"""
+        if self._sample_threshold >= 1 << 32:
+            return True
+        return int(trace_id[:8], 16) < self._sample_threshold
+
+    def start(self, trace_id: str, parent_id: Optional[str], sampled: bool, name: str, **attributes) -> Trace:
+        """开始一个请求, 采样的请求把 Trace 放入当前 context; 未采样的 Trace 只用于返回 traceparent"""
+        root = Span(trace_id, parent_id, name, "http", KIND_SERVER, **attributes)
+        trace = Trace(root, sampled, self.conf.max_spans_per_trace)
+        if sampled:
+            trace._token = _trace_ctx.set(trace)
+        return trace
+
+    def finish(self, trace: Trace, duration_ns: int, error: Optional[str] = None, **attributes):
+        trace.root.duration_ns = duration_ns
+        trace.root.error = error
+        trace.root.attributes.update(attributes)
+        if trace._token is not None:
+            _trace_ctx.reset(trace._token)
+            trace._token = None
+        if trace.sampled and self.exporter is not None:
+            self.exporter.export(trace)
+
+    def shutdown(self):
+        if self.exporter is not None:
+            self.exporter.stop()
+
+
+# 导出
+class SpanExporter:
+    """后台线程批量导出已完成的 Trace, 队列满时丢弃"""
+
+    def __init__(self, conf: TracingConfig):
+        self.conf = conf
+        self.dropped = 0
+        self._queue: "queue.Queue[Optional[Trace]]" = queue.Queue(conf.max_queue_size)
+        self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+        self._thread.start()
+
+    def export(self, trace: Trace):
+        try:
+            self._queue.put_nowait(trace)
+        except queue.Full:
+            self.dropped += 1
+
+    def stop(self):
+        """写完队列中剩余的 Trace 后结束后台线程"""
+        self._queue.put(None)
+        self._thread.join(self.conf.otlp_timeout + self.conf.flush_interval + 1)
+        if self.dropped:
+            logger.warning(f"{self.dropped} traces dropped because the trace queue was full")
+
+    def _run(self):
+        batch: List[Trace] = []
+        deadline = time.monotonic() + self.conf.flush_interval
+        stopping = False
+        while not stopping:
+            try:
+                item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                if item is None:
+                    stopping = True
+                else:
+                    batch.append(item)
+            except queue.Empty:
+                pass
+            if batch and (stopping or len(batch) >= self.conf.batch_size or time.monotonic() >= deadline):
+                try:
+                    self.write(batch)
+                except Exception as e:
+                    logger.error(f"export {len(batch)} traces failed: {e}")
+                batch = []
+            if time.monotonic() >= deadline:
+                deadline = time.monotonic() + self.conf.flush_interval
+
+    def write(self, batch: List[Trace]):
+        raise NotImplementedError
+
+
+class StreamExporter(SpanExporter):
+    """stdout / 文件导出, 每行一个 Trace 的 JSON"""
+
+    def __init__(self, conf: TracingConfig, stream=None):
+        if stream is None:
+            path = conf.file.replace("{pid}", str(os.getpid()))
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            stream = open(path, "ab")
+        self.stream = stream
+        super().__init__(conf)
+
+    def write(self, batch: List[Trace]):
+        self.stream.write(b"".join(orjson.dumps(trace.to_dict()) + b"\n" for trace in batch))
+        self.stream.flush()
+
+
+class OTLPExporter(SpanExporter):
+    """以 OTLP/HTTP JSON 发送到 collector(如 otel-collector、Jaeger、Tempo 的 4318 端口)"""
+
+    def __init__(self, conf: TracingConfig):
+        self.resource = {"attributes": _otlp_attributes({"service.name": conf.service_name, "process.pid": os.getpid()})}
+        super().__init__(conf)
+
+    def write(self, batch: List[Trace]):
+        spans = [_otlp_span(one, trace.trace_id) for trace in batch for one in [trace.root, *trace.spans]]
+        body = orjson.dumps(
+            {
+                "resourceSpans": [
+                    {"resource": self.resource, "scopeSpans": [{"scope": {"name": __name__}, "spans": spans}]}
+                ]
+            }
+        )
+        request = urllib.request.Request(
+            self.conf.otlp_endpoint,
+            data=body,
+            headers={"Content-Type": "application/json", **self.conf.otlp_headers},
+            method="POST",
+        )
+        with urllib.request.urlopen(request, timeout=self.conf.otlp_timeout) as response:
+            response.read()
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes: dict) -> List[dict]:
+    return [{"key": key, "value": _otlp_value(value)} for key, value in attributes.items()]
+
+
+def _otlp_span(one: Span, trace_id: str) -> dict:
+    data = {
+        "traceId": trace_id,
+        "spanId": one.span_id,
+        "name": one.name,
+        "kind": one.kind,
+        "startTimeUnixNano": str(one.start_ns),
+        "endTimeUnixNano": str(one.start_ns + one.duration_ns),
+        "attributes": _otlp_attributes({"category": one.category, **one.attributes}),
+        "status": {"code": 2, "message": one.error} if one.error else {"code": 1},
+    }
+    if one.parent_id:
+        data["parentSpanId"] = one.parent_id
+    return data
+
+
+def create_exporter(conf: TracingConfig) -> Optional[SpanExporter]:
+    if not conf.enabled or conf.exporter == "none":
+        return None
+    if conf.exporter == "stdout":
+        return StreamExporter(conf, sys.stdout.buffer)
+    if conf.exporter == "file":
+        return StreamExporter(conf)
+    if conf.exporter == "otlp":
+        return OTLPExporter(conf)
+    raise ValueError(f"unknown tracing exporter: {conf.exporter}")
+
+
+# 数据库 / redis
+def instrument_engine(engine: Engine, name: str):
+    """通过 engine 事件为采样请求中的每条 SQL 语句记录 span, 异步 engine 传入 async_engine.sync_engine"""
+    if not settings.tracing.enabled:
+        return
+    system = engine.dialect.name
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        # 未采样时也入栈, 保证与 after_cursor_execute / handle_error 成对
+        started = (time.time_ns(), time.perf_counter_ns()) if _trace_ctx.get() is not None else None
+        conn.info.setdefault("trace_query_start", []).append(started)
+
+    def record(conn, statement: str, error: Optional[str] = None):
+        starts = conn.info.get("trace_query_start") if conn is not None else None
+        started = starts.pop() if starts else None
+        if started is None:
+            return
+        operation = statement.lstrip()[:6].upper()
+        record_span(
+            f"db.{operation}",
+            "db",
+            started[0],
+            time.perf_counter_ns() - started[1],
+            error,
+            **{"db.system": system, "db.engine": name, "db.statement": statement[:500]},
+        )
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        record(conn, statement)
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(context):
+        record(context.connection, context.statement or "", f"{type(context.original_exception).__name__}")
+
+
+def traced_methods(methods: Iterable[str], category: str, **attributes):
+    """类装饰器, 为指定方法记录 span, span 名为 {category}.{方法名}, 同步和异步方法均支持"""
+
+    def decorator(cls):
+        if not settings.tracing.enabled:
+            return cls
+        for method in methods:
+            setattr(cls, method, _traced(getattr(cls, method), f"{category}.{method}", category, attributes))
+        return cls
+
+    return decorator
+
+
+def _traced(func, name: str, category: str, attributes: dict):
+    if inspect.iscoroutinefunction(func):
+
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            if _trace_ctx.get() is None:
+                return await func(*args, **kwargs)
+            with span(name, category, KIND_CLIENT, **attributes):
+                return await func(*args, **kwargs)
+
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if _trace_ctx.get() is None:
+            return func(*args, **kwargs)
+        with span(name, category, KIND_CLIENT, **attributes):
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+tracer = Tracer(settings.tracing)
@@ -0,0 +1,123 @@
+# -*- coding:utf-8 -*-
+# @Author: H
+# @Date: 2025-10-20
+# @Version: 1.0
+# @License: H
+# @Desc: 响应压缩对比: 100 条记录的 /api/img/list 和 /static 文件在各编码下的传输字节数与延迟
+"""
+用法(在 fastapi-api 目录下执行):
+
+    python -m bench.compression --requests 200 --output compression_result.json
+
+进程内通过 httpx.ASGITransport 调用完整应用(含中间件和 lifespan), 配置与 bench.api_load 相同(临时 SQLite, 无 redis);
+上传 --seed-images 张图片后, 分别以 identity / gzip / br / zstd 请求 page_size=100 的图片列表和 swagger 静态文件:
+    wire_bytes   响应体的传输字节数(未解压)
+    p50_ms       服务端处理 + 压缩的延迟(不含网络)
+    est_ms       p50_ms 加上在不同带宽下传输 wire_bytes 的时间, 用于估计压缩在慢速网络下的收益
+未安装 brotli / zstandard 时对应的请求返回未压缩的响应, 结果中的 encoding 为实际使用的编码
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import List
+
+import httpx
+
+from bench.api_load import BASE_DIR, Scenario, build_config, git_commit, percentile
+
+ACCEPT_ENCODINGS = ["identity", "gzip", "br", "zstd"]
+STATIC_PATHS = ["/static/swagger/swagger-ui-bundle.min.js", "/static/swagger/swagger-ui.min.css"]
+# 带宽(Mbps), 分别对应弱网移动网络 / 普通移动网络 / 宽带
+LINKS_MBPS = [1.6, 10, 100]
+
+
+async def measure(client: httpx.AsyncClient, path: str, accept_encoding: str, requests: int, headers: dict) -> dict:
+    latencies: List[float] = []
+    wire_bytes, encoding = 0, None
+    for _ in range(requests):
+        start = time.perf_counter()
+        async with client.stream("GET", path, headers={**headers, "Accept-Encoding": accept_encoding}) as resp:
+            body = b"".join([chunk async for chunk in resp.aiter_raw()])
+        latencies.append((time.perf_counter() - start) * 1000)
+        if resp.status_code != 200:
+            raise RuntimeError(f"GET {path} failed: {resp.status_code}")
+        wire_bytes, encoding = len(body), resp.headers.get("content-encoding", "identity")
+    latencies.sort()
+    p50 = percentile(latencies, 50)
+    return {
+        "path": path,
+        "accept_encoding": accept_encoding,
+        "encoding": encoding,
+        "wire_bytes": wire_bytes,
+        "p50_ms": round(p50, 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "est_ms": {f"{mbps}Mbps": round(p50 + wire_bytes * 8 / (mbps * 1000), 2) for mbps in LINKS_MBPS},
+    }
+
+
+async def run(args) -> List[dict]:
+    import app.api  # noqa: F401  先初始化 app.api, 避免 models <-> api.errcode 的循环导入
+    from main import app
+
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=30) as client:
+            scenario = Scenario()
+            await scenario.setup(client, args.seed_images)
+            targets = [(f"/api/img/list?page_num=1&page_size={args.page_size}", scenario.auth)]
+            targets += [(path, {}) for path in STATIC_PATHS]
+            results = []
+            for path, headers in targets:
+                baseline = None
+                for accept_encoding in ACCEPT_ENCODINGS:
+                    # 预热: 首次请求包含连接池创建、缓存填充等
+                    await measure(client, path, accept_encoding, 3, headers)
+                    result = await measure(client, path, accept_encoding, args.requests, headers)
+                    baseline = baseline or result["wire_bytes"]
+                    result["ratio"] = round(result["wire_bytes"] / baseline, 3)
+                    results.append(result)
+                    print(
+                        f"{path[:40]:<42}{result['encoding']:<10}{result['wire_bytes']:>10}{result['ratio']:>8}"
+                        f"{result['p50_ms']:>10}  {result['est_ms']}",
+                        file=sys.stderr,
+                    )
+            return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seed-images", type=int, default=100)
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=200, help="每种编码的请求数")
+    parser.add_argument("--output", default="", help="JSON 结果文件, 默认输出到 stdout")
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix="bench_compression_")
+    os.environ["CONFIG_FILE"] = build_config(argparse.Namespace(db="", redis="none"), tmp_dir)
+    os.environ.setdefault("ENV", "local")
+    # 静态文件目录为相对路径
+    os.chdir(BASE_DIR)
+    print(f"{'path':<42}{'encoding':<10}{'bytes':>10}{'ratio':>8}{'p50 ms':>10}  estimated", file=sys.stderr)
+    results = asyncio.run(run(args))
+
+    report = {
+        "commit": git_commit(),
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "page_size": args.page_size,
+        "requests": args.requests,
+        "results": results,
+    }
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+# -*- coding:utf-8 -*-
+# @Author: H
+# @Date: 2025-10-20
+# @Version: 1.0
+# @License: H
+# @Desc: 同步 dao 与异步 async_dao 的压测对比
+"""
+用法(在 fastapi-api 目录下执行, 使用 app/.config.yaml 中配置的数据库):
+
+    python -m bench.db_sync_vs_async --workers 4 --concurrency 64 --duration 20
+
+会以 uvicorn --workers N 启动本模块中的 app, 分别压测:
+    /sync/user/{id}   -> app.db.dao.select_one        (阻塞事件循环)
+    /async/user/{id}  -> app.db.async_dao.select_one  (不阻塞事件循环)
+可选 --slow 0.2 在每个请求中额外执行 `SELECT SLEEP(0.2)`(仅MySQL), 模拟慢查询
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+from fastapi import FastAPI
+
+import app.api  # noqa: F401  先初始化 app.api, 避免 models <-> api.errcode 的循环导入
+from app.db import async_dao, dao
+from app.db.models.user import User
+
+app = FastAPI()
+
+
+@app.get("/sync/user/{user_id}")
+async def sync_user(user_id: int, slow: float = 0):
+    if slow:
+        dao.select_sql(f"SELECT SLEEP({slow})")
+    user = dao.select_one(User, User.id == user_id)
+    return {"id": user.id if user else None}
+
+
+@app.get("/async/user/{user_id}")
+async def async_user(user_id: int, slow: float = 0):
+    if slow:
+        await async_dao.select_sql(f"SELECT SLEEP({slow})")
+    user = await async_dao.select_one(User, User.id == user_id)
+    return {"id": user.id if user else None}
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[k]
+
+
+async def drive(base_url: str, path: str, concurrency: int, duration: float) -> dict:
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + duration
+
+    async def worker(client: httpx.AsyncClient):
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                resp = await client.get(path)
+                if resp.status_code != 200:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        await asyncio.gather(*[worker(client) for _ in range(concurrency)])
+
+    return {
+        "path": path,
+        "requests": len(latencies),
+        "rps": round(len(latencies) / duration, 1),
+        "errors": errors,
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+    }
+
+
+async def wait_ready(base_url: str, timeout: float = 30):
+    deadline = time.perf_counter() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while time.perf_counter() < deadline:
+            try:
+                await client.get("/docs")
+                return
+            except httpx.HTTPError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError("server did not start in time")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--port", type=int, default=7861)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--user-id", type=int, default=1)
+    parser.add_argument("--slow", type=float, default=0, help="每个请求额外执行的 SLEEP 秒数(MySQL)")
+    args = parser.parse_args()
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    cmd = [
+        sys.executable, "-m", "uvicorn", "bench.db_sync_vs_async:app",
+        "--port", str(args.port), "--workers", str(args.workers), "--log-level", "warning",
+    ]  # fmt: skip
+    server = subprocess.Popen(cmd, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    try:
+        asyncio.run(wait_ready(base_url))
+        results = []
+        for mode in ("sync", "async"):
+            path = f"/{mode}/user/{args.user_id}?slow={args.slow}"
+            results.append(asyncio.run(drive(base_url, path, args.concurrency, args.duration)))
+        print(json.dumps({"workers": args.workers, "concurrency": args.concurrency, "results": results}, indent=2))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+# -*- coding:utf-8 -*-
+# @Author: H
+# @Date: 2025-10-20
+# @Version: 1.0
+# @License: H
+# @Desc: 日志模式对比: dev(Rich 控制台) 与 prod(后台线程写入的纯文本控制台 + JSON-lines 文件)
+"""
+用法(在 fastapi-api 目录下执行, 不需要 redis 和数据库):
+
+    python -m bench.logging_overhead --messages 20000 --requests 5000
+
+对比 dev / prod / prod 关闭 enqueue 三种配置, 每种输出:
+    throughput   连续调用 logger.info 的调用方耗时(每条微秒), 以及等到全部写完的总吞吐(条/秒)
+    disabled     级别被过滤的 logger.debug 每次调用的纳秒数
+    request      带 CustomMiddleware 的 /health 每个请求的 p50 / p99 微秒数
+控制台输出重定向到 /dev/null, JSON 文件写到临时目录;
+--console-latency-us 模拟每次写控制台的阻塞时间(终端渲染慢、stdout 管道写满等)
+"""
+import argparse
+import asyncio
+import contextlib
+import os
+import tempfile
+import time
+
+from loguru import logger
+
+from app.settings import LoggerConf
+from app.utils import logger as logger_module
+from app.utils.http_middleware import CustomMiddleware
+from bench.middleware_overhead import build_app, run
+
+
+class SlowStream:
+    """每次写入阻塞指定时间的输出"""
+
+    def __init__(self, stream, latency: float):
+        self.stream = stream
+        self.latency = latency
+
+    def write(self, message: str):
+        if self.latency:
+            time.sleep(self.latency)
+        self.stream.write(message)
+
+    def flush(self):
+        self.stream.flush()
+
+
+def measure_throughput(messages: int) -> tuple:
+    begin = time.perf_counter()
+    for i in range(messages):
+        logger.info("GET /api/img/list status={} bytes={} timecost={}", 200, 1024 + i, 3.21)
+    call_cost = time.perf_counter() - begin
+    asyncio.run(logger_module.flush_logs())
+    total_cost = time.perf_counter() - begin
+    return call_cost / messages * 1e6, messages / total_cost
+
+
+def measure_disabled(messages: int) -> float:
+    payload = {"user_id": 1, "items": list(range(10))}
+    begin = time.perf_counter()
+    for _ in range(messages):
+        logger.debug("payload={}", payload)
+    return (time.perf_counter() - begin) / messages * 1e9
+
+
+def run_modes(args, tmp_dir: str) -> list:
+    rows = []
+    for name, mode, enqueue in (("dev", "dev", True), ("prod", "prod", True), ("prod-sync", "prod", False)):
+        json_file = os.path.join(tmp_dir, f"{name}.{{pid}}.jsonl")
+        logger_module.configure(LoggerConf(level="INFO", mode=mode, enqueue=enqueue, json_file=json_file))
+        call_us, per_second = measure_throughput(args.messages)
+        disabled_ns = measure_disabled(args.messages)
+        costs = sorted(asyncio.run(run(build_app(CustomMiddleware), args.requests, 200)))
+        asyncio.run(logger_module.flush_logs())
+        rows.append((name, call_us, per_second, disabled_ns, costs[len(costs) // 2], costs[int(len(costs) * 0.99)]))
+    logger.remove()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--console-latency-us", type=float, default=0)
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix="bench_logging_")
+    with open(os.devnull, "w") as devnull:
+        console = SlowStream(devnull, args.console_latency_us / 1e6)
+        with contextlib.redirect_stdout(console), contextlib.redirect_stderr(console):
+            rows = run_modes(args, tmp_dir)
+
+    print(f"{'mode':<10}{'call us':>10}{'msg/s':>12}{'disabled ns':>14}{'req p50 us':>12}{'req p99 us':>12}")
+    for name, call_us, per_second, disabled_ns, p50, p99 in rows:
+        print(f"{name:<10}{call_us:>10.1f}{per_second:>12.0f}{disabled_ns:>14.0f}{p50:>12.1f}{p99:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+# -*- coding:utf-8 -*-
+# @Author: H
+# @Date: 2025-10-20
+# @Version: 1.0
+# @License: H
+# @Desc: 切面中间件开销对比: BaseHTTPMiddleware 版本与纯 ASGI 版本在 /health 上的 p50 / p99
+"""
+用法(在 fastapi-api 目录下执行, 不需要 redis 和数据库):
+
+    python -m bench.middleware_overhead --requests 20000 --level INFO WARNING
+
+在进程内直接调用 ASGI 应用(不经过网络和 HTTP 解析), 只包含 /health 路由和一个中间件,
+分别测量 无中间件 / 旧版 BaseHTTPMiddleware / 新版纯 ASGI 三种情况下每个请求的耗时分位数,
+日志写入丢弃输出的 sink, 保留格式化开销但不包含终端输出的耗时
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from uuid import uuid4
+
+from fastapi import FastAPI, Request
+from fastapi.responses import ORJSONResponse
+from loguru import logger
+from starlette.middleware.base import BaseHTTPMiddleware, RequestResponseEndpoint
+
+import app.api  # noqa: F401  先初始化 app.api, 避免 models <-> api.errcode 的循环导入
+from app.context import set_request_context_var
+from app.settings import LoggerConf
+from app.utils import logger as logger_module
+from app.utils.http_middleware import CustomMiddleware
+
+
+class LegacyCustomMiddleware(BaseHTTPMiddleware):
+    """改造前的 BaseHTTPMiddleware 实现, 仅用于对比"""
+
+    async def dispatch(self, request: Request, call_next: RequestResponseEndpoint):
+        trace_id = uuid4().hex
+        set_request_context_var(trace_id=trace_id)
+        with logger.contextualize(trace_id=trace_id):
+            start_time = time.time()
+            logger.info(f"{request.method} {request.url.path}")
+            response = await call_next(request)
+            process_time = round((time.time() - start_time) * 1000, 3)
+            logger.info(f"timecost={process_time}")
+            return response
+
+
+def build_app(middleware) -> FastAPI:
+    app = FastAPI(default_response_class=ORJSONResponse)
+
+    @app.get("/health")
+    async def get_health():
+        return {"status": "OKkk"}
+
+    if middleware is not None:
+        app.add_middleware(middleware)
+    return app
+
+
+SCOPE = {
+    "type": "http",
+    "asgi": {"version": "3.0"},
+    "http_version": "1.1",
+    "method": "GET",
+    "scheme": "http",
+    "path": "/health",
+    "raw_path": b"/health",
+    "root_path": "",
+    "query_string": b"",
+    "headers": [(b"host", b"bench")],
+    "client": ("127.0.0.1", 50000),
+    "server": ("bench", 80),
+}
+
+
+def make_receive():
+    """第一次返回请求体, 之后像真实服务器一样阻塞到连接断开"""
+    messages = [{"type": "http.request", "body": b"", "more_body": False}]
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        await asyncio.Event().wait()
+
+    return receive
+
+
+async def send(message):
+    pass
+
+
+async def run(asgi_app, requests: int, warmup: int) -> list:
+    for _ in range(warmup):
+        await asgi_app(dict(SCOPE), make_receive(), send)
+    costs = []
+    for _ in range(requests):
+        begin = time.perf_counter()
+        await asgi_app(dict(SCOPE), make_receive(), send)
+        costs.append((time.perf_counter() - begin) * 1e6)
+    return costs
+
+
+def setup_logger(level: str):
+    # configure 记录最低日志级别, 再把输出换成丢弃的 sink
+    logger_module.configure(LoggerConf(level=level, handlers=[]))
+    logger.remove()
+    logger.add(lambda message: None, level=level)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--warmup", type=int, default=1000)
+    parser.add_argument("--level", nargs="+", default=["INFO", "WARNING"], help="日志级别")
+    args = parser.parse_args()
+
+    cases = (("none", None), ("base_http", LegacyCustomMiddleware), ("pure_asgi", CustomMiddleware))
+    for level in args.level:
+        setup_logger(level)
+        print(f"\nlog level {level}, {args.requests} requests")
+        print(f"{'middleware':<12}{'p50 us':>10}{'p99 us':>10}{'mean us':>10}{'p50 +us':>10}{'p99 +us':>10}")
+        baseline = None
+        for name, middleware in cases:
+            costs = asyncio.run(run(build_app(middleware), args.requests, args.warmup))
+            costs.sort()
+            p50 = costs[len(costs) // 2]
+            p99 = costs[int(len(costs) * 0.99)]
+            baseline = baseline or (p50, p99)
+            print(
+                f"{name:<12}{p50:>10.1f}{p99:>10.1f}{statistics.fmean(costs):>10.1f}"
+                f"{p50 - baseline[0]:>10.1f}{p99 - baseline[1]:>10.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+# -*- coding:utf-8 -*-
+# @Author: H
+# @Date: 2025-10-20
+# @Version: 1.0
+# @License: H
+# @Desc: redis 缓存值编解码对比: 编码/解码耗时与存储字节数
+"""
+用法(在 fastapi-api 目录下执行, 不需要 redis 和数据库):
+
+    python -m bench.redis_codec --rows 1 100 1000 --repeat 200
+
+对 User / Image 的 model_dump() 结果(单条及列表)分别用每种可用的 "序列化[+压缩]" 组合编解码,
+输出每次编码、解码的平均微秒数和编码后的字节数, 未安装的可选依赖(msgpack / zstandard / lz4)会跳过
+"""
+import argparse
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import app.api  # noqa: F401  先初始化 app.api, 避免 models <-> api.errcode 的循环导入
+from app.cache.codec import COMPRESSIONS, SERIALIZERS, Codec
+from app.db.models.img import Image
+from app.db.models.user import User
+
+
+def make_user(i: int) -> dict:
+    now = datetime.now()
+    return User(
+        id=i,
+        user_name=f"user_{i}",
+        phone_number=f"138{i:08d}",
+        password=uuid.uuid4().hex * 2,
+        salt=uuid.uuid4().hex[:16],
+        role=random.choice(["admin", "user"]),
+        remark="",
+        delete=0,
+        current_token="eyJ" + uuid.uuid4().hex * 6,
+        last_login_time=now,
+        password_update_time=now,
+        create_time=now - timedelta(days=i),
+        update_time=now,
+    ).model_dump()
+
+
+def make_image(i: int) -> dict:
+    now = datetime.now()
+    key = f"images/{now:%Y%m}/{uuid.uuid4().hex}.png"
+    return Image(
+        id=i,
+        file_name=f"screenshot_{i}.png",
+        file_size=random.randint(10_000, 5_000_000),
+        file_type="image/png",
+        cos_url=f"https://example-bucket.cos.ap-guangzhou.myqcloud.com/{key}",
+        cos_key=key,
+        bucket="example-bucket",
+        md5=uuid.uuid4().hex,
+        width=random.randint(100, 4000),
+        height=random.randint(100, 4000),
+        uploader_id=random.randint(1, 100),
+        status=1,
+        remark="",
+        create_time=now - timedelta(days=i),
+        update_time=now,
+    ).model_dump()
+
+
+def available_codecs(threshold: int) -> list:
+    codecs = []
+    for serializer in SERIALIZERS:
+        for compression in COMPRESSIONS:
+            try:
+                codecs.append(Codec(serializer, compression, threshold))
+            except ValueError as e:
+                print(f"skip {serializer}+{compression}: {e}")
+    return codecs
+
+
+def measure(codec: Codec, value, repeat: int) -> tuple:
+    data = codec.encode(value)
+    begin = time.perf_counter()
+    for _ in range(repeat):
+        codec.encode(value)
+    encode_us = (time.perf_counter() - begin) / repeat * 1e6
+
+    begin = time.perf_counter()
+    for _ in range(repeat):
+        Codec.decode(data)
+    decode_us = (time.perf_counter() - begin) / repeat * 1e6
+    return encode_us, decode_us, len(data)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[1, 100, 1000], help="每个载荷包含的记录数")
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--threshold", type=int, default=1024, help="压缩阈值字节数")
+    args = parser.parse_args()
+
+    codecs = available_codecs(args.threshold)
+    for name, factory in (("User", make_user), ("Image", make_image)):
+        for rows in args.rows:
+            value = factory(0) if rows == 1 else [factory(i) for i in range(rows)]
+            repeat = max(args.repeat // max(rows // 100, 1), 5)
+            print(f"\n{name} x {rows}")
+            print(f"{'codec':<16}{'encode us':>12}{'decode us':>12}{'bytes':>10}{'ratio':>8}")
+            baseline = None
+            for codec in codecs:
+                encode_us, decode_us, size = measure(codec, value, repeat)
+                baseline = baseline or size
+                print(f"{codec.spec:<16}{encode_us:>12.1f}{decode_us:>12.1f}{size:>10}{size / baseline:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+# -*- coding:utf-8 -*-
+# @Author: H
+# @Date: 2025-10-20
+# @Version: 1.0
+# @License: H
+# @Desc: 响应序列化对比: FastAPI 按 response_model 校验后序列化 vs @trusted_response 的预编译序列化
+"""
+用法(在 fastapi-api 目录下执行, 不需要 redis 和数据库):
+
+    python -m bench.serialization --rows 1 10 100 --repeat 500
+
+对 --rows 条 Image 记录组成的分页响应 UnifiedResponseModel[PaginatedData[ImageRead]] 测量:
+    serialize  只测序列化: FastAPI 的 serialize_response + ORJSONResponse 编码 vs compile_serializer + orjson
+    asgi       完整请求: 同一个接口分别以普通路由和 @trusted_response 路由注册, 直接调用 ASGI 应用(不经过网络和客户端)
+输出每次的平均微秒数和加速比, 并检查两种方式的响应体是否一致
+"""
+import argparse
+import asyncio
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import app.api  # noqa: F401  先初始化 app.api, 避免 models <-> api.errcode 的循环导入
+from fastapi import APIRouter, FastAPI
+from fastapi.responses import ORJSONResponse
+from fastapi.routing import APIRoute, serialize_response
+
+from app.api.fast_response import FastResponseRoute, compile_serializer, dumps, trusted_response
+from app.api.resp import PaginatedData, UnifiedResponseModel, paginated_response
+from app.db.models.img import Image, ImageRead
+
+RESPONSE_MODEL = UnifiedResponseModel[PaginatedData[ImageRead]]
+
+
+def make_image(i: int) -> Image:
+    now = datetime.now()
+    key = f"images/{now:%Y%m}/{uuid.uuid4().hex}.png"
+    return Image(
+        id=i,
+        file_name=f"screenshot_{i}.png",
+        file_size=random.randint(10_000, 5_000_000),
+        file_type="image/png",
+        cos_url=f"https://example-bucket.cos.ap-guangzhou.myqcloud.com/{key}",
+        cos_key=key,
+        bucket="example-bucket",
+        md5=uuid.uuid4().hex,
+        width=random.randint(100, 4000),
+        height=random.randint(100, 4000),
+        uploader_id=random.randint(1, 100),
+        status=1,
+        remark="",
+        create_time=now - timedelta(days=i),
+        update_time=now,
+    )
+
+
+def build_app(content) -> FastAPI:
+    """同一个接口分别注册为普通路由(/standard)和 @trusted_response 路由(/trusted)"""
+
+    async def standard_endpoint():
+        return content
+
+    @trusted_response
+    async def trusted_endpoint():
+        return content
+
+    app = FastAPI(default_response_class=ORJSONResponse)
+    standard = APIRouter()
+    standard.add_api_route("/standard", standard_endpoint, response_model=RESPONSE_MODEL)
+    trusted = APIRouter(route_class=FastResponseRoute)
+    trusted.add_api_route("/trusted", trusted_endpoint, response_model=RESPONSE_MODEL)
+    app.include_router(standard)
+    app.include_router(trusted)
+    return app
+
+
+async def call(app: FastAPI, path: str) -> bytes:
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [],
+        "client": ("127.0.0.1", 0),
+        "server": ("bench", 80),
+    }
+    body = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.body":
+            body.append(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return b"".join(body)
+
+
+async def timeit(func, repeat: int) -> float:
+    for _ in range(min(repeat, 20)):
+        await func()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        await func()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+async def run(rows: int, repeat: int):
+    content = paginated_response([make_image(i) for i in range(rows)], page_num=1, page_size=rows, total_size=rows)
+    field = APIRoute("/", lambda: None, response_model=RESPONSE_MODEL).response_field
+    serializer = compile_serializer(RESPONSE_MODEL)
+
+    async def standard_serialize():
+        return ORJSONResponse(await serialize_response(field=field, response_content=content)).body
+
+    async def fast_serialize():
+        return dumps(serializer(content))
+
+    app = build_app(content)
+    if await standard_serialize() != await fast_serialize():
+        print(f"rows={rows}: serialize output differs")
+    if await call(app, "/standard") != await call(app, "/trusted"):
+        print(f"rows={rows}: asgi response body differs")
+
+    for name, standard, fast in (
+        ("serialize", standard_serialize, fast_serialize),
+        ("asgi", lambda: call(app, "/standard"), lambda: call(app, "/trusted")),
+    ):
+        standard_us = await timeit(standard, repeat)
+        fast_us = await timeit(fast, repeat)
+        print(f"{rows:>6}{name:>12}{standard_us:>14.1f}{fast_us:>14.1f}{standard_us / fast_us:>10.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--repeat", type=int, default=500)
+    args = parser.parse_args()
+
+    print(f"{'rows':>6}{'case':>12}{'standard us':>14}{'trusted us':>14}{'speedup':>10}")
+    for rows in args.rows:
+        asyncio.run(run(rows, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
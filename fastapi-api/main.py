@@ -4,6 +4,7 @@
 # @Version: 1.0
 # @License: H
 # @Desc:
+import asyncio
 import traceback
 from contextlib import asynccontextmanager
 
@@ -11,7 +12,6 @@ from fastapi import FastAPI, HTTPException, Request, applications, status
 from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse, ORJSONResponse
-from fastapi.staticfiles import StaticFiles
 from fastapi_jwt_auth import AuthJWT
 from fastapi_jwt_auth.exceptions import AuthJWTException
 from starlette.exceptions import HTTPException as StarletteHTTPException
@@ -19,10 +19,25 @@ from starlette.exceptions import HTTPException as StarletteHTTPException
 from app.api import router
 from app.api.errcode.base import BaseErrorCode
 from app.api.resp import error_response
+from app.api.services.audit_sink import audit_log_sink
+from app.api.services.cos_service import cos_service
+from app.api.services.render_service import render_service
+from app.api.services.log_control import install_signal_handler
+from app.cache.pubsub import redis_subscriber
+from app.cache.redis import close_redis, init_redis
+from app.db.base import db_service
 from app.db.init_db import init_default_data
 from app.settings import settings
-from app.utils.http_middleware import CustomMiddleware
-from app.utils.logger import configure, logger
+from app.utils.compression import PrecompressedStaticFiles, precompress_static
+from app.utils.http_middleware import (
+    CompressionMiddleware,
+    CustomMiddleware,
+    MetricsMiddleware,
+    RateLimitMiddleware,
+)
+from app.utils.logger import configure, flush_logs, logger
+from app.utils.metrics import mark_process_dead, metrics_endpoint
+from app.utils.tracing import tracer
 
 
 async def handle_404_exception(req: Request, exc: StarletteHTTPException) -> ORJSONResponse:
@@ -79,8 +94,25 @@ _EXCEPTION_HANDLERS = {
 async def lifespan(app: FastAPI):
     # initialize_services()
     init_default_data()
+    await init_redis()
+    if redis_subscriber:
+        redis_subscriber.start()
+    audit_log_sink.start()
+    install_signal_handler()
+    if settings.compression.enabled and settings.compression.static_precompress:
+        await asyncio.to_thread(precompress_static, "static")
     yield
     # teardown_services()
+    audit_log_sink.stop()
+    if redis_subscriber:
+        redis_subscriber.stop()
+    await close_redis()
+    cos_service.shutdown()
+    render_service.shutdown()
+    await db_service.dispose()
+    mark_process_dead()
+    tracer.shutdown()
+    await flush_logs()
 
 
 def create_app():
@@ -91,7 +123,7 @@ def create_app():
         exception_handlers=_EXCEPTION_HANDLERS,
         lifespan=lifespan,
     )
-    app.mount("/static", StaticFiles(directory="static"), name="static")
+    app.mount("/static", PrecompressedStaticFiles(directory="static"), name="static")
 
     origins = [
         "*",
@@ -101,6 +133,9 @@ def create_app():
     async def get_health():
         return {"status": "OKkk"}
 
+    # 限流在 CORS 内层, 429 响应也带有跨域头
+    app.add_middleware(RateLimitMiddleware)
+
     app.add_middleware(
         CORSMiddleware,
         allow_origins=origins,
@@ -109,6 +144,15 @@ def create_app():
         allow_headers=["*"],
     )
 
+    # 指标在限流和 CORS 外层, 被限流的请求也会计入
+    if settings.metrics.enabled:
+        app.add_route(settings.metrics.path, metrics_endpoint, include_in_schema=False)
+        app.add_middleware(MetricsMiddleware, exclude_paths=(settings.metrics.path,))
+
+    # 压缩在日志/追踪内层, 日志中的 bytes 为实际发送的字节数
+    if settings.compression.enabled:
+        app.add_middleware(CompressionMiddleware)
+
     app.add_middleware(CustomMiddleware)
 
     @AuthJWT.load_config
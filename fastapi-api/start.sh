@@ -1,4 +1,8 @@
+# 多进程部署时 Prometheus 指标写入该目录, 启动前清空上次运行留下的文件
+export PROMETHEUS_MULTIPROC_DIR=${PROMETHEUS_MULTIPROC_DIR:-/tmp/prometheus_multiproc}
+rm -rf "$PROMETHEUS_MULTIPROC_DIR" && mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+
 /root/miniconda3/bin/uvicorn main:app --host 0.0.0.0 --port 7860 --workers 4
 
 # 生产启动方式 gunicorn+uvicorn 
-gunicorn -w 4 -k uvicorn.workers.UvicornWorker app:app --bind 0.0.0.0:7860
\ No newline at end of file
+gunicorn -w 4 -k uvicorn.workers.UvicornWorker app:app --bind 0.0.0.0:7860